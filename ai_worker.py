@@ -0,0 +1,155 @@
+import random
+import threading
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from board import Board
+from cell import Cell
+from position import Position
+
+
+class AIWorker:
+    '''在后台线程里替电脑思考，界面的主循环只需要每帧来取一次结果
+
+    思考用的是请求时局面的一份紧凑副本，和界面上的Board没有共享的数据。
+    结果只在主循环调用poll的时候交出去，并且局面在这期间变了的话就作废，
+    所以电脑的棋步总是在固定的时机、针对正确的局面生效。
+    '''
+    def __init__(self, engine_factory: Callable[[], Any]) -> None:
+        # 创建引擎的函数，引擎要有search(position)方法，比如Searcher或者ISMCTS；有stop()方法的话可以中途取消
+        # 引擎在第一次思考的时候才在后台线程里创建，导入搜索模块和分配置换表都不会拖慢启动
+        self._engine_factory = engine_factory
+        self.engine = None
+        # 只有一个线程，同一时间最多只有一次思考在进行
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ai')
+        self._future: Optional[Future] = None
+        # 发出请求时局面的打包值，用来判断结果是否过期
+        self._key: Optional[int] = None
+        # 对手思考时的后台搜索，见ponder()
+        self._ponder_future: Optional[Future] = None
+        self._ponder_key: Optional[int] = None
+        # 保护思考和后台搜索的开始和停止，避免stop()发生在清除引擎的停止标记之前而丢失
+        self._lock = threading.Lock()
+        # 每次请求和取消都加一，后台线程开始思考的时候编号变了就说明这次思考已经作废
+        self._request = 0
+        self._ponder_stopped = True
+
+    @property
+    def busy(self) -> bool:
+        '''是否有还没交出去的思考'''
+        return self._future is not None
+
+    def request_move(self, board: Board,
+                     callback: Optional[Callable[[Future], None]] = None) -> Future:
+        '''开始在后台为当前局面思考，返回Future
+
+        callback会在思考结束时在后台线程里被调用，只适合用来唤醒主循环之类的轻量操作。
+        '''
+        self.cancel()
+        position = board.to_position()
+        self._key = position.pack()
+        with self._lock:
+            self._request += 1
+            request = self._request
+        self._future = self._executor.submit(self._search, position, request)
+        if callback is not None:
+            self._future.add_done_callback(callback)
+        return self._future
+
+    def _get_engine(self):
+        '''在后台线程里调用，第一次用的时候创建引擎'''
+        if self.engine is None:
+            self.engine = self._engine_factory()
+        return self.engine
+
+    def _search(self, position: Position, request: int) -> Optional[Tuple[int, ...]]:
+        '''在后台线程里执行的思考'''
+        engine = self._get_engine()
+        with self._lock:
+            # 开始之前已经被cancel()了，不用再想
+            if request != self._request:
+                return None
+            resume = getattr(engine, 'resume', None)
+            if resume is not None:
+                resume()
+        return engine.search(position)
+
+    def ponder(self, board: Board) -> None:
+        '''轮到对手的时候调用，在后台搜索对手可能的走法之后的局面，下次request_move的时候猜中了就几乎不用再想
+
+        可以每帧都调用，局面没变就什么都不做；引擎没有ponder方法也什么都不做。
+        '''
+        position = board.to_position()
+        key = position.pack()
+        if key == self._ponder_key or self._future is not None:
+            return
+        self.stop_pondering()
+        self._ponder_key = key
+        with self._lock:
+            self._ponder_stopped = False
+        self._ponder_future = self._executor.submit(self._ponder, position)
+
+    def _ponder(self, position: Position) -> None:
+        '''在后台线程里执行的后台搜索'''
+        engine = self._get_engine()
+        if not hasattr(engine, 'ponder'):
+            return
+        with self._lock:
+            if self._ponder_stopped:
+                return
+            engine.resume()
+        engine.ponder(position)
+
+    def stop_pondering(self) -> None:
+        '''停下后台搜索，搜到的结果留在引擎里'''
+        if self._ponder_future is None:
+            return
+        with self._lock:
+            self._ponder_stopped = True
+            if not self._ponder_future.cancel():
+                stop = getattr(self.engine, 'stop', None)
+                if stop is not None:
+                    stop()
+        self._ponder_future = None
+        self._ponder_key = None
+
+    def poll(self, board: Board) -> Optional[Tuple[Cell,...]]:
+        '''思考完了就返回电脑的棋步；还在思考、被取消了或者局面已经变了都返回None
+
+        引擎出错的时候把错误打印出来，这一步随便走，界面不会因为引擎的问题崩溃。
+        '''
+        future = self._future
+        if future is None or not future.done():
+            return None
+        self._future = None
+        if future.cancelled():
+            return None
+        if Position.from_board(board).pack() != self._key:
+            return None
+        try:
+            move = future.result()
+        except Exception as error:
+            traceback.print_exception(error)
+            valid_moves = board.get_valid_moves()
+            return random.choice(valid_moves) if valid_moves else None
+        if move is None:
+            return None
+        return tuple(board.get_cell_by_index(index) for index in move)
+
+    def cancel(self) -> None:
+        '''放弃正在进行的思考和后台搜索'''
+        self.stop_pondering()
+        if self._future is not None:
+            with self._lock:
+                self._request += 1
+                if not self._future.cancel():
+                    stop = getattr(self.engine, 'stop', None)
+                    if stop is not None:
+                        stop()
+            self._future = None
+
+    def shutdown(self) -> None:
+        '''取消思考并等后台线程退出，关闭窗口的时候调用'''
+        self.cancel()
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,223 @@
+'''让两种电脑策略在后台互相对战很多局，统计胜负
+
+用法：python arena.py search best -n 200 -j 8
+'''
+import argparse
+import math
+import multiprocessing
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from board import Board
+from cell import Cell
+from search import Searcher
+from ismcts import ISMCTS
+from strategies import get_random_move, get_eat_move, get_best_move, get_best_move2
+from records import GameRecord, GameWriter, DRAW
+import settings
+
+
+# 每个进程自己的搜索器，在进程池初始化的时候创建
+_searcher: Optional[Searcher] = None
+_ismcts: Optional[ISMCTS] = None
+
+def _search_move(valid_moves, board) -> Tuple[Cell,...]:
+    '''用本进程的搜索器选棋步'''
+    global _searcher
+    if _searcher is None:
+        _searcher = Searcher()
+    move = _searcher.search(board.to_position())
+    if move is None:
+        return random.choice(valid_moves)
+    return tuple(board.get_cell_by_index(index) for index in move)
+
+def _ismcts_move(valid_moves, board) -> Tuple[Cell,...]:
+    '''用本进程的蒙特卡洛树搜索选棋步'''
+    global _ismcts
+    if _ismcts is None:
+        _ismcts = ISMCTS(workers=1)
+    move = _ismcts.search(board.to_position())
+    if move is None:
+        return random.choice(valid_moves)
+    return tuple(board.get_cell_by_index(index) for index in move)
+
+def _network_move(valid_moves, board) -> Tuple[Cell,...]:
+    '''best策略，但是走完之后的局面用估值网络打分，方便和手写的估值对战'''
+    evaluator = settings.EVALUATOR
+    settings.EVALUATOR = 'network'
+    try:
+        return get_best_move(valid_moves, board)
+    finally:
+        settings.EVALUATOR = evaluator
+
+# 所有可以参加对战的策略，参数统一成(valid_moves, board)
+STRATEGIES: Dict[str, Callable] = {
+    'random': lambda valid_moves, board: get_random_move(valid_moves),
+    'eat': lambda valid_moves, board: get_eat_move(valid_moves),
+    'best': get_best_move,
+    'best2': get_best_move2,
+    'search': _search_move,
+    'ismcts': _ismcts_move,
+    'net': _network_move,
+}
+
+
+def play_headless_game(red: str, blue: str, seed: int) -> Tuple[int, int, int]:
+    '''不用界面下一局棋，返回(红方剩下的棋子数, 蓝方剩下的棋子数, 一共走了多少步)
+
+    开局的洗牌、谁先走以及策略里的随机选择都由seed决定，同一个seed总是下出同一盘棋
+    （搜索策略用时间预算的时候除外）。平局规则和main.play_game一样。
+    '''
+    record = play_recorded_game(red, blue, seed)
+    if record.result == DRAW:
+        return 0, 0, record.plies
+    return record.red_num, record.blue_num, record.plies
+
+def play_recorded_game(red: str, blue: str, seed: int) -> GameRecord:
+    '''和play_headless_game一样下一局棋，返回这局的棋谱'''
+    random.seed(seed)
+    board = Board()
+    board.record = GameRecord.from_board(board, red, blue)
+    strategies = {'red': STRATEGIES[red], 'blue': STRATEGIES[blue]}
+    while True:
+        if board.not_eat >= settings.MAX_NOT_EAT:
+            board.record.finish(*board.get_result(), draw=True)
+            return board.record
+        if board.game_over():
+            board.record.finish(*board.get_result())
+            return board.record
+        valid_moves = board.get_valid_moves()
+        # 走投无路的情况界面里会卡住，这里按平局处理
+        if not valid_moves:
+            board.record.finish(*board.get_result(), draw=True)
+            return board.record
+        move = strategies[board.turn](valid_moves, board)
+        board.make_computer_move(move)
+
+
+def _init_worker(time_limit: Optional[float], node_limit: Optional[int], max_depth: int,
+                 simulations: Optional[int]) -> None:
+    '''进程池里每个进程启动时调用，创建本进程的搜索器'''
+    global _searcher, _ismcts
+    _searcher = Searcher(time_limit=time_limit, node_limit=node_limit, max_depth=max_depth)
+    # 对战本身已经是多进程了，蒙特卡洛树搜索只用当前进程
+    _ismcts = ISMCTS(simulations=simulations, time_limit=None if simulations else time_limit, workers=1)
+
+def _play_task(task: Tuple[int, str, str, int]) -> Tuple[int, str, str, int, int, int, int, bytes]:
+    '''进程池里执行的一局棋，棋谱编码成bytes返回，由主进程写进文件'''
+    global _ismcts
+    index, red, blue, seed = task
+    # 清空置换表，保证同一个种子的对局不受这个进程之前下过的棋影响
+    if _searcher is not None:
+        _searcher.table.clear()
+    # 蒙特卡洛树搜索的随机数也按对局重新设置
+    if _ismcts is not None:
+        _ismcts = ISMCTS(_ismcts.simulations, _ismcts.time_limit, workers=1, seed=seed)
+    record = play_recorded_game(red, blue, seed)
+    red_num, blue_num = (0, 0) if record.result == DRAW else (record.red_num, record.blue_num)
+    return index, red, blue, seed, red_num, blue_num, record.plies, record.to_bytes()
+
+
+def summarize(wins: int, draws: int, losses: int) -> Dict[str, float]:
+    '''计算得分率、95%置信区间和等级分差'''
+    games = wins + draws + losses
+    if not games:
+        return {'score': 0.0, 'low': 0.0, 'high': 0.0, 'elo': 0.0, 'elo_low': 0.0, 'elo_high': 0.0}
+    score = (wins + draws / 2) / games
+    # 每局的得分是1、0.5或者0，用样本方差估计标准误差
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    low = max(score - margin, 0.0)
+    high = min(score + margin, 1.0)
+    return {'score': score, 'low': low, 'high': high,
+            'elo': elo_difference(score), 'elo_low': elo_difference(low), 'elo_high': elo_difference(high)}
+
+def elo_difference(score: float) -> float:
+    '''根据得分率估计等级分差，得分率是0或者1的时候截断到正负800'''
+    if score <= 0:
+        return -800.0
+    if score >= 1:
+        return 800.0
+    return max(-800.0, min(800.0, -400 * math.log10(1 / score - 1)))
+
+
+def run_arena(first: str, second: str, games: int, jobs: int, seed: int,
+              time_limit: Optional[float], node_limit: Optional[int], max_depth: int,
+              simulations: Optional[int], report_every: int, verbose: bool, out=sys.stdout,
+              record_path: Optional[str] = None) -> Tuple[int, int, int]:
+    '''first和second对战games局，返回first的(胜, 平, 负)
+
+    第2k局和第2k+1局用同一个开局，两个策略交换颜色，减少开局运气的影响。
+    指定了record_path就把每一局的棋谱追加到这个文件里。
+    '''
+    tasks = []
+    for index in range(games):
+        game_seed = seed + index // 2
+        if index % 2 == 0:
+            tasks.append((index, first, second, game_seed))
+        else:
+            tasks.append((index, second, first, game_seed))
+    wins = draws = losses = 0
+    start_time = time.perf_counter()
+    writer = GameWriter(record_path) if record_path else None
+    with multiprocessing.Pool(jobs, initializer=_init_worker,
+                              initargs=(time_limit, node_limit, max_depth, simulations)) as pool:
+        for done, result in enumerate(pool.imap_unordered(_play_task, tasks), 1):
+            index, red, blue, game_seed, red_num, blue_num, plies, record = result
+            if writer is not None:
+                writer.write_bytes(record)
+            first_num, second_num = (red_num, blue_num) if red == first else (blue_num, red_num)
+            if first_num > second_num:
+                wins += 1
+            elif first_num < second_num:
+                losses += 1
+            else:
+                draws += 1
+            if verbose:
+                print(f'game {index} seed {game_seed} red={red} blue={blue} '
+                      f'result={red_num}:{blue_num} plies={plies}', file=out, flush=True)
+            if report_every and done % report_every == 0 and done < games:
+                elapsed = time.perf_counter() - start_time
+                print(f'[{done}/{games}] +{wins} ={draws} -{losses} '
+                      f'{done / elapsed:.1f} games/s', file=out, flush=True)
+    if writer is not None:
+        writer.close()
+    elapsed = time.perf_counter() - start_time
+    stats = summarize(wins, draws, losses)
+    print(f'{first} vs {second}: {games} games, +{wins} ={draws} -{losses}', file=out)
+    print(f'score {stats["score"]:.3f} (95% CI {stats["low"]:.3f} - {stats["high"]:.3f})', file=out)
+    print(f'elo {stats["elo"]:+.0f} (95% CI {stats["elo_low"]:+.0f} - {stats["elo_high"]:+.0f})', file=out)
+    print(f'{games / elapsed:.1f} games/s with {jobs} processes', file=out)
+    return wins, draws, losses
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='让两种电脑策略互相对战，统计胜负')
+    parser.add_argument('first', choices=sorted(STRATEGIES), help='第一个策略')
+    parser.add_argument('second', choices=sorted(STRATEGIES), help='第二个策略')
+    parser.add_argument('-n', '--games', type=int, default=100, help='对局数')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='进程数')
+    parser.add_argument('--seed', type=int, default=0, help='第一局的随机种子')
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help='search和ismcts策略每步的思考时间（毫秒），默认不限制')
+    parser.add_argument('--node-limit', type=int, default=2000,
+                        help='search策略每步最多搜索的节点数，用节点数限制时对局可以复现')
+    parser.add_argument('--max-depth', type=int, default=settings.SEARCH_MAX_DEPTH,
+                        help='search策略的最大搜索深度')
+    parser.add_argument('--simulations', type=int, default=500,
+                        help='ismcts策略每步的模拟次数，设成0就改用--time-limit')
+    parser.add_argument('--report-every', type=int, default=50, help='每下完多少局输出一次进度')
+    parser.add_argument('-v', '--verbose', action='store_true', help='输出每一局的结果')
+    parser.add_argument('--record', default=None, help='把棋谱追加到这个文件里，用python records.py统计')
+    args = parser.parse_args(argv)
+    if not args.simulations and args.time_limit is None:
+        parser.error('--simulations 0 needs a --time-limit, otherwise ismcts has no budget')
+    run_arena(args.first, args.second, args.games, args.jobs, args.seed,
+              args.time_limit, args.node_limit, args.max_depth,
+              args.simulations or None, args.report_every, args.verbose, record_path=args.record)
+
+
+if __name__ == '__main__':
+    main()
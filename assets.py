@@ -0,0 +1,127 @@
+'''加载界面用到的图片
+
+棋子图片原图是1200x1200的JPEG，每次启动都解码再缩放很慢。
+第一次启动时把缩放好的图片拼成一张图集，连同原图的修改时间和大小一起存在settings.CACHE_DIR里，
+以后启动直接读这一个文件；原图或者格子大小变了就重新生成。
+
+用法：python assets.py          生成图集
+      python assets.py --benchmark 比较从原图加载和从图集加载的时间
+'''
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import pygame
+
+import settings
+
+# 图集文件格式的版本，格式变了就加一，旧的图集会被重新生成
+ATLAS_VERSION = 1
+# 图集文件：第一行是JSON格式的说明，后面是所有图片从左到右拼起来的RGB数据
+ATLAS_PATH = os.path.join(settings.CACHE_DIR, 'atlas.bin')
+
+# 图片名字 -> 原图的文件名
+SOURCES: Dict[str, str] = {'back': '问号.jpg'}
+for _color in ('red','blue'):
+    for _animal in settings.ANIMALS:
+        SOURCES[f'{_color}_{_animal}'] = f'{_color}_{_animal}.jpg'
+
+
+def get_source_stamps() -> Dict[str, List[int]]:
+    '''每张原图的修改时间和大小，用来判断图集是否过期'''
+    stamps = {}
+    for name, filename in SOURCES.items():
+        stat = os.stat(os.path.join(settings.IMAGE_DIR, filename))
+        stamps[name] = [stat.st_mtime_ns, stat.st_size]
+    return stamps
+
+def load_images_from_files() -> Dict[str, pygame.Surface]:
+    '''从原图解码并缩放到格子大小'''
+    images = {}
+    for name, filename in SOURCES.items():
+        original_image = pygame.image.load(os.path.join(settings.IMAGE_DIR, filename))
+        images[name] = pygame.transform.scale(original_image,(settings.CELL_SIZE,settings.CELL_SIZE))
+    return images
+
+def build_atlas(images: Optional[Dict[str, pygame.Surface]] = None) -> Dict[str, pygame.Surface]:
+    '''生成图集并写到磁盘上，返回缩放好的图片'''
+    stamps = get_source_stamps()
+    if images is None:
+        images = load_images_from_files()
+    names = list(SOURCES)
+    size = settings.CELL_SIZE
+    atlas = pygame.Surface((size * len(names), size))
+    for i, name in enumerate(names):
+        atlas.blit(images[name], (i * size, 0))
+    header = {'version': ATLAS_VERSION, 'cell_size': size, 'names': names, 'sources': stamps}
+    os.makedirs(settings.CACHE_DIR, exist_ok=True)
+    # 先写临时文件再改名，两个进程同时启动也不会读到写了一半的图集
+    temp_path = f'{ATLAS_PATH}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(json.dumps(header).encode() + b'\n')
+        f.write(pygame.image.tobytes(atlas, 'RGB'))
+    os.replace(temp_path, ATLAS_PATH)
+    return images
+
+def read_atlas() -> Optional[Dict[str, pygame.Surface]]:
+    '''读取图集，没有图集或者图集过期了就返回None'''
+    try:
+        with open(ATLAS_PATH, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    end = data.find(b'\n')
+    try:
+        header = json.loads(data[:end])
+    except ValueError:
+        return None
+    if (header.get('version') != ATLAS_VERSION
+            or header.get('cell_size') != settings.CELL_SIZE
+            or header.get('names') != list(SOURCES)
+            or header.get('sources') != get_source_stamps()):
+        return None
+    size = settings.CELL_SIZE
+    width = size * len(SOURCES)
+    pixels = data[end+1:]
+    if len(pixels) != width * size * 3:
+        return None
+    atlas = pygame.image.frombuffer(pixels, (width, size), 'RGB')
+    return {name: atlas.subsurface((i * size, 0, size, size)) for i, name in enumerate(header['names'])}
+
+def load_images() -> Dict[str, pygame.Surface]:
+    '''加载缩放好的图片，优先读图集，图集不能用就从原图生成'''
+    images = read_atlas()
+    if images is not None:
+        return images
+    images = load_images_from_files()
+    try:
+        build_atlas(images)
+    except OSError:
+        # 目录不能写的时候就每次从原图加载
+        pass
+    return images
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='生成缩放好的图集')
+    parser.add_argument('--benchmark', action='store_true', help='比较从原图加载和从图集加载的时间')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='测试时重复的次数')
+    args = parser.parse_args()
+    pygame.init()
+    start = time.perf_counter()
+    build_atlas()
+    print(f'atlas written to {ATLAS_PATH} in {(time.perf_counter() - start) * 1000:.1f} ms')
+    if args.benchmark:
+        for label, load in (('files', load_images_from_files), ('atlas', read_atlas)):
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                load()
+                times.append((time.perf_counter() - start) * 1000)
+            print(f'{label}: best {min(times):.1f} ms, mean {sum(times) / len(times):.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
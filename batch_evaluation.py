@@ -0,0 +1,163 @@
+from typing import Iterable, List, Tuple, Union
+
+import numpy as np
+
+from position import Position, HIDDEN_BIT, BLUE_BIT, ANIMAL_MASK, score_of
+from tables import SQUARES, ORTHOGONALS, DIAGONALS, IS_ENEMY, IS_FOOD
+import settings
+
+# 用NumPy一次给一批局面打分，结果和strategies.get_board_score完全一致
+# 局面用形状为(N, SQUARES)的uint8数组表示，每个元素就是Position里格子的编码
+
+CODES = 128
+
+# 每种编码对应的属性
+_codes = np.arange(CODES)
+# 翻开了并且有棋子
+VISIBLE = np.array([bool(code) and not code & HIDDEN_BIT for code in range(CODES)])
+# 属于哪一方
+SIDE = (_codes & BLUE_BIT) >> 3
+# 是哪种动物
+ANIMAL = _codes & ANIMAL_MASK
+# 棋子当前的分数，没有翻开或者空格子是0
+SCORE = np.array([score_of(code) if VISIBLE[code] else 0.0 for code in range(CODES)])
+
+
+def _build_orthogonal_terms() -> np.ndarray:
+    '''ORTHOGONAL_TERMS[自己][邻居]：上下左右的邻居给自己带来的环境分'''
+    terms = np.zeros((CODES, CODES))
+    for code in range(CODES):
+        if not VISIBLE[code]:
+            continue
+        animal = code & ANIMAL_MASK
+        for neighbor in range(CODES):
+            if not VISIBLE[neighbor] or SIDE[neighbor] == SIDE[code]:
+                continue
+            neighbor_animal = neighbor & ANIMAL_MASK
+            # 和天敌相邻，减去自身价值的ENEMY_ADJACENT_WEIGHT倍（默认1.5倍）
+            if IS_ENEMY[animal][neighbor_animal]:
+                terms[code, neighbor] = -settings.ENEMY_ADJACENT_WEIGHT*SCORE[code]
+            # 和食物相邻，加上食物价值的FOOD_ADJACENT_WEIGHT倍（默认一半）
+            elif IS_FOOD[animal][neighbor_animal]:
+                terms[code, neighbor] = settings.FOOD_ADJACENT_WEIGHT*SCORE[neighbor]
+            # 和一样的动物相邻，减去自身价值的SAME_ADJACENT_WEIGHT倍（默认一半）
+            elif neighbor_animal == animal:
+                terms[code, neighbor] = -settings.SAME_ADJACENT_WEIGHT*SCORE[code]
+    return terms
+
+# 对角线上的动物是谁要经过中间的格子：1表示对角线上的天敌要过来，2表示自己要过去
+DIAGONAL_ENEMY = 1
+DIAGONAL_SELF = 2
+
+def _build_diagonal_terms() -> Tuple[np.ndarray, np.ndarray]:
+    '''DIAGONAL_TERMS[自己][对角线邻居]是能到达时的环境分，DIAGONAL_KINDS是谁要经过中间的格子'''
+    terms = np.zeros((CODES, CODES))
+    kinds = np.zeros((CODES, CODES), dtype=np.int8)
+    for code in range(CODES):
+        if not VISIBLE[code]:
+            continue
+        animal = code & ANIMAL_MASK
+        for neighbor in range(CODES):
+            if not VISIBLE[neighbor] or SIDE[neighbor] == SIDE[code]:
+                continue
+            neighbor_animal = neighbor & ANIMAL_MASK
+            # 和天敌对角线，天敌能吃到自己就减去自身价值的ENEMY_DIAGONAL_WEIGHT倍（默认一半）
+            if IS_ENEMY[animal][neighbor_animal]:
+                terms[code, neighbor] = -settings.ENEMY_DIAGONAL_WEIGHT*SCORE[code]
+                kinds[code, neighbor] = DIAGONAL_ENEMY
+            # 和食物对角线，可以到达食物就加上食物价值的FOOD_DIAGONAL_WEIGHT倍（默认1倍）
+            elif IS_FOOD[animal][neighbor_animal]:
+                terms[code, neighbor] = settings.FOOD_DIAGONAL_WEIGHT*SCORE[neighbor]
+                kinds[code, neighbor] = DIAGONAL_SELF
+            elif neighbor_animal == animal:
+                terms[code, neighbor] = settings.SAME_DIAGONAL_WEIGHT*SCORE[code]
+                kinds[code, neighbor] = DIAGONAL_SELF
+    return terms, kinds
+
+def _build_reach() -> np.ndarray:
+    '''REACH[动物][中间格子的编码]：这种动物能不能经过这个格子（空格子，或者上面是它的食物）'''
+    reach = np.zeros((len(IS_FOOD), CODES), dtype=bool)
+    for animal in range(len(IS_FOOD)):
+        for code in range(CODES):
+            reach[animal, code] = not code or (bool(VISIBLE[code]) and IS_FOOD[animal][code & ANIMAL_MASK])
+    return reach
+
+ORTHOGONAL_TERMS = _build_orthogonal_terms()
+DIAGONAL_TERMS, DIAGONAL_KINDS = _build_diagonal_terms()
+REACH = _build_reach()
+
+# 所有(格子, 上下左右的邻居)的组合
+ORTHOGONAL_SQUARES = np.array([index for index in range(SQUARES) for _ in ORTHOGONALS[index]], dtype=np.intp)
+ORTHOGONAL_NEIGHBORS = np.array([neighbor for index in range(SQUARES) for neighbor in ORTHOGONALS[index]],
+                                dtype=np.intp)
+# 所有(格子, 对角线邻居, 中间格子1, 中间格子2)的组合
+DIAGONAL_SQUARES = np.array([index for index in range(SQUARES) for _ in DIAGONALS[index]], dtype=np.intp)
+DIAGONAL_NEIGHBORS, DIAGONAL_BLOCKS1, DIAGONAL_BLOCKS2 = (
+    np.array(column, dtype=np.intp)
+    for column in zip(*[triple for index in range(SQUARES) for triple in DIAGONALS[index]]))
+
+
+def encode_positions(positions: Iterable[Position]) -> np.ndarray:
+    '''把一批局面转成(N, SQUARES)的uint8数组'''
+    data = b''.join(bytes(position.squares) for position in positions)
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, SQUARES)
+
+def expand_children(position: Position) -> Tuple[List[Tuple[int, ...]], np.ndarray]:
+    '''生成所有合法棋步和走完之后的局面，方便一次给所有子局面打分'''
+    moves = position.get_valid_moves()
+    children = np.empty((len(moves), SQUARES), dtype=np.uint8)
+    for i, move in enumerate(moves):
+        position.make_move(move)
+        children[i] = np.frombuffer(bytes(position.squares), dtype=np.uint8)
+        position.unmake_move()
+    return moves, children
+
+def _pair_scores(codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''返回所有(格子, 上下左右邻居)和(格子, 对角线邻居)组合给格子带来的环境分'''
+    # 上下左右：一次查表就得到所有组合的分数
+    orthogonal = ORTHOGONAL_TERMS[codes[:, ORTHOGONAL_SQUARES], codes[:, ORTHOGONAL_NEIGHBORS]]
+    # 对角线：先查出能到达时的分数，再看中间两个格子能不能通过
+    own = codes[:, DIAGONAL_SQUARES]
+    neighbor = codes[:, DIAGONAL_NEIGHBORS]
+    kinds = DIAGONAL_KINDS[own, neighbor]
+    # 天敌要过来就看天敌能不能通过，自己要过去就看自己能不能通过
+    mover = np.where(kinds == DIAGONAL_ENEMY, ANIMAL[neighbor], ANIMAL[own])
+    reachable = REACH[mover, codes[:, DIAGONAL_BLOCKS1]] | REACH[mover, codes[:, DIAGONAL_BLOCKS2]]
+    diagonal = DIAGONAL_TERMS[own, neighbor] * reachable
+    return orthogonal, diagonal
+
+# 把组合的分数加回到格子上用的矩阵
+_ORTHOGONAL_SCATTER = np.eye(SQUARES)[ORTHOGONAL_SQUARES]
+_DIAGONAL_SCATTER = np.eye(SQUARES)[DIAGONAL_SQUARES]
+
+def batch_square_scores(codes: np.ndarray) -> np.ndarray:
+    '''返回(N, SQUARES)的数组：每个翻开的棋子给自己一方贡献的分数（自身价值加环境分）'''
+    codes = np.asarray(codes, dtype=np.intp).reshape(-1, SQUARES)
+    orthogonal, diagonal = _pair_scores(codes)
+    return SCORE[codes] + orthogonal @ _ORTHOGONAL_SCATTER + diagonal @ _DIAGONAL_SCATTER
+
+def _side_totals(codes: np.ndarray, side: Union[int, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    '''返回side这一方和对方的总分'''
+    codes = np.asarray(codes, dtype=np.intp).reshape(-1, SQUARES)
+    orthogonal, diagonal = _pair_scores(codes)
+    # 环境分只加在翻开的棋子上，空格子和没翻开的格子查出来都是0，只需要按颜色分开
+    mine = SIDE[codes] == np.reshape(side, (-1, 1))
+    material = SCORE[codes]
+    orthogonal_mine = mine[:, ORTHOGONAL_SQUARES]
+    diagonal_mine = mine[:, DIAGONAL_SQUARES]
+    my_total = ((material * mine).sum(axis=1)
+                + (orthogonal * orthogonal_mine).sum(axis=1)
+                + (diagonal * diagonal_mine).sum(axis=1))
+    their_total = ((material * ~mine).sum(axis=1)
+                   + (orthogonal * ~orthogonal_mine).sum(axis=1)
+                   + (diagonal * ~diagonal_mine).sum(axis=1))
+    return my_total, their_total
+
+def batch_side_score(codes: np.ndarray, side: Union[int, np.ndarray]) -> np.ndarray:
+    '''一批局面里side这一方的分数，和strategies.get_board_score一致'''
+    return _side_totals(codes, side)[0]
+
+def batch_evaluate(codes: np.ndarray, side: Union[int, np.ndarray]) -> np.ndarray:
+    '''站在side这一方的角度给一批局面打分：自己的分数减去对方的分数，和evaluation.evaluate一致'''
+    my_total, their_total = _side_totals(codes, side)
+    return my_total - their_total
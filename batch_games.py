@@ -0,0 +1,252 @@
+'''用NumPy同时模拟成千上万局棋：所有对局的局面放在一个(N, SQUARES)的数组里，每一步把所有对局同时走一步
+
+格子的编码和Position一样，没翻开的格子也带着下面棋子的编码，只是多了HIDDEN_BIT。
+规则和Board.make_move_by_cell、Position.make_move完全一致：同归于尽、撞死、吃子、老鼠贬值、磨棋计数；
+结束的判断和arena.play_recorded_game一样：先看磨棋到没到平局线，再看有没有一方死光，最后看有没有棋可走。
+策略只支持可以向量化的random和eat（和strategies.get_eat_move一样优先吃子），用来快速生成训练和调参的数据。
+
+动作的编号是格子*ACTIONS+方向：方向0是翻开这个格子，1到4是往tables.NEIGHBORS的四个方向走。
+
+用法：python batch_games.py random eat -n 10000
+'''
+import argparse
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import settings
+from position import Position, encode, HIDDEN_BIT, BLUE_BIT, DEVALUED_BIT, ANIMAL_MASK, RED
+from tables import ROWS, COLS, SQUARES, IS_FOOD, OUTCOMES, BOUNCE, TRADE, DEVALUE, MOUSE
+from records import UNFINISHED, RED_WIN, BLUE_WIN, DRAW
+
+# 走子的四个方向，顺序和tables.NEIGHBORS一致
+DIRECTIONS = [(0,1),(0,-1),(1,0),(-1,0)]
+FLIP = 0
+ACTIONS = 1 + len(DIRECTIONS)
+
+# TARGETS[格子][方向]是走到哪个格子，翻棋是格子本身，出界是-1
+TARGETS = np.array([[index] + [(index//COLS + r)*COLS + index%COLS + c
+                               if 0 <= index//COLS + r < ROWS and 0 <= index%COLS + c < COLS else -1
+                               for r, c in DIRECTIONS]
+                    for index in range(SQUARES)], dtype=np.intp)
+# 出界的方向随便指向一个格子，保证取值不越界，MOVABLE会把它们排除掉
+_SAFE_TARGETS = np.where(TARGETS >= 0, TARGETS, 0)[:, 1:]
+MOVABLE = TARGETS[:, 1:] >= 0
+
+OUTCOME_TABLE = np.array(OUTCOMES, dtype=np.uint8)
+FOOD_TABLE = np.array(IS_FOOD, dtype=bool)
+# _FOOD_PAIRS[进攻方<<3 | 防守方]，一维的表查起来比二维的快
+_FOOD_PAIRS = np.zeros(64, dtype=bool)
+_FOOD_PAIRS[[a << 3 | d for a in range(len(IS_FOOD)) for d in range(len(IS_FOOD))]] = FOOD_TABLE.ravel()
+# 开局的所有棋子，格子比棋子多的时候用0补齐
+INITIAL_CODES = np.array([encode(name, color, hidden=True) for color in ('red', 'blue') for name in settings.PIECES]
+                         + [0] * (SQUARES - 2 * len(settings.PIECES)), dtype=np.uint8)
+_REVEAL = np.uint8(~HIDDEN_BIT & 0xff)
+
+
+class BatchGames:
+    '''n_games局同时进行的棋
+
+    codes、side、not_eat和Position的squares、side、not_eat一一对应，counts是双方剩下的棋子数，
+    result是records里的UNFINISHED、RED_WIN、BLUE_WIN或者DRAW。
+    '''
+    def __init__(self, n_games: int, seed: Optional[int] = None) -> None:
+        self.n_games = n_games
+        self.rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self) -> None:
+        '''所有对局重新洗牌开局，随机决定谁先走'''
+        n = self.n_games
+        order = self.rng.permuted(np.tile(np.arange(SQUARES), (n, 1)), axis=1)
+        self.codes = INITIAL_CODES[order]
+        self.side = self.rng.integers(0, 2, n).astype(np.uint8)
+        self.not_eat = np.zeros(n, dtype=np.int32)
+        self.counts = np.full((n, 2), len(settings.PIECES), dtype=np.int32)
+        self.plies = np.zeros(n, dtype=np.int32)
+        self.result = np.full(n, UNFINISHED, dtype=np.uint8)
+        self._update()
+
+    @property
+    def done(self) -> np.ndarray:
+        return self.result != UNFINISHED
+
+    def legal_mask(self) -> np.ndarray:
+        '''(N, SQUARES, ACTIONS)的布尔数组，和Position.get_valid_moves一致，结束了的对局全是False'''
+        return self._mask
+
+    def position(self, game: int) -> Position:
+        '''第game局现在的局面，用来检查或者交给别的策略'''
+        return Position(bytearray(self.codes[game].tobytes()), int(self.side[game]), int(self.not_eat[game]))
+
+    def _compute_mask(self) -> np.ndarray:
+        codes = self.codes
+        side = self.side[:, None]
+        hidden = (codes & HIDDEN_BIT) != 0
+        own = (codes != 0) & ~hidden & ((codes & BLUE_BIT) >> 3 == side)
+        ends = codes[:, _SAFE_TARGETS]
+        # 终点必须是翻开的空格子或者对方的棋子
+        open_end = (ends == 0) | (((ends & HIDDEN_BIT) == 0) & ((ends & BLUE_BIT) >> 3 != side[:, :, None]))
+        mask = np.empty((self.n_games, SQUARES, ACTIONS), dtype=bool)
+        mask[:, :, FLIP] = hidden
+        mask[:, :, 1:] = own[:, :, None] & MOVABLE & open_end
+        return mask
+
+    def _update(self) -> None:
+        '''走完一步以后判断哪些对局结束了，顺序和arena.play_recorded_game一样'''
+        mask = self._compute_mask()
+        playing = ~self.done
+        red_num = self.counts[:, 0]
+        blue_num = self.counts[:, 1]
+        # 磨棋到了平局线是平局，不看剩下的棋子数
+        draw = playing & (self.not_eat >= settings.MAX_NOT_EAT)
+        # 有一方死光了，比剩下的棋子数
+        over = playing & ~draw & ((red_num == 0) | (blue_num == 0))
+        # 走投无路按平局处理
+        stuck = playing & ~draw & ~over & ~mask.reshape(self.n_games, -1).any(axis=1)
+        self.result[draw | stuck] = DRAW
+        self.result[over] = np.where(red_num[over] > blue_num[over], RED_WIN,
+                                     np.where(red_num[over] < blue_num[over], BLUE_WIN, DRAW))
+        mask[self.done] = False
+        self._mask = mask
+
+    def step(self, actions: np.ndarray) -> None:
+        '''每局走一步，actions是(N,)的动作编号，结束了的对局和-1都忽略；动作必须是合法的'''
+        actions = np.asarray(actions)
+        games = np.nonzero(~self.done & (actions >= 0))[0]
+        actions = actions[games]
+        starts = actions // ACTIONS
+        kinds = actions % ACTIONS
+        codes = self.codes
+        # 翻棋
+        flip = kinds == FLIP
+        codes[games[flip], starts[flip]] &= _REVEAL
+        # 走子
+        move = ~flip
+        games_moved = games[move]
+        starts = starts[move]
+        ends = TARGETS[starts, kinds[move]]
+        start_codes = codes[games_moved, starts]
+        end_codes = codes[games_moved, ends]
+        sides = self.side[games_moved]
+        # 往空格子走，起点清空，终点落子
+        quiet = end_codes == 0
+        codes[games_moved[quiet], starts[quiet]] = 0
+        codes[games_moved[quiet], ends[quiet]] = start_codes[quiet]
+        self.not_eat[games_moved[quiet]] += 1
+        # 走到对方的棋子上
+        capture = ~quiet
+        g = games_moved[capture]
+        start = starts[capture]
+        end = ends[capture]
+        start_code = start_codes[capture]
+        end_code = end_codes[capture]
+        side = sides[capture].astype(np.intp)
+        outcome = OUTCOME_TABLE[start_code & ANIMAL_MASK, end_code & ANIMAL_MASK]
+        devalue = (outcome & DEVALUE) != 0
+        # 分值一样，同归于尽；两个大象同归于尽，两方的老鼠都贬值
+        trade = (outcome & TRADE) != 0
+        elephants = g[trade & devalue]
+        if len(elephants):
+            rows = codes[elephants]
+            mice = (rows != 0) & ((rows & ANIMAL_MASK) == MOUSE)
+            rows[mice] |= DEVALUED_BIT
+            codes[elephants] = rows
+        codes[g[trade], start[trade]] = 0
+        codes[g[trade], end[trade]] = 0
+        self.counts[g[trade], side[trade]] -= 1
+        self.counts[g[trade], 1 - side[trade]] -= 1
+        # 往天敌身上走，自杀；大象往老鼠身上撞，老鼠贬值
+        bounce = ~trade & ((outcome & BOUNCE) != 0)
+        bounced_mice = bounce & devalue
+        codes[g[bounced_mice], end[bounced_mice]] = end_code[bounced_mice] | DEVALUED_BIT
+        codes[g[bounce], start[bounce]] = 0
+        self.counts[g[bounce], side[bounce]] -= 1
+        # 往食物身上走，吃掉对方；老鼠吃掉大象，老鼠贬值
+        eat = ~trade & ~bounce
+        codes[g[eat], start[eat]] = 0
+        codes[g[eat], end[eat]] = np.where(devalue[eat], start_code[eat] | DEVALUED_BIT, start_code[eat])
+        self.counts[g[eat], 1 - side[eat]] -= 1
+        self.not_eat[g] = 0
+        # 交出出牌权
+        self.side[games] ^= 1
+        self.plies[games] += 1
+        self._update()
+
+
+# 策略：输入随机数生成器、一些对局的格子编码和合法动作，返回每局的动作编号，没有合法动作的是-1
+
+def _choose(rng: np.random.Generator, mask: np.ndarray, bonus: Optional[np.ndarray] = None) -> np.ndarray:
+    '''每局在mask里等概率选一个动作；给了bonus的话只在bonus最大的那些动作里选'''
+    flat = mask.reshape(len(mask), -1)
+    keys = rng.random(flat.shape)
+    if bonus is not None:
+        keys += bonus.reshape(keys.shape)
+    keys[~flat] = -1
+    actions = keys.argmax(axis=1)
+    actions[~flat.any(axis=1)] = -1
+    return actions
+
+def random_policy(rng: np.random.Generator, codes: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    '''和strategies.get_random_move一样，随便走一步'''
+    return _choose(rng, mask)
+
+def eat_policy(rng: np.random.Generator, codes: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    '''和strategies.get_eat_move一样，能吃掉对方的棋子就随便吃一个，不能吃就随便走一步'''
+    ends = codes[:, _SAFE_TARGETS]
+    # 合法的走子终点要么是空格子要么是对方翻开的棋子，终点是食物就能吃
+    pairs = (codes[:, :, None] & ANIMAL_MASK) << 3 | (ends & ANIMAL_MASK)
+    bonus = np.zeros(mask.shape)
+    bonus[:, :, 1:] = (ends != 0) & _FOOD_PAIRS[pairs]
+    return _choose(rng, mask, bonus)
+
+POLICIES: Dict[str, Callable[[np.random.Generator, np.ndarray, np.ndarray], np.ndarray]] = {
+    'random': random_policy,
+    'eat': eat_policy,
+}
+
+
+def play(games: BatchGames, red: str, blue: str,
+         collect: bool = False) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    '''把所有对局下完；collect为True的时候返回每一步之前的(codes, side, not_eat, 还没结束的对局)'''
+    red_policy = POLICIES[red]
+    blue_policy = POLICIES[blue]
+    history = []
+    while not games.done.all():
+        mask = games.legal_mask()
+        if collect:
+            history.append((games.codes.copy(), games.side.copy(), games.not_eat.copy(), ~games.done))
+        # 只给还没结束的对局选棋，红方和蓝方分开
+        playing = np.nonzero(~games.done)[0]
+        actions = np.full(games.n_games, -1)
+        for policy, player in ((red_policy, playing[games.side[playing] == RED]),
+                               (blue_policy, playing[games.side[playing] != RED])):
+            if len(player):
+                actions[player] = policy(games.rng, games.codes[player], mask[player])
+        games.step(actions)
+    return history
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='用NumPy同时模拟很多局棋')
+    parser.add_argument('red', choices=sorted(POLICIES), help='红方的策略')
+    parser.add_argument('blue', choices=sorted(POLICIES), help='蓝方的策略')
+    parser.add_argument('-n', '--games', type=int, default=10000, help='同时下多少局')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    games = BatchGames(args.games, args.seed)
+    play(games, args.red, args.blue)
+    elapsed = time.perf_counter() - start
+    red_wins = int((games.result == RED_WIN).sum())
+    blue_wins = int((games.result == BLUE_WIN).sum())
+    draws = int((games.result == DRAW).sum())
+    print(f'{args.red} vs {args.blue}: {args.games} games, +{red_wins} ={draws} -{blue_wins}, '
+          f'score {(red_wins + draws / 2) / args.games:.3f}')
+    print(f'{elapsed:.2f} s: {args.games / elapsed:,.0f} games/s, {games.plies.sum() / elapsed:,.0f} plies/s, '
+          f'{games.plies.mean():.1f} plies per game')
+
+
+if __name__ == '__main__':
+    main()
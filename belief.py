@@ -0,0 +1,124 @@
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+from position import Position, encode, score_of, HIDDEN_BIT, BLUE_BIT, DEVALUED_BIT, ANIMAL_MASK
+from evaluation import get_environment_score
+from tables import SQUARES, AROUND, MOUSE
+from symmetry import canonical_flip
+import settings
+
+# 没翻开的棋子的信息：电脑不知道每个格子下面是什么，但是知道还有哪些棋子没翻开。
+# 翻开一个格子，下面是每种棋子的概率就是它在没翻开的棋子里所占的比例，
+# 据此可以算出翻开这个格子的期望得分。
+
+
+def piece_code(piece) -> int:
+    '''把一颗翻开的棋子编码成一个字节，和Position.from_board一致'''
+    return encode(piece.name, piece.color, devalued=piece.score != settings.SCORES[piece.name])
+
+
+class HiddenTracker:
+    '''还没翻开的棋子的多重集合，按编码（不带HIDDEN_BIT）计数
+
+    Board翻棋的时候调用reveal，撤销翻棋的时候调用hide，两头大象同归于尽时调用devalue_mice。
+    '''
+    def __init__(self, codes: Iterable[int] = ()) -> None:
+        self.counts: Counter = Counter(code & ~HIDDEN_BIT for code in codes)
+
+    @classmethod
+    def from_position(cls, position: Position) -> 'HiddenTracker':
+        '''根据局面里没翻开的格子生成'''
+        return cls(position.squares[index] for index in position.hidden_squares())
+
+    def copy(self) -> 'HiddenTracker':
+        tracker = HiddenTracker()
+        tracker.counts = self.counts.copy()
+        return tracker
+
+    def __len__(self) -> int:
+        return sum(self.counts.values())
+
+    def reveal(self, code: int) -> None:
+        '''翻开了一颗棋子'''
+        code &= ~HIDDEN_BIT
+        self.counts[code] -= 1
+        if not self.counts[code]:
+            del self.counts[code]
+
+    def hide(self, code: int) -> None:
+        '''一颗棋子又翻回去了，只在撤销棋步的时候使用'''
+        self.counts[code & ~HIDDEN_BIT] += 1
+
+    def devalue_mice(self) -> None:
+        '''没翻开的老鼠全部贬值'''
+        for code in [code for code in self.counts if code & ANIMAL_MASK == MOUSE and not code & DEVALUED_BIT]:
+            self.counts[code | DEVALUED_BIT] += self.counts.pop(code)
+
+    def key(self) -> Tuple[Tuple[int, int], ...]:
+        '''可以用作字典键的多重集合'''
+        return tuple(sorted(self.counts.items()))
+
+
+@lru_cache(maxsize=settings.FLIP_CACHE_SIZE)
+def get_flip_value(hidden: Tuple[Tuple[int, int], ...], index: int,
+                   neighborhood: Tuple[int, ...], side: int) -> float:
+    '''翻开index这个格子给side这一方带来的期望得分
+
+    hidden是HiddenTracker.key()，neighborhood是index周围一圈格子（不含自己）的编码，
+    没翻开的格子只保留HIDDEN_BIT。翻开一个格子只会改变这一圈格子的分数，
+    所以期望得分只和这几个参数有关，可以缓存起来。
+    调用的时候index和neighborhood先用symmetry.canonical_flip换成对称意义下的代表，对称的格子共用一条缓存。
+    '''
+    position = Position(bytearray(SQUARES))
+    squares = position.squares
+    around = [square for square in AROUND[index] if square != index]
+    for square, code in zip(around, neighborhood):
+        squares[square] = code
+    total = sum(count for _, count in hidden)
+
+    def side_delta() -> float:
+        '''这一圈格子给side这一方的分数减去给对方的分数'''
+        score = 0.0
+        for square in AROUND[index]:
+            code = squares[square]
+            if code and not code & HIDDEN_BIT:
+                value = get_environment_score(position, square) + score_of(code)
+                score += value if (code & BLUE_BIT) >> 3 == side else -value
+        return score
+
+    # 翻开之前这个格子是一颗没翻开的棋子，具体是哪颗不影响分数
+    squares[index] = HIDDEN_BIT
+    before = side_delta()
+    expected = 0.0
+    for code, count in hidden:
+        squares[index] = code
+        expected += count / total * (side_delta() - before)
+    return expected
+
+def get_neighborhood(position: Position, index: int) -> Tuple[int, ...]:
+    '''index周围一圈格子的编码，没翻开的格子不暴露是什么棋子'''
+    squares = position.squares
+    return tuple(HIDDEN_BIT if squares[square] & HIDDEN_BIT else squares[square]
+                 for square in AROUND[index] if square != index)
+
+def get_flip_values(position: Position, hidden: HiddenTracker, side: int) -> Dict[int, float]:
+    '''所有没翻开的格子翻开以后的期望得分'''
+    key = hidden.key()
+    return {index: get_flip_value(key, *canonical_flip(index, get_neighborhood(position, index)), side)
+            for index in position.hidden_squares()}
+
+def get_best_flip(position: Position, hidden: HiddenTracker, side: int,
+                  candidates: Optional[Iterable[int]] = None) -> Optional[int]:
+    '''期望得分最高的翻棋格子，分数一样的取candidates里靠前的，没有可以翻的格子返回None'''
+    key = hidden.key()
+    if candidates is None:
+        candidates = position.hidden_squares()
+    best_index = None
+    best_value = None
+    for index in candidates:
+        value = get_flip_value(key, *canonical_flip(index, get_neighborhood(position, index)), side)
+        if best_value is None or value > best_value:
+            best_index = index
+            best_value = value
+    return best_index
@@ -0,0 +1,231 @@
+'''在固定的一组局面上给棋盘操作、估值和电脑策略计时，和保存下来的基准比较
+
+用法：python benchmark.py                 运行并和benchmark_baseline.json比较，变慢超过阈值就返回1
+      python benchmark.py --save          运行并把结果保存成新的基准
+      python benchmark.py -k best -r 5    只运行名字里有best的项目，每项重复5次取最快的一次
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from board import Board
+from position import Position
+import strategies
+import settings
+
+BASELINE_PATH = os.path.join(settings.BASE_DIR, 'benchmark_baseline.json')
+# 比基准慢多少算退步
+DEFAULT_THRESHOLD = 0.2
+# 每一轮至少计时这么久，单位是秒，太短的话误差太大
+MIN_ROUND_TIME = 0.2
+# 生成局面用的随机种子，改了以后要重新保存基准
+CORPUS_SEED = 20201001
+
+
+def _play_random_move(rng: random.Random, board: Board):
+    '''随机下一步棋，优先吃子，让棋局尽快推进到中局和残局'''
+    valid_moves = board.get_valid_moves()
+    if not valid_moves:
+        return False
+    eat_moves = [move for move in valid_moves if len(move) == 2 and move[0].meet_food(move[1])]
+    board.make_computer_move(rng.choice(eat_moves or valid_moves))
+    return True
+
+def build_corpus(seed: int = CORPUS_SEED, size: int = 8) -> Dict[str, List[int]]:
+    '''生成开局、中局和残局各size个局面，用Position.pack()保存'''
+    rng = random.Random(seed)
+    corpus: Dict[str, List[int]] = {'opening': [], 'middlegame': [], 'endgame': []}
+    # 开局时的棋子数，标准棋盘是16颗
+    total = 2 * len(settings.PIECES)
+    while any(len(positions) < size for positions in corpus.values()):
+        random.seed(rng.getrandbits(32))
+        board = Board()
+        plies = 0
+        taken = set()
+        while not board.game_over() and board.not_eat < settings.MAX_NOT_EAT:
+            position = board.to_position()
+            hidden = len(position.hidden_squares())
+            pieces = sum(position.count_pieces())
+            # 开局：翻开了两三颗棋子
+            if 'opening' not in taken and 2 <= plies <= 3:
+                phase = 'opening'
+            # 中局：大部分棋子翻开了，吃掉了几颗
+            elif 'middlegame' not in taken and hidden <= total // 4 and total * 9 // 16 <= pieces <= total * 3 // 4:
+                phase = 'middlegame'
+            # 残局：全部翻开，只剩几颗棋子
+            elif 'endgame' not in taken and not hidden and 3 <= pieces <= 6:
+                phase = 'endgame'
+            else:
+                phase = None
+            if phase is not None and len(corpus[phase]) < size and board.get_valid_moves():
+                corpus[phase].append(position.pack())
+                taken.add(phase)
+            if not _play_random_move(rng, board):
+                break
+            plies += 1
+    return corpus
+
+def load_boards(corpus: Dict[str, List[int]]) -> List[Board]:
+    '''把所有局面还原成Board'''
+    return [Position.unpack(packed).to_board() for positions in corpus.values() for packed in positions]
+
+
+# 每个项目返回一个函数：调用一次完成一轮计时，返回这一轮做了多少次操作
+def bench_get_valid_moves(boards: List[Board]) -> Callable[[], int]:
+    def run() -> int:
+        for _ in range(50):
+            for board in boards:
+                board.get_valid_moves()
+        return 50 * len(boards)
+    return run
+
+def bench_make_move_by_cell(boards: List[Board]) -> Callable[[], int]:
+    '''Board.make_move_by_cell没法撤销，用make_move和unmake_move包起来计时'''
+    cases = [(board, move) for board in boards for move in board.get_valid_moves() if len(move) == 2]
+    def run() -> int:
+        for _ in range(20):
+            for board, move in cases:
+                board.make_move(move)
+                board.unmake_move()
+        return 20 * len(cases)
+    return run
+
+def bench_get_environment_score(boards: List[Board]) -> Callable[[], int]:
+    cases = [(board, cell.row, cell.col) for board in boards for cell in board.iter_cells()
+             if cell.visible and cell.get_piece()]
+    def run() -> int:
+        for _ in range(20):
+            for board, row, col in cases:
+                strategies.get_environment_score(board, row, col)
+        return 20 * len(cases)
+    return run
+
+def bench_get_board_score(boards: List[Board]) -> Callable[[], int]:
+    def run() -> int:
+        for _ in range(20):
+            for board in boards:
+                strategies.get_board_score(board, 'red')
+                strategies.get_board_score(board, 'blue')
+        return 40 * len(boards)
+    return run
+
+def _bench_strategy(strategy) -> Callable[[List[Board]], Callable[[], int]]:
+    def bench(boards: List[Board]) -> Callable[[], int]:
+        def run() -> int:
+            random.seed(0)
+            for board in boards:
+                strategy(board.get_valid_moves(), board)
+            return len(boards)
+        return run
+    return bench
+
+def bench_headless_games(boards: List[Board]) -> Callable[[], int]:
+    '''一轮下10局best对best，按每局的平均用时计'''
+    from arena import play_headless_game
+    def run() -> int:
+        for seed in range(10):
+            play_headless_game('best', 'best', seed)
+        return 10
+    return run
+
+BENCHMARKS: Dict[str, Callable[[List[Board]], Callable[[], int]]] = {
+    'Board.get_valid_moves': bench_get_valid_moves,
+    'Board.make_move_by_cell': bench_make_move_by_cell,
+    'strategies.get_environment_score': bench_get_environment_score,
+    'strategies.get_board_score': bench_get_board_score,
+    'strategies.get_best_move': _bench_strategy(strategies.get_best_move),
+    'strategies.get_best_move2': _bench_strategy(strategies.get_best_move2),
+    'headless_game': bench_headless_games,
+}
+
+
+def run_benchmarks(names: List[str], repeat: int, out=sys.stdout) -> Dict[str, float]:
+    '''运行这些项目，返回每次操作的用时（秒），每项重复repeat轮取最快的一轮
+
+    每一轮反复调用计时函数，直到用时超过MIN_ROUND_TIME。
+    '''
+    boards = load_boards(build_corpus())
+    results = {}
+    for name in names:
+        run = BENCHMARKS[name](boards)
+        best = None
+        for _ in range(repeat):
+            operations = 0
+            start = time.perf_counter()
+            while True:
+                operations += run()
+                elapsed = time.perf_counter() - start
+                if elapsed >= MIN_ROUND_TIME:
+                    break
+            elapsed /= operations
+            if best is None or elapsed < best:
+                best = elapsed
+        results[name] = best
+        print(f'{name:36s} {format_time(best):>12s}', file=out, flush=True)
+    return results
+
+def format_time(seconds: float) -> str:
+    if seconds >= 1:
+        return f'{seconds:.2f} s'
+    if seconds >= 1e-3:
+        return f'{seconds * 1e3:.2f} ms'
+    return f'{seconds * 1e6:.2f} us'
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float,
+            out=sys.stdout) -> List[str]:
+    '''和基准比较，返回变慢超过阈值的项目'''
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+        change = value / baseline[name] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:36s} {format_time(baseline[name]):>12s} -> {format_time(value):>12s} '
+              f'({change:+.1%}){flag}', file=out)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='性能基准测试')
+    parser.add_argument('-k', '--filter', default='', help='只运行名字里有这个字符串的项目')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='每个项目重复几轮，取最快的一轮')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='基准文件')
+    parser.add_argument('--save', action='store_true', help='把结果保存成新的基准')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='比基准慢多少算退步，0.2表示慢20%%')
+    args = parser.parse_args(argv)
+    names = [name for name in BENCHMARKS if args.filter in name]
+    results = run_benchmarks(names, args.repeat)
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)['results']
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': baseline}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'baseline saved to {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f'no baseline at {args.baseline}, run with --save first')
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    print()
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f'{len(regressions)} regression(s) over {args.threshold:.0%}: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,47 +1,101 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Iterator
 import random
-import os
-
-import pygame
 
 from piece import Piece
 from cell import Cell
+from position import Position, name_of, color_of, is_hidden, is_devalued, DEVALUED_SCORE
+from tables import ROWS, COLS, SQUARES, NEIGHBORS, ADJACENT, OUTCOMES, EAT, BOUNCE, TRADE, DEVALUE
+from belief import HiddenTracker, piece_code
+from records import GameRecord
 import settings
 
 class Board:
     '''棋盘类'''
     def __init__(self) -> None:
-        # 用于存放16颗棋子
-        pieces: List[Piece] = []
-        # 添加红方的8颗棋子
-        for name in settings.ANIMALS:
+        # 用于存放所有的棋子，格子比棋子多的时候用None补齐，就是开局的空格子
+        pieces: List[Optional[Piece]] = []
+        # 添加红方的棋子
+        for name in settings.PIECES:
             pieces.append(Piece(name,'red'))
-        # 添加蓝方的8颗棋子
-        for name in settings.ANIMALS:
+        # 添加蓝方的棋子
+        for name in settings.PIECES:
             pieces.append(Piece(name,'blue'))
+        pieces += [None] * (SQUARES - len(pieces))
         # 随机打乱棋子的顺序
         random.shuffle(pieces)
-        # 用于存放棋盘上的16个格子
-        # 这些格子是4行4列
-        self._container: List[List[Cell]] = []
-        # 把16颗棋子放到16个格子上
-        i = 0
-        for row in range(4):
-            row_of_board = []
-            for col in range(4):
-                row_of_board.append(
-                    Cell(pieces[i], 
-                         settings.LEFT_OF_BOARD + col*settings.CELL_SIZE,
-                         settings.TOP_OF_BOARD + row*settings.CELL_SIZE,
-                         settings.CELL_SIZE)
-                    )
-                i += 1
-            self._container.append(row_of_board)
+        # 用于存放棋盘上的格子
+        # 这些格子是settings.ROWS行settings.COLS列
+        self._container: List[List[Cell]] = self._build_container(pieces)
+        # 同样的格子按从左到右、从上到下的顺序排成一列，用下标查表的时候更快
+        self._cells: List[Cell] = [cell for row_of_board in self._container for cell in row_of_board]
         self._turn = random.choice(['red','blue'])
         # 保存的用户第一次点击的坐标
         self.user_coordinates = None
         # 10次没有互相吃，就平局
         self.not_eat = 0
+        # 双方剩下的棋子数（包括没翻开的），吃子的时候增量更新，不用每帧都扫描棋盘
+        self._counts: Dict[str,int] = {'red': len(settings.PIECES), 'blue': len(settings.PIECES)}
+        # 还没翻开的棋子，翻棋的时候增量更新
+        self.hidden = HiddenTracker(piece_code(piece) for piece in pieces if piece)
+        # 撤销棋步用的日志，每走一步就压入一条记录
+        self._history: List[tuple] = []
+        # 正在记录的棋谱，见records.py，None表示不记录
+        self.record: Optional[GameRecord] = None
+
+    @staticmethod
+    def _build_container(pieces: List[Optional[Piece]]) -> List[List[Cell]]:
+        '''把棋子按顺序放到ROWS行COLS列的格子上，None是空格子'''
+        container = []
+        i = 0
+        for row in range(ROWS):
+            row_of_board = []
+            for col in range(COLS):
+                row_of_board.append(Cell(pieces[i], row, col))
+                i += 1
+            container.append(row_of_board)
+        return container
+
+    @classmethod
+    def from_position(cls, position: Position) -> 'Board':
+        '''根据紧凑局面还原出棋盘，和Position.from_board互为逆操作'''
+        board = cls.__new__(cls)
+        pieces = []
+        for code in position.squares:
+            if code:
+                piece = Piece(name_of(code), color_of(code))
+                if is_devalued(code):
+                    piece.score = DEVALUED_SCORE
+                pieces.append(piece)
+            else:
+                pieces.append(None)
+        board._container = cls._build_container(pieces)
+        board._cells = [cell for row_of_board in board._container for cell in row_of_board]
+        for code, cell in zip(position.squares, board.iter_cells()):
+            if not is_hidden(code):
+                cell.reverse_piece()
+        board._turn = position.turn
+        board.user_coordinates = None
+        board.not_eat = position.not_eat
+        board._counts = {'red': 0, 'blue': 0}
+        for piece in pieces:
+            if piece:
+                board._counts[piece.color] += 1
+        board.hidden = HiddenTracker.from_position(position)
+        board._history = []
+        board.record = None
+        return board
+
+    def iter_cells(self) -> Iterator[Cell]:
+        '''按从左到右、从上到下的顺序遍历所有格子'''
+        return iter(self._cells)
+
+    def get_cell_by_index(self, index: int) -> Cell:
+        '''根据格子的下标（行*列数+列）获取格子'''
+        return self._cells[index]
+
+    def to_position(self) -> Position:
+        '''转换成紧凑局面，供电脑搜索使用'''
+        return Position.from_board(self)
     
     @property
     def turn(self) -> str:
@@ -59,62 +113,27 @@ class Board:
         '''获取这一轮对应的颜色'''
         return settings.RED if self._turn == 'red' else settings.BLUE
 
-    def draw_board(self, surface: pygame.Surface, images: Dict[str,pygame.Surface] ) -> None:
-        '''展示棋盘'''
-        for row in range(4):
-            for col in range(4):
-                cell = self._container[row][col]
-                cell_rect = cell.get_rect()
-                # 不可见就绘制问号图片
-                if not cell.visible:
-                    cell_stretched_image = images['back']
-                    surface.blit(cell_stretched_image, cell_rect)
-                # 有棋子就绘制棋子图片
-                elif cell.get_piece():
-                    piece = cell.get_piece()
-                    color = piece.color
-                    name = piece.name
-                    cell_stretched_image = images[f'{color}_{name}']
-                    surface.blit(cell_stretched_image,cell_rect)
-                # 没有棋子就绘制绿色正方形
-                else:
-                    pygame.draw.rect(surface,settings.SEA_GREEN,cell_rect)
-                    pygame.draw.rect(surface,settings.BLACK,cell_rect,1)
-        if self.user_coordinates:
-            cell = self.get_cell_by_coordinates(*self.user_coordinates)
-            cell_rect = cell.get_rect()
-            pygame.draw.rect(surface,settings.YELLOW,cell_rect,2)
-    
     def is_on_board(self, x, y):
         '''判断一个坐标是否在棋盘上'''
-        return x >= settings.LEFT_OF_BOARD and x < settings.LEFT_OF_BOARD + settings.BOARD_SIZE \
-            and y >= settings.TOP_OF_BOARD and y < settings.TOP_OF_BOARD + settings.BOARD_SIZE
+        return x >= settings.LEFT_OF_BOARD and x < settings.LEFT_OF_BOARD + settings.BOARD_WIDTH \
+            and y >= settings.TOP_OF_BOARD and y < settings.TOP_OF_BOARD + settings.BOARD_HEIGHT
     
     def is_neighbor(self,start,end) -> bool:
         '''检查两个格子是否是相邻的'''
-        # 只有四个方向可以相邻
-        for r,c in [(1,0),(-1,0),(0,1),(0,-1)]:
-            if (start[0]+r,start[1]+c) == end:
-                return True
-        return False
+        # 只有四个方向可以相邻，直接查表
+        return ADJACENT[start[0]*COLS+start[1]][end[0]*COLS+end[1]]
 
     def get_row_col_by_coordinates(self, x, y):
         '''根据坐标，获取格子的行和列'''
-        for row in range(4):
-            for col in range(4):
-                cell = self._container[row][col]
-                cell_rect = cell.get_rect()
-                if x>=cell_rect.left and x<cell_rect.right and y>=cell_rect.top and y<cell_rect.bottom:
-                    return row,col
+        # 格子都是一样大的，直接换算就行，不需要挨个格子比较
+        if self.is_on_board(x, y):
+            return (y-settings.TOP_OF_BOARD)//settings.CELL_SIZE, (x-settings.LEFT_OF_BOARD)//settings.CELL_SIZE
     
     def get_cell_by_coordinates(self,x,y) -> Cell:
         '''根据用户点击的坐标获取格子'''
-        for row in range(4):
-            for col in range(4):
-                cell = self._container[row][col]
-                cell_rect = cell.get_rect()
-                if x>=cell_rect.left and x<cell_rect.right and y>=cell_rect.top and y<cell_rect.bottom:
-                    return cell
+        row_col = self.get_row_col_by_coordinates(x, y)
+        if row_col:
+            return self._container[row_col[0]][row_col[1]]
     
     def get_cell_by_row_col(self,row,col) -> Cell:
         '''根据行和列获取格子'''
@@ -136,7 +155,8 @@ class Board:
             if not self.user_coordinates:
                 # 遇到没翻的棋就翻棋，并且交出出牌权
                 if not cell.visible:
-                    cell.reverse_piece()
+                    self._record_move((cell,))
+                    self.reveal(cell)
                     self.change_turn()
                 # 如果是自己的棋，就保存起来
                 elif cell.get_piece() and cell.get_piece().color == self._turn:
@@ -148,23 +168,31 @@ class Board:
                 end_row_col = self.get_row_col_by_coordinates(x,y)
                 # 如果是对方的棋或者空格子并且两个格子是邻居，都是有效的，可以走棋了
                 if cell.visible and (not cell.get_piece() or cell.get_piece().color != self._turn) and self.is_neighbor(start_row_col,end_row_col):
+                    self._record_move((self.get_cell_by_coordinates(*self.user_coordinates), cell))
                     self.make_move_by_coordinates(self.user_coordinates,(x,y))
                     self.change_turn()
                 # 不管有没有效，连续点击两次后都应该清空保存的坐标
                 self.user_coordinates = None
 
-    def make_computer_move(self,move: Tuple[Cell,...],surface) -> None:
+    def reveal(self, cell: Cell) -> None:
+        '''翻开一个格子，同时从没翻开的棋子里去掉它'''
+        cell.reverse_piece()
+        self.hidden.reveal(piece_code(cell.get_piece()))
+
+    def _record_move(self, move: Tuple[Cell,...]) -> None:
+        '''正在记录棋谱的话记下这一步'''
+        if self.record is not None:
+            self.record.add_move(tuple(cell.row*COLS + cell.col for cell in move))
+
+    def make_computer_move(self,move: Tuple[Cell,...]) -> None:
         '''根据电脑给出的格子走棋'''
+        self._record_move(move)
         if len(move) == 1:
             cell = move[0]
-            cell.reverse_piece()
+            self.reveal(cell)
             self.change_turn()
         else:
             start_cell, end_cell = move
-            start_rect = start_cell.get_rect()
-            pygame.draw.rect(surface,settings.YELLOW,start_rect,2)
-            pygame.display.update()
-            pygame.time.delay(400)
             self.make_move_by_cell(start_cell,end_cell)
             self.change_turn()
 
@@ -183,85 +211,104 @@ class Board:
             start_cell.set_piece()
             end_cell.set_piece(start_piece)
             self.not_eat += 1
-        # 分值一样，同归于尽
-        elif start_piece.name == end_piece.name:
-            # 如果是两个大象同归于尽，两方的老鼠都贬值
-            if start_piece.name == 'elephant':
-                for row_of_board in self._container:
-                    for cell in row_of_board:
+        else:
+            outcome = OUTCOMES[start_piece.index][end_piece.index]
+            # 分值一样，同归于尽
+            if outcome & TRADE:
+                # 如果是两个大象同归于尽，两方的老鼠都贬值
+                if outcome & DEVALUE:
+                    for cell in self._cells:
                         if cell.get_piece() and cell.get_piece().name == 'mouse':
                             cell.get_piece().score = 0.5
-            start_cell.set_piece()
-            end_cell.set_piece()
-            self.not_eat = 0
-        # 往天敌身上走，自杀
-        elif start_piece.name in end_piece.food:
-            # 如果是大象往老鼠身上撞，老鼠贬值
-            if end_piece.name == 'mouse':
-                end_piece.score = 0.5
-            start_cell.set_piece()
-            self.not_eat = 0
-        # 往食物身上走，吃掉对方
-        elif start_piece.name in end_piece.enemy:
-            # 如果是老鼠吃掉了大象，老鼠贬值
-            if start_piece.name == 'mouse':
-                start_piece.score = 0.5
-            start_cell.set_piece()
-            end_cell.set_piece(start_piece)
+                    self.hidden.devalue_mice()
+                start_cell.set_piece()
+                end_cell.set_piece()
+                self._counts[start_piece.color] -= 1
+                self._counts[end_piece.color] -= 1
+            # 往天敌身上走，自杀
+            elif outcome & BOUNCE:
+                # 如果是大象往老鼠身上撞，老鼠贬值
+                if outcome & DEVALUE:
+                    end_piece.score = 0.5
+                start_cell.set_piece()
+                self._counts[start_piece.color] -= 1
+            # 往食物身上走，吃掉对方
+            elif outcome & EAT:
+                # 如果是老鼠吃掉了大象，老鼠贬值
+                if outcome & DEVALUE:
+                    start_piece.score = 0.5
+                start_cell.set_piece()
+                end_cell.set_piece(start_piece)
+                self._counts[end_piece.color] -= 1
             self.not_eat = 0
         
 
+    def make_move(self, move: Tuple[Cell,...]) -> None:
+        '''可撤销地走一步棋（翻棋或者走子），然后交出出牌权'''
+        start_cell = move[0]
+        end_cell = move[-1]
+        start_piece = start_cell.get_piece()
+        end_piece = end_cell.get_piece()
+        # 只有大象和老鼠碰面的时候老鼠才会贬值，这时候才需要记下老鼠原来的分数
+        scores = []
+        hidden = None
+        if len(move) == 2 and end_piece and OUTCOMES[start_piece.index][end_piece.index] & DEVALUE:
+            for cell in self._cells:
+                piece = cell.get_piece()
+                if piece and piece.name == 'mouse':
+                    scores.append((piece, piece.score))
+            hidden = self.hidden.copy()
+        self._history.append((start_cell, start_piece, start_cell.visible,
+                              end_cell, end_piece, self.not_eat, self._turn, scores,
+                              self._counts['red'], self._counts['blue'], hidden))
+        if len(move) == 1:
+            self.reveal(start_cell)
+        else:
+            self.make_move_by_cell(start_cell, end_cell)
+        self.change_turn()
+
+    def unmake_move(self) -> None:
+        '''撤销最近一次用make_move走的棋'''
+        start_cell, start_piece, start_visible, end_cell, end_piece, not_eat, turn, scores, red_num, blue_num, hidden = self._history.pop()
+        end_cell.set_piece(end_piece)
+        start_cell.set_piece(start_piece)
+        if not start_visible:
+            start_cell.cover_piece()
+            self.hidden.hide(piece_code(start_piece))
+        for piece, score in scores:
+            piece.score = score
+        if hidden is not None:
+            self.hidden = hidden
+        self.not_eat = not_eat
+        self._turn = turn
+        self._counts['red'] = red_num
+        self._counts['blue'] = blue_num
+
     def run_out_of_chances(self) -> bool:
         '''判断当前是否已经磨棋磨到极限了'''
         return self.not_eat >= 10
 
     def game_over(self) -> bool:
         '''判断是否有一方的动物死绝了'''
-        red_num = 0
-        blue_num = 0
-        for row_of_board in self._container:
-            for cell in row_of_board:
-                piece = cell.get_piece()
-                if piece:
-                    if piece.color == 'red':
-                        red_num += 1
-                    else:
-                        blue_num += 1
-        return (red_num == 0 or blue_num == 0)
+        return self._counts['red'] == 0 or self._counts['blue'] == 0
 
     def get_result(self) -> Tuple[int, int]:
         '''返回游戏的结果'''
-        player_score = 0
-        computer_score = 0
-        for row_of_board in self._container:
-            for cell in row_of_board:
-                piece = cell.get_piece()
-                if piece:
-                    if piece.color == 'red':
-                        player_score += 1
-                    else:
-                        computer_score += 1
-        return (player_score, computer_score)
+        return (self._counts['red'], self._counts['blue'])
 
     def get_valid_moves(self) -> List[Tuple[Cell,...]]:
         '''获取所有有效的棋步'''
         valid_moves = []
-        for row in range(4):
-            for col in range(4):
-                start_cell = self._container[row][col]
-                if not start_cell.visible:
-                    valid_moves.append((start_cell,))
-                else:
-                    piece = start_cell.get_piece()
-                    if piece and piece.color == self._turn:
-                        for r, c in [(0,1),(0,-1),(1,0),(-1,0)]:
-                            if row+r >= 0 and row+r <=3 and col+c>=0 and col+c<=3:
-                                end_cell = self._container[row+r][col+c]
-                                if self.is_valid_end(end_cell):
-                                    valid_moves.append((start_cell,end_cell))
+        cells = self._cells
+        for index, start_cell in enumerate(cells):
+            if not start_cell.visible:
+                valid_moves.append((start_cell,))
+            else:
+                piece = start_cell.get_piece()
+                if piece and piece.color == self._turn:
+                    # 相邻的格子提前算好了，不用再判断边界
+                    for neighbor in NEIGHBORS[index]:
+                        end_cell = cells[neighbor]
+                        if self.is_valid_end(end_cell):
+                            valid_moves.append((start_cell,end_cell))
         return valid_moves
-            
-        
-
-        
-
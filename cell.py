@@ -1,17 +1,19 @@
-from typing import Optional
-import pygame
+from typing import Optional, Tuple
 from piece import Piece
+from tables import IS_ENEMY, IS_FOOD
 
 class Cell:
     '''棋盘上的一个格子'''
-    def __init__(self,piece: Piece, left, top, size) -> None:
-        # 这个格子上的棋子，初始化的时候必须有棋子
+    def __init__(self,piece: Optional[Piece], row: int, col: int) -> None:
+        # 这个格子上的棋子，None表示开局就是空格子
         self._piece = piece
         # 表示是否可以看到这个格子上的棋子是什么
-        # 因为一开始棋子都是背过去的，所以默认是False
-        self._visible = False
-        # 这个格子的矩形
-        self._rect = pygame.Rect(left, top, size, size)
+        # 因为一开始棋子都是背过去的，所以有棋子的时候默认是False，空格子一开始就是翻开的
+        self._visible = piece is None
+        # 这个格子在棋盘上的行和列
+        # 格子在窗口上的位置由界面层根据行和列去计算，这里不依赖pygame
+        self.row = row
+        self.col = col
 
     @property
     def visible(self) -> bool:
@@ -24,21 +26,26 @@ class Cell:
 
     def meet_enemy(self, cell) -> bool:
         '''参数中的格子是否是本格子的天敌'''
-        return cell.visible and cell._piece and cell._piece.name in self._piece.enemy
+        return cell.visible and cell._piece and IS_ENEMY[self._piece.index][cell._piece.index]
 
     def meet_food(self, cell) -> bool:
         '''参数中的格子是否是本格子的食物'''
-        return cell.visible and cell._piece and cell._piece.name in self._piece.food
+        return cell.visible and cell._piece and IS_FOOD[self._piece.index][cell._piece.index]
 
 
     
-    def get_rect(self) -> pygame.Rect:
-        return self._rect
+    def get_row_col(self) -> Tuple[int, int]:
+        '''返回这个格子的行和列'''
+        return self.row, self.col
 
     def reverse_piece(self) -> None:
         '''把这个格子上的棋子翻过来'''
         self._visible = True
     
+    def cover_piece(self) -> None:
+        '''把这个格子上的棋子翻回去，只在撤销棋步的时候使用'''
+        self._visible = False
+    
     def set_piece(self, piece : Optional[Piece] = None) -> None:
         '''清空这个格子上的棋子或者往上面放一颗棋子'''
         self._piece = piece
@@ -0,0 +1,193 @@
+from typing import List, Optional, Tuple
+
+from position import Position, RED, HIDDEN_BIT, BLUE_BIT, ANIMAL_MASK, score_of
+from tables import SQUARES, ORTHOGONALS, DIAGONALS, AROUND, IS_ENEMY, IS_FOOD
+from settings import (ENEMY_ADJACENT_WEIGHT, FOOD_ADJACENT_WEIGHT, SAME_ADJACENT_WEIGHT,
+                      ENEMY_DIAGONAL_WEIGHT, FOOD_DIAGONAL_WEIGHT, SAME_DIAGONAL_WEIGHT)
+
+# 和strategies.get_board_score一样的估值，只不过是在紧凑局面上计算的
+
+# 走子的时候起点和终点都会变，AFFECTED[起点][终点]是需要重新计算的格子
+AFFECTED = [[tuple(sorted(set(AROUND[start]) | set(AROUND[end]))) for end in range(SQUARES)]
+            for start in range(SQUARES)]
+ALL_SQUARES = tuple(range(SQUARES))
+
+
+def _reaches(squares, animal: int, block: int) -> bool:
+    '''对角线上的动物能不能经过block这个格子：格子是空的，或者上面是它的食物'''
+    code = squares[block]
+    if not code:
+        return True
+    return not code & HIDDEN_BIT and IS_FOOD[animal][code & ANIMAL_MASK]
+
+def get_environment_score(position: Position, index: int) -> float:
+    '''计算这个格子周围的八个格子能给它多少分，和strategies.get_environment_score一致'''
+    squares = position.squares
+    code = squares[index]
+    score = 0
+    if not code:
+        return score
+    animal = code & ANIMAL_MASK
+    color = code & BLUE_BIT
+    my_score = score_of(code)
+    # 先看相邻的
+    for neighbor in ORTHOGONALS[index]:
+        neighbor_code = squares[neighbor]
+        if neighbor_code and not neighbor_code & HIDDEN_BIT and neighbor_code & BLUE_BIT != color:
+            neighbor_animal = neighbor_code & ANIMAL_MASK
+            # 和天敌相邻，减去自身价值的ENEMY_ADJACENT_WEIGHT倍（默认1.5倍）
+            if IS_ENEMY[animal][neighbor_animal]:
+                score -= ENEMY_ADJACENT_WEIGHT*my_score
+            # 和食物相邻，加上食物价值的FOOD_ADJACENT_WEIGHT倍（默认一半）
+            elif IS_FOOD[animal][neighbor_animal]:
+                score += FOOD_ADJACENT_WEIGHT*score_of(neighbor_code)
+            # 和一样的动物相邻，减去自身价值的SAME_ADJACENT_WEIGHT倍（默认一半）
+            elif neighbor_animal == animal:
+                score -= SAME_ADJACENT_WEIGHT*my_score
+    # 再看对角线
+    for neighbor, block1, block2 in DIAGONALS[index]:
+        neighbor_code = squares[neighbor]
+        if neighbor_code and not neighbor_code & HIDDEN_BIT and neighbor_code & BLUE_BIT != color:
+            neighbor_animal = neighbor_code & ANIMAL_MASK
+            # 和天敌对角线，天敌能吃到自己就减去自身价值的ENEMY_DIAGONAL_WEIGHT倍（默认一半）
+            if IS_ENEMY[animal][neighbor_animal]:
+                if _reaches(squares, neighbor_animal, block1) or _reaches(squares, neighbor_animal, block2):
+                    score -= ENEMY_DIAGONAL_WEIGHT*my_score
+            # 和食物对角线，可以到达食物就加上食物价值的FOOD_DIAGONAL_WEIGHT倍（默认1倍）
+            elif IS_FOOD[animal][neighbor_animal]:
+                if _reaches(squares, animal, block1) or _reaches(squares, animal, block2):
+                    score += FOOD_DIAGONAL_WEIGHT*score_of(neighbor_code)
+            elif neighbor_animal == animal:
+                if _reaches(squares, animal, block1) or _reaches(squares, animal, block2):
+                    score += SAME_DIAGONAL_WEIGHT*my_score
+    return score
+
+def get_side_score(position: Position, side: int) -> float:
+    '''计算并返回某一方在整个棋盘的分数，和strategies.get_board_score一致'''
+    score = 0
+    squares = position.squares
+    for index, code in enumerate(squares):
+        if code and not code & HIDDEN_BIT and (code & BLUE_BIT) >> 3 == side:
+            score += get_environment_score(position, index)
+            score += score_of(code)
+    return score
+
+def evaluate(position: Position, side: int) -> float:
+    '''站在side这一方的角度给局面打分：自己的分数减去对方的分数'''
+    return get_side_score(position, side) - get_side_score(position, side ^ 1)
+
+
+class EvaluatedPosition(Position):
+    '''一边走棋一边增量维护估值的局面
+
+    每个格子记下它给所属一方贡献的分数（自身价值加环境分），双方各有一个总分。
+    走一步棋只重新计算起点和终点周围一圈的格子，估值和剩余棋子数都是O(1)就能拿到。
+    '''
+    __slots__ = ('contributions', 'owners', 'totals', 'counts', '_evaluation_history')
+
+    def __init__(self, squares: Optional[bytearray] = None, side: int = RED, not_eat: int = 0) -> None:
+        super().__init__(squares, side, not_eat)
+        # 每个格子贡献的分数和它属于哪一方，-1表示不属于任何一方
+        self.contributions: List[float] = [0.0] * SQUARES
+        self.owners: List[int] = [-1] * SQUARES
+        # 双方的总分，和get_side_score一致
+        self.totals = [0.0, 0.0]
+        # 双方剩下的棋子数，包括没翻开的
+        self.counts = [0, 0]
+        self._evaluation_history: List[tuple] = []
+        self.refresh()
+
+    @classmethod
+    def from_position(cls, position: Position) -> 'EvaluatedPosition':
+        '''从普通的局面生成'''
+        return cls(position.squares, position.side, position.not_eat)
+
+    def copy(self) -> 'EvaluatedPosition':
+        return EvaluatedPosition(self.squares, self.side, self.not_eat)
+
+    def refresh(self) -> None:
+        '''从头计算所有格子的分数和双方的棋子数'''
+        self.totals = [0.0, 0.0]
+        self.counts = list(super().count_pieces())
+        self._update(ALL_SQUARES)
+
+    def _update(self, indexes) -> List[Tuple[int, float, int]]:
+        '''重新计算这些格子的分数，返回变化之前的值，撤销的时候用'''
+        squares = self.squares
+        contributions = self.contributions
+        owners = self.owners
+        totals = self.totals
+        changes = []
+        for index in indexes:
+            code = squares[index]
+            if code and not code & HIDDEN_BIT:
+                owner = (code & BLUE_BIT) >> 3
+                contribution = get_environment_score(self, index) + score_of(code)
+            else:
+                owner = -1
+                contribution = 0.0
+            old_owner = owners[index]
+            old_contribution = contributions[index]
+            if owner == old_owner and contribution == old_contribution:
+                continue
+            changes.append((index, old_contribution, old_owner))
+            if old_owner >= 0:
+                totals[old_owner] -= old_contribution
+            if owner >= 0:
+                totals[owner] += contribution
+            contributions[index] = contribution
+            owners[index] = owner
+        return changes
+
+    def make_move(self, move: Tuple[int, ...]) -> None:
+        squares = self.squares
+        start = move[0]
+        end = move[-1]
+        start_code = squares[start]
+        end_code = squares[end]
+        saved = (tuple(self.totals), self.counts[0], self.counts[1])
+        super().make_move(move)
+        if len(move) == 1:
+            affected = AROUND[start]
+        else:
+            # 被吃掉或者撞死的棋子从棋子数里去掉
+            counts = self.counts
+            if end_code:
+                for code in (start_code, end_code):
+                    counts[(code & BLUE_BIT) >> 3] -= 1
+                for code in (squares[start], squares[end]):
+                    if code:
+                        counts[(code & BLUE_BIT) >> 3] += 1
+            # 大象同归于尽会让所有老鼠贬值，这时候整个棋盘都要重新算
+            affected = ALL_SQUARES if self._history[-1][-1] is not None else AFFECTED[start][end]
+        self._evaluation_history.append((self._update(affected), saved))
+
+    def unmake_move(self) -> None:
+        super().unmake_move()
+        changes, (totals, red_num, blue_num) = self._evaluation_history.pop()
+        contributions = self.contributions
+        owners = self.owners
+        for index, contribution, owner in changes:
+            contributions[index] = contribution
+            owners[index] = owner
+        self.totals[0], self.totals[1] = totals
+        self.counts[0] = red_num
+        self.counts[1] = blue_num
+
+    def swap(self, a: int, b: int) -> None:
+        hidden = self.squares[a] & HIDDEN_BIT and self.squares[b] & HIDDEN_BIT
+        super().swap(a, b)
+        # 没翻开的格子不计分，别的格子也看不到它们下面是什么，交换了估值不变
+        if not hidden:
+            self._update(AFFECTED[a][b])
+
+    def count_pieces(self) -> Tuple[int, int]:
+        return self.counts[0], self.counts[1]
+
+    def side_score(self, side: int) -> float:
+        '''某一方在整个棋盘的分数，和get_side_score一致'''
+        return self.totals[side]
+
+    def evaluate(self, side: int) -> float:
+        '''站在side这一方的角度给局面打分，和evaluate函数一致'''
+        return self.totals[side] - self.totals[side ^ 1]
@@ -0,0 +1,215 @@
+'''电脑思考时的统计：每步的思考时间、估值次数、每秒搜索的节点数、缓存命中率和内存分配
+
+用法：
+    import instrumentation
+    instrumentation.enable()             # 或者enable(allocations=True)同时统计内存分配
+    ...                                  # 正常下棋
+    print(instrumentation.report())
+    instrumentation.disable()
+
+统计是通过在enable的时候把要统计的函数换成计时的版本实现的，disable的时候换回原来的函数，
+所以关掉统计的时候没有任何额外的开销。
+'''
+import sys
+import time
+import tracemalloc
+from functools import wraps
+from typing import Dict, List
+
+
+class Timing:
+    '''一个函数的调用次数和用时，单位是秒'''
+    __slots__ = ('calls', 'total', 'last', 'max')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed: float) -> None:
+        self.calls += 1
+        self.total += elapsed
+        self.last = elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def as_dict(self) -> Dict[str, float]:
+        return {'calls': self.calls, 'total': self.total, 'last': self.last, 'max': self.max,
+                'mean': self.total / self.calls if self.calls else 0.0}
+
+
+# 要统计的函数：(模块名, 类名, 函数名, 统计项的名字, 是不是电脑走一步棋)
+# 类名是None表示模块里的函数
+TARGETS = [
+    ('strategies', None, 'get_best_move', 'get_best_move', True),
+    ('strategies', None, 'get_best_move2', 'get_best_move2', True),
+    ('strategies', None, 'get_search_move', 'get_search_move', True),
+    ('strategies', None, 'get_ismcts_move', 'get_ismcts_move', True),
+    ('strategies', None, 'get_board_score', 'get_board_score', False),
+    ('strategies', None, 'get_environment_score', 'get_environment_score', False),
+    ('board', 'Board', 'get_valid_moves', 'Board.get_valid_moves', False),
+    ('board', 'Board', 'make_move', 'Board.make_move', False),
+    ('search', 'Searcher', 'search', 'Searcher.search', True),
+    ('ismcts', 'ISMCTS', 'search', 'ISMCTS.search', True),
+    ('evaluation', 'EvaluatedPosition', 'evaluate', 'EvaluatedPosition.evaluate', False),
+]
+
+# 是否正在统计
+enabled = False
+# 统计项的名字 -> 用时
+timings: Dict[str, Timing] = {}
+# 所有电脑走棋的思考时间，不管用的是哪个策略
+moves = Timing()
+# 搜索访问过的节点数，和Searcher.search的用时一起算出每秒的节点数
+nodes = 0
+# 被替换掉的原来的函数：(所属的对象, 函数名, 原来的函数)
+_originals: List[tuple] = []
+
+
+def _wrap(function, name: str, is_move: bool):
+    '''返回计时版本的函数'''
+    timing = timings.setdefault(name, Timing())
+    perf_counter = time.perf_counter
+    if not is_move:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            result = function(*args, **kwargs)
+            timing.add(perf_counter() - start)
+            return result
+        return wrapper
+
+    @wraps(function)
+    def move_wrapper(*args, **kwargs):
+        global _move_depth, nodes
+        _move_depth += 1
+        start = perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            _move_depth -= 1
+        elapsed = perf_counter() - start
+        timing.add(elapsed)
+        # get_search_move里面还会调用Searcher.search，只按最外层的调用算一步棋
+        if not _move_depth:
+            moves.add(elapsed)
+        if name == 'Searcher.search':
+            nodes += args[0].nodes
+        return result
+    return move_wrapper
+
+# 正在进行的电脑走棋的嵌套层数
+_move_depth = 0
+
+
+def enable(allocations: bool = False) -> None:
+    '''开始统计；allocations是True的时候同时用tracemalloc统计内存分配，会让程序明显变慢'''
+    global enabled
+    if allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if enabled:
+        return
+    enabled = True
+    import importlib
+    for module_name, class_name, function_name, name, is_move in TARGETS:
+        owner = importlib.import_module(module_name)
+        if class_name is not None:
+            owner = getattr(owner, class_name)
+        original = owner.__dict__[function_name]
+        _originals.append((owner, function_name, original))
+        setattr(owner, function_name, _wrap(original, name, is_move))
+
+def disable() -> None:
+    '''停止统计，换回原来的函数，已经统计到的数据保留'''
+    global enabled
+    for owner, function_name, original in reversed(_originals):
+        setattr(owner, function_name, original)
+    _originals.clear()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    enabled = False
+
+def reset() -> None:
+    '''清空统计到的数据'''
+    global nodes
+    for timing in timings.values():
+        timing.__init__()
+    moves.__init__()
+    nodes = 0
+    if tracemalloc.is_tracing():
+        tracemalloc.clear_traces()
+
+
+def get_cache_stats() -> Dict[str, Dict[str, float]]:
+    '''已经用到的各个缓存的命中率，只看已经导入了的模块，不会因为统计去导入搜索模块'''
+    caches = {}
+    strategies = sys.modules.get('strategies')
+    if strategies is not None and strategies._searcher is not None:
+        caches['transposition'] = strategies._searcher.table.stats()
+    belief = sys.modules.get('belief')
+    if belief is not None:
+        info = belief.get_flip_value.cache_info()
+        lookups = info.hits + info.misses
+        caches['flip_value'] = {'hits': info.hits, 'misses': info.misses, 'size': info.currsize,
+                                'hit_rate': info.hits / lookups if lookups else 0.0}
+    tablebase = sys.modules.get('tablebase')
+    if tablebase is not None and tablebase._tablebase is not None:
+        table = tablebase._tablebase
+        caches['tablebase'] = {'probes': table.probes, 'hits': table.hits,
+                               'hit_rate': table.hits / table.probes if table.probes else 0.0}
+    return caches
+
+def get_allocation_report(limit: int = 10) -> List[str]:
+    '''分配内存最多的几行代码，没有打开内存统计就返回空列表'''
+    if not tracemalloc.is_tracing():
+        return []
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f'traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB']
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    for stat in snapshot.statistics('lineno')[:limit]:
+        frame = stat.traceback[0]
+        lines.append(f'{frame.filename}:{frame.lineno}: {stat.size / 1024:.1f} KiB in {stat.count} blocks')
+    return lines
+
+def snapshot() -> Dict[str, object]:
+    '''当前所有统计数据'''
+    search = timings.get('Searcher.search')
+    evaluations = sum(timings[name].calls for name in ('get_board_score', 'EvaluatedPosition.evaluate')
+                      if name in timings)
+    return {
+        'enabled': enabled,
+        'moves': moves.as_dict(),
+        'evaluations': evaluations,
+        'nodes': nodes,
+        'nodes_per_second': nodes / search.total if search is not None and search.total else 0.0,
+        'timings': {name: timing.as_dict() for name, timing in timings.items() if timing.calls},
+        'caches': get_cache_stats(),
+    }
+
+def get_overlay_lines() -> List[str]:
+    '''界面上显示的简短统计'''
+    data = snapshot()
+    lines = [f'move {moves.last * 1000:.0f}ms (avg {data["moves"]["mean"] * 1000:.0f}ms)  '
+             f'evals {data["evaluations"]}  {data["nodes_per_second"] / 1000:.1f}k nodes/s']
+    caches = '  '.join(f'{name} {cache["hit_rate"]:.0%}' for name, cache in data['caches'].items())
+    if caches:
+        lines.append(caches)
+    return lines
+
+def report(allocations: int = 10) -> str:
+    '''可以直接打印的统计报告'''
+    data = snapshot()
+    lines = [f'moves: {moves.calls}, last {moves.last * 1000:.1f} ms, '
+             f'mean {data["moves"]["mean"] * 1000:.1f} ms, max {moves.max * 1000:.1f} ms',
+             f'evaluations: {data["evaluations"]}, nodes: {nodes} ({data["nodes_per_second"]:.0f}/s)']
+    for name, timing in sorted(data['timings'].items()):
+        lines.append(f'  {name}: {timing["calls"]} calls, {timing["total"] * 1000:.1f} ms, '
+                     f'{timing["mean"] * 1e6:.1f} us/call')
+    for name, cache in data['caches'].items():
+        lines.append(f'  {name} cache: hit rate {cache["hit_rate"]:.1%}')
+    lines.extend(get_allocation_report(allocations))
+    return '\n'.join(lines)
@@ -0,0 +1,187 @@
+import math
+import multiprocessing
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+import settings
+from position import Position, ANIMAL_MASK
+from tables import OUTCOMES, EAT
+
+# 信息集蒙特卡洛树搜索（ISMCTS）
+# 电脑看不到没翻开的棋子是什么，每次模拟之前先把没翻开的棋子随机打乱（确定化），
+# 这样每次模拟的局面都和已经翻开、已经吃掉的棋子一致。
+# 树的节点按照棋步组织，不同确定化下走同一步会走到同一个节点。
+
+Move = Tuple[int, ...]
+
+
+def get_rollout_move(position: Position, rng: random.Random) -> Move:
+    '''模拟时用的走法：和strategies.get_eat_move一样，能吃子就随便吃一个，否则随便走一步'''
+    moves = position.get_valid_moves()
+    squares = position.squares
+    eat_moves = [move for move in moves
+                 if len(move) == 2 and squares[move[1]]
+                 and OUTCOMES[squares[move[0]] & ANIMAL_MASK][squares[move[1]] & ANIMAL_MASK] & EAT]
+    return rng.choice(eat_moves or moves)
+
+def determinize(position: Position, rng: random.Random) -> Position:
+    '''复制局面，并把没翻开的棋子随机换位置'''
+    position = position.copy()
+    hidden = position.hidden_squares()
+    codes = [position.squares[index] for index in hidden]
+    rng.shuffle(codes)
+    for index, code in zip(hidden, codes):
+        position.squares[index] = code
+    return position
+
+def get_reward(position: Position, side: int) -> Optional[float]:
+    '''终局时side这一方的得分：赢是1，平是0.5，输是0；还没结束返回None'''
+    if position.not_eat >= settings.MAX_NOT_EAT:
+        return 0.5
+    counts = position.count_pieces()
+    if counts[0] and counts[1]:
+        return None
+    if counts[side] == counts[side ^ 1]:
+        return 0.5
+    return 1.0 if counts[side] > counts[side ^ 1] else 0.0
+
+
+class Node:
+    '''搜索树的节点，记录走到这里的棋步和走这步的一方的累计得分'''
+    __slots__ = ('move', 'parent', 'side', 'children', 'visits', 'reward', 'availability')
+
+    def __init__(self, move: Optional[Move] = None, parent: Optional['Node'] = None, side: int = 0) -> None:
+        self.move = move
+        self.parent = parent
+        # 走这步棋的一方
+        self.side = side
+        self.children: Dict[Move, 'Node'] = {}
+        self.visits = 0
+        self.reward = 0.0
+        # 这一步在多少次模拟里是合法的，ISMCTS的UCB公式用它代替父节点的访问次数
+        self.availability = 0
+
+    def select_child(self, moves: List[Move], exploration: float) -> 'Node':
+        '''在当前确定化下合法的子节点里按UCB选一个'''
+        best = None
+        best_value = -1.0
+        for move in moves:
+            child = self.children[move]
+            child.availability += 1
+        for move in moves:
+            child = self.children[move]
+            value = child.reward / child.visits + exploration * math.sqrt(math.log(child.availability) / child.visits)
+            if value > best_value:
+                best_value = value
+                best = child
+        return best
+
+
+def run_simulations(packed: int, simulations: Optional[int], time_limit: Optional[float],
+                    seed: int, exploration: float = settings.ISMCTS_EXPLORATION,
+                    rollout_limit: int = settings.ISMCTS_ROLLOUT_LIMIT) -> List[Tuple[Move, int, float]]:
+    '''从packed这个局面做ISMCTS，返回根节点每个棋步的(棋步, 访问次数, 累计得分)
+
+    局面用Position.pack()传进来，方便在别的进程里执行。
+    simulations和time_limit至少要给一个，否则永远停不下来。
+    '''
+    if simulations is None and time_limit is None:
+        raise ValueError('ISMCTS needs a simulation count or a time limit')
+    root_position = Position.unpack(packed)
+    rng = random.Random(seed)
+    root = Node(side=root_position.side ^ 1)
+    deadline = None if time_limit is None else time.perf_counter() + time_limit / 1000
+    done = 0
+    while (simulations is None or done < simulations) and (deadline is None or time.perf_counter() < deadline):
+        done += 1
+        position = determinize(root_position, rng)
+        node = root
+        # 选择：所有合法棋步都展开过了就按UCB往下走
+        while True:
+            if get_reward(position, 0) is not None:
+                break
+            moves = position.get_valid_moves()
+            if not moves:
+                break
+            untried = [move for move in moves if move not in node.children]
+            if untried:
+                # 扩展：随机展开一个还没试过的棋步
+                move = rng.choice(untried)
+                child = Node(move, node, position.side)
+                node.children[move] = child
+                for other in moves:
+                    if other in node.children:
+                        node.children[other].availability += 1
+                position.make_move(move)
+                node = child
+                break
+            node = node.select_child(moves, exploration)
+            position.make_move(node.move)
+        # 模拟：用吃子优先的走法一直下到终局，或者走满rollout_limit步按平局算
+        plies = 0
+        while get_reward(position, 0) is None and plies < rollout_limit:
+            if not position.get_valid_moves():
+                break
+            position.make_move(get_rollout_move(position, rng))
+            plies += 1
+        red_reward = get_reward(position, 0)
+        if red_reward is None:
+            red_reward = 0.5
+        # 反向传播：每个节点记录走这步的一方的得分
+        while node is not None:
+            node.visits += 1
+            node.reward += red_reward if node.side == 0 else 1 - red_reward
+            node = node.parent
+    return [(move, child.visits, child.reward) for move, child in root.children.items()]
+
+
+class ISMCTS:
+    '''信息集蒙特卡洛树搜索，可以用多个进程各自搜索再把根节点的统计合并（根并行）'''
+    def __init__(self,
+                 simulations: Optional[int] = settings.ISMCTS_SIMULATIONS,
+                 time_limit: Optional[float] = settings.ISMCTS_TIME_LIMIT,
+                 workers: int = settings.ISMCTS_WORKERS,
+                 seed: Optional[int] = None) -> None:
+        # 每个进程的模拟次数，None表示不限制
+        self.simulations = simulations
+        # 每步的思考时间，单位是毫秒，None表示不限制
+        self.time_limit = time_limit
+        # 进程数，1表示在当前进程里搜索
+        self.workers = workers
+        self._rng = random.Random(seed)
+        self._pool = None
+        # 最近一次搜索根节点的统计：棋步 -> (访问次数, 累计得分)
+        self.stats: Dict[Move, Tuple[int, float]] = {}
+
+    def search(self, position: Position) -> Optional[Move]:
+        '''返回访问次数最多的棋步，没有棋可走就返回None'''
+        if not position.get_valid_moves():
+            return None
+        packed = position.pack()
+        seeds = [self._rng.getrandbits(32) for _ in range(self.workers)]
+        if self.workers == 1:
+            results = [run_simulations(packed, self.simulations, self.time_limit, seeds[0])]
+        else:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.workers)
+            results = self._pool.starmap(
+                run_simulations, [(packed, self.simulations, self.time_limit, seed) for seed in seeds])
+        # 把各个进程根节点的统计加起来
+        stats: Dict[Move, List[float]] = {}
+        for result in results:
+            for move, visits, reward in result:
+                entry = stats.setdefault(move, [0, 0.0])
+                entry[0] += visits
+                entry[1] += reward
+        self.stats = {move: (int(visits), reward) for move, (visits, reward) in stats.items()}
+        if not self.stats:
+            return position.get_valid_moves()[0]
+        return max(self.stats, key=lambda move: self.stats[move])
+
+    def close(self) -> None:
+        '''关闭进程池'''
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,125 @@
+'''给server.py加压的客户端：开很多个连接同时下棋，玩家一方随机走，统计吞吐量和延迟
+
+用法：python server.py --port 8765 &
+      python loadgen.py --port 8765 -c 32 -n 200 --strategy search --time-limit 50
+'''
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from server import LatencyHistogram
+
+
+class LoadStats:
+    def __init__(self) -> None:
+        self.games = 0
+        self.moves = 0
+        self.busy = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+        self.results: Dict[str, int] = {}
+
+
+def parse_reply(line: bytes) -> Dict[str, str]:
+    '''把OK key=value ...的回复解析成字典，ERR回复抛出RuntimeError'''
+    words = line.decode('ascii').split()
+    if not words or words[0] != 'OK':
+        raise RuntimeError(line.decode('ascii', 'replace').strip() or 'connection closed')
+    return dict(word.split('=', 1) for word in words[1:] if '=' in word)
+
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, command: str,
+                  stats: LoadStats) -> Dict[str, str]:
+    '''发一条命令，服务器忙就稍等重试，返回解析好的回复'''
+    delay = 0.005
+    while True:
+        start = time.perf_counter()
+        writer.write(command.encode('ascii') + b'\n')
+        await writer.drain()
+        line = await reader.readline()
+        stats.latency.add(time.perf_counter() - start)
+        try:
+            return parse_reply(line)
+        except RuntimeError as error:
+            if str(error) != 'ERR busy':
+                raise
+        stats.busy += 1
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+async def run_connection(open_connection, games: List[int], strategy: str, time_limit: float,
+                         rng: random.Random, stats: LoadStats) -> None:
+    '''在一个连接上一局接一局地下，直到games里的名额用完'''
+    reader, writer = await open_connection()
+    try:
+        while games[0] > 0:
+            games[0] -= 1
+            state = await request(reader, writer, f'NEW {strategy} {time_limit:g}', stats)
+            session_id = state['id']
+            while state['result'] == '-':
+                move = rng.choice(state['moves'].split(','))
+                state = await request(reader, writer, f'MOVE {session_id} {move.replace("-", " ")}', stats)
+                stats.moves += 1
+            await request(reader, writer, f'CLOSE {session_id}', stats)
+            stats.games += 1
+            stats.results[state['result']] = stats.results.get(state['result'], 0) + 1
+        writer.write(b'QUIT\n')
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def run_load(host: str, port: int, unix: Optional[str], connections: int, games: int,
+                   strategy: str, time_limit: float, seed: int) -> Tuple[LoadStats, float, Dict[str, object]]:
+    '''返回(客户端的统计, 用时, 服务器的统计)'''
+    if unix:
+        open_connection = lambda: asyncio.open_unix_connection(unix)
+    else:
+        open_connection = lambda: asyncio.open_connection(host, port)
+    stats = LoadStats()
+    remaining = [games]
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_connection(open_connection, remaining, strategy, time_limit,
+                                                    random.Random(seed + index), stats)
+                                     for index in range(connections)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    stats.errors = sum(isinstance(result, Exception) for result in results)
+    reader, writer = await open_connection()
+    writer.write(b'STATS\n')
+    await writer.drain()
+    server_stats = json.loads((await reader.readline()).decode('ascii')[3:])
+    writer.close()
+    return stats, elapsed, server_stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='给对战服务器加压')
+    parser.add_argument('--host', default='127.0.0.1', help='服务器地址')
+    parser.add_argument('--port', type=int, default=8765, help='服务器端口')
+    parser.add_argument('--unix', default=None, help='改为连接这个Unix套接字')
+    parser.add_argument('-c', '--connections', type=int, default=16, help='同时下棋的连接数')
+    parser.add_argument('-n', '--games', type=int, default=100, help='一共下多少局')
+    parser.add_argument('--strategy', default='search', help='电脑用的策略')
+    parser.add_argument('--time-limit', type=float, default=50, help='电脑每步的思考时间（毫秒）')
+    parser.add_argument('--seed', type=int, default=0, help='玩家随机走棋的种子')
+    args = parser.parse_args(argv)
+    stats, elapsed, server_stats = asyncio.run(run_load(
+        args.host, args.port, args.unix, args.connections, args.games,
+        args.strategy, args.time_limit, args.seed))
+    print(f'{stats.games} games, {stats.moves} moves in {elapsed:.1f} s: '
+          f'{stats.games / elapsed:.2f} games/s, {stats.moves / elapsed:.1f} moves/s')
+    print(f'results {stats.results}, busy retries {stats.busy}, failed connections {stats.errors}')
+    latency = stats.latency.as_dict()
+    print(f'client latency: mean {latency["mean"]:.1f} ms, p50 {latency["p50"]:.0f} ms, '
+          f'p90 {latency["p90"]:.0f} ms, p99 {latency["p99"]:.0f} ms, max {latency["max"]:.0f} ms')
+    for name, histogram in server_stats['latency'].items():
+        print(f'server {name}: count {histogram["count"]}, mean {histogram["mean"]:.1f} ms, '
+              f'p50 {histogram["p50"]:.0f} ms, p99 {histogram["p99"]:.0f} ms, buckets {histogram["buckets"]}')
+
+
+if __name__ == '__main__':
+    main()
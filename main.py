@@ -1,3 +1,8 @@
+import time
+# 从这里开始计算启动时间
+START_TIME = time.perf_counter()
+
+import io
 import os
 import sys
 from typing import Tuple
@@ -7,11 +12,24 @@ import pygame
 
 import settings
 from board import Board
-from strategies import get_random_move, get_eat_move,get_best_move,get_best_move2
+from ai_worker import AIWorker
+from renderer import Renderer, render_text
+from assets import load_images
+from records import GameRecord, append_record
+import instrumentation
+
+
+# 电脑想好棋步的时候从后台线程发过来的事件，把主循环从等待里叫醒
+AI_MOVE_READY = pygame.USEREVENT + 1
+# 思考提示里的省略号多久变一次，单位是毫秒
+DOT_INTERVAL = 400
 
 
 def terminate() -> None:
     '''退出游戏'''
+    ai_worker.shutdown()
+    if instrumentation.enabled:
+        print(instrumentation.report())
     pygame.quit()
     sys.exit()
 
@@ -23,57 +41,124 @@ def write_text(font: pygame.font.Font,
                surface: pygame.Surface,
                bg_color = None) -> None:
     ''''写文字'''
-    text_obj = font.render(text,True,color,bg_color)
+    text_obj = render_text(font,text,color,bg_color)
     text_rect = text_obj.get_rect()
     text_rect.centerx = centerx
     text_rect.centery = centery
     surface.blit(text_obj,text_rect)
 
+def create_engine():
+    '''创建电脑用的搜索引擎，第一次轮到电脑的时候才在后台线程里调用，启动的时候不用导入搜索相关的模块'''
+    from strategies import get_searcher
+    return get_searcher()
+
+def report_startup_time() -> None:
+    '''画出第一帧以后输出启动用了多长时间，只输出一次'''
+    global START_TIME
+    if settings.REPORT_STARTUP_TIME and START_TIME is not None:
+        print(f'first frame after {(time.perf_counter() - START_TIME) * 1000:.0f} ms')
+    START_TIME = None
+
+def get_status_text(board: Board, thinking: bool) -> str:
+    '''轮到谁出牌的提示，电脑思考的时候后面加上会动的省略号'''
+    if board.turn == 'red':
+        return '你的回合'
+    if thinking:
+        return '对方思考中' + '.' * (pygame.time.get_ticks() // DOT_INTERVAL % 3 + 1)
+    return "对方回合"
+
+def save_record(board: Board, draw: bool = False) -> None:
+    '''下完一局以后把棋谱追加到settings.RECORD_PATH，写不进去也不影响游戏
+
+    棋谱文件是别的棋盘大小或者别的版本写的时候GameWriter会抛出ValueError，同样跳过。
+    '''
+    if board.record is None:
+        return
+    board.record.finish(*board.get_result(), draw=draw)
+    try:
+        append_record(settings.RECORD_PATH, board.record)
+    except (OSError, ValueError):
+        pass
+
 def play_game() -> Tuple[int,int]:
     '''玩一局游戏，返回游戏最终比分'''
     # 创建棋盘
     board = Board()
-    
+    # 玩家执红，电脑用搜索引擎执蓝
+    if settings.RECORD_PATH:
+        board.record = GameRecord.from_board(board, 'human', 'search')
+    # 电脑的棋步最早什么时候可以走，单位是毫秒，None表示还没开始思考
+    move_time = None
+    # 已经想好、正在标出起点停顿的棋步
+    pending_move = None
+    # 上一个画面是结果页面，整个窗口都要重画
+    renderer.invalidate()
 
     # 监听用户键鼠事件
     while True:
         
-        if board.not_eat >= 20:
+        if board.not_eat >= settings.MAX_NOT_EAT:
+            ai_worker.cancel()
+            save_record(board, draw=True)
             return (0, 0)
         if board.game_over():
+            ai_worker.cancel()
+            save_record(board)
             return board.get_result()
 
-        for event in pygame.event.get():
+        # 轮到电脑就在后台开始思考，界面照常响应；思考至少持续400毫秒，和以前的停顿一样
+        now = pygame.time.get_ticks()
+        # 轮到玩家的时候电脑在后台搜索玩家可能的走法
+        if board.turn == 'red' and settings.PONDER:
+            ai_worker.ponder(board)
+        if board.turn == 'blue' and move_time is None and board.get_valid_moves():
+            ai_worker.request_move(board, lambda future: pygame.event.post(pygame.event.Event(AI_MOVE_READY)))
+            move_time = now + 400
+        if pending_move is None and move_time is not None and now >= move_time:
+            move = ai_worker.poll(board)
+            if move is not None:
+                pending_move = move
+                # 走子之前先把起点格子标出来停顿一下
+                move_time = now + 400 if len(move) == 2 else now
+            elif not ai_worker.busy:
+                # 结果作废了（比如局面已经变了），下一轮重新思考
+                move_time = None
+                continue
+        if pending_move is not None and now >= move_time:
+            board.make_computer_move(pending_move)
+            pending_move = None
+            move_time = None
+            continue
+
+        # 只重画变化了的格子和文字
+        highlights = pending_move[:1] if pending_move is not None and len(pending_move) == 2 else ()
+        renderer.draw(board,
+                      get_status_text(board, ai_worker.busy),
+                      board.get_turn_color(),
+                      highlights,
+                      instrumentation.get_overlay_lines() if instrumentation.enabled else ())
+        report_startup_time()
+
+        # 没有要按时做的事就一直等到有事件，空闲的时候不占CPU
+        timeout = None
+        if move_time is not None:
+            timeout = max(move_time - now, 1)
+            if ai_worker.busy and move_time <= now:
+                # 等电脑想好的时候省略号还要动
+                timeout = DOT_INTERVAL - now % DOT_INTERVAL
+        events = [pygame.event.wait() if timeout is None else pygame.event.wait(timeout)]
+        events.extend(pygame.event.get())
+        for event in events:
             if event.type == pygame.QUIT:
                 terminate()
+            if event.type == pygame.VIDEOEXPOSE:
+                renderer.invalidate()
             if event.type == pygame.MOUSEBUTTONUP:
                 if board.turn == 'red':
                     x,y = event.pos[0],event.pos[1]
                     board.collect_coordinates_and_make_move(x,y)
         
-        window_surface.fill(settings.WHITE)
-        # 绘制棋盘
-        board.draw_board(window_surface,stretched_images)
-        # 绘制轮到谁出牌的提示
-        color = board.get_turn_color()
-        text = '你的回合' if board.turn == 'red' else "对方回合"
-        write_text(big_font,
-                text,
-                color,
-                window_rect.centerx,
-                window_rect.centery+250,
-                window_surface)
-        
-        pygame.display.update()
-        
-        if board.turn == 'blue':
-            valid_moves = board.get_valid_moves()
-            if valid_moves:
-                pygame.time.delay(400)
-                move = get_best_move(valid_moves, board)
-                board.make_computer_move(move, window_surface)
-
-        
+        # 事件很多的时候也不超过settings.FPS帧
         main_clock.tick(settings.FPS)
     
 
@@ -114,14 +199,15 @@ def show_result(player_score, computer_score) -> None:
 def play_again() -> bool:
     '''玩家决定是否再玩一盘'''
     while True:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
+        # 一直等到有事件，等待的时候不占CPU
+        event = pygame.event.wait()
+        if event.type == pygame.QUIT:
+            return False
+        if event.type == pygame.KEYUP:
+            if event.key == pygame.K_ESCAPE:
                 return False
-            if event.type == pygame.KEYUP:
-                if event.key == pygame.K_ESCAPE:
-                    return False
-                else:
-                    return True
+            else:
+                return True
 
 
 if __name__ == "__main__":
@@ -129,17 +215,9 @@ if __name__ == "__main__":
     pygame.init()
     main_clock = pygame.time.Clock()
 
-    # 加载各种图片并且保存到一个字典里面
+    # 加载各种图片并且保存到一个字典里面，缩放好的图片从图集里一次读出来
     icon_image = pygame.image.load(os.path.join(settings.IMAGE_DIR,'bitbug_favicon.ico'))
-    back_image = pygame.image.load(os.path.join(settings.IMAGE_DIR,'问号.jpg'))
-    back_stretched_image = pygame.transform.scale(back_image,(settings.CELL_SIZE,settings.CELL_SIZE))
-    stretched_images = {'back':back_stretched_image}
-    for color in ('red','blue'):
-        for animal in settings.ANIMALS:
-            filename = f'{color}_{animal}'
-            original_image = pygame.image.load(os.path.join(settings.IMAGE_DIR,filename+'.jpg'))
-            stretched_image = pygame.transform.scale(original_image,(settings.CELL_SIZE,settings.CELL_SIZE))
-            stretched_images[filename] = stretched_image
+    stretched_images = load_images()
 
     # 创建窗口
     pygame.display.set_icon(icon_image)
@@ -147,9 +225,21 @@ if __name__ == "__main__":
     window_rect = window_surface.get_rect()
     pygame.display.set_caption('斗兽棋')
     
-    # 创建字体
-    big_font = pygame.font.Font(os.path.join(settings.FONT_DIR,'msyh.ttf'),48)
-    small_font = pygame.font.Font(os.path.join(settings.FONT_DIR,'msyh.ttf'),24)
+    # 创建字体，字体文件只读一次
+    with open(os.path.join(settings.FONT_DIR,'msyh.ttf'),'rb') as font_file:
+        font_data = font_file.read()
+    big_font = pygame.font.Font(io.BytesIO(font_data),48)
+    small_font = pygame.font.Font(io.BytesIO(font_data),24)
+
+    # 电脑在后台线程里思考，窗口在思考的时候也能拖动和关闭
+    ai_worker = AIWorker(create_engine)
+    # 统计电脑思考的情况，显示在窗口上方
+    stats_font = None
+    if settings.SHOW_STATS:
+        instrumentation.enable(settings.STATS_ALLOCATIONS)
+        stats_font = pygame.font.Font(io.BytesIO(font_data),14)
+    # 只重画变化了的地方
+    renderer = Renderer(window_surface, stretched_images, big_font, stats_font)
 
     
     
@@ -11,6 +11,8 @@ class Piece:
         self.color = color
         # 动物的权重
         self.score = SCORES[name]
+        # 动物在ANIMALS里的下标，用来查tables里的表
+        self.index = ANIMALS.index(name)
 
         # 设置动物的天敌和食物
         # 大象和老鼠比较特殊，其他都是按照列表里的顺序排列的
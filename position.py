@@ -0,0 +1,316 @@
+from typing import List, Optional, Tuple
+import random
+
+from tables import ROWS, COLS, SQUARES, NEIGHBORS, OUTCOMES, BOUNCE, TRADE, DEVALUE, MOUSE
+import settings
+
+# 紧凑的局面表示：每个格子用一个字节，再加上轮到谁走和磨棋计数
+# 每个字节的编码方式：
+#   第0-2位：动物在settings.ANIMALS中的下标
+#   第3位：颜色，0是红方，1是蓝方
+#   第4位：棋子还没有翻开
+#   第5位：老鼠已经贬值（分数变成0.5）
+#   第6位：格子上有棋子
+# 空格子（已经翻开且没有棋子）的编码就是0
+ANIMAL_MASK = 0b111
+BLUE_BIT = 1 << 3
+HIDDEN_BIT = 1 << 4
+DEVALUED_BIT = 1 << 5
+OCCUPIED_BIT = 1 << 6
+EMPTY = 0
+
+# 颜色和编号互相转换，0是红方，1是蓝方
+COLORS = ('red', 'blue')
+RED = 0
+BLUE = 1
+
+# 贬值后老鼠的分数
+DEVALUED_SCORE = 0.5
+
+# Zobrist哈希用的随机数，固定种子，保证每次运行得到的哈希值都一样
+_zobrist_random = random.Random(20200926)
+# 没翻开的格子只记“这里有一颗没翻开的棋子”，具体是哪颗棋子记在POOL_KEYS里，
+# 这样没翻开的棋子互相交换位置不会改变哈希值
+# 同一方有重复的动物时（见settings.PIECES），两颗一样的棋子都没翻开，它们的POOL_KEYS会互相抵消，
+# 只是多了一点哈希冲突的机会，置换表里的棋步用之前都会检查是否合法
+HIDDEN_KEYS = [_zobrist_random.getrandbits(64) for _ in range(SQUARES)]
+POOL_KEYS = [_zobrist_random.getrandbits(64) for _ in range(128)]
+# ZOBRIST_KEYS[格子][编码]，空格子是0
+ZOBRIST_KEYS: List[List[int]] = []
+for _index in range(SQUARES):
+    _keys = [0]
+    for _code in range(1, 128):
+        if _code & OCCUPIED_BIT and _code & HIDDEN_BIT:
+            _keys.append(HIDDEN_KEYS[_index] ^ POOL_KEYS[_code])
+        else:
+            _keys.append(_zobrist_random.getrandbits(64))
+    ZOBRIST_KEYS.append(_keys)
+SIDE_KEY = _zobrist_random.getrandbits(64)
+# 磨棋计数的每一档，超过平局线的都算同一档
+NOT_EAT_KEYS = [_zobrist_random.getrandbits(64) for _ in range(settings.MAX_NOT_EAT + 1)]
+
+
+def encode(name: str, color: str, hidden: bool = False, devalued: bool = False) -> int:
+    '''把一颗棋子编码成一个字节'''
+    code = OCCUPIED_BIT | settings.ANIMALS.index(name)
+    if color == 'blue':
+        code |= BLUE_BIT
+    if hidden:
+        code |= HIDDEN_BIT
+    if devalued:
+        code |= DEVALUED_BIT
+    return code
+
+def is_occupied(code: int) -> bool:
+    '''格子上是否有棋子'''
+    return bool(code & OCCUPIED_BIT)
+
+def is_hidden(code: int) -> bool:
+    '''格子上的棋子是否还没翻开'''
+    return bool(code & HIDDEN_BIT)
+
+def is_devalued(code: int) -> bool:
+    '''格子上的棋子是否已经贬值'''
+    return bool(code & DEVALUED_BIT)
+
+def side_of(code: int) -> int:
+    '''棋子属于哪一方，0是红方，1是蓝方'''
+    return (code & BLUE_BIT) >> 3
+
+def animal_of(code: int) -> int:
+    '''棋子是哪种动物，返回它在ANIMALS中的下标'''
+    return code & ANIMAL_MASK
+
+def name_of(code: int) -> str:
+    '''棋子的动物名字'''
+    return settings.ANIMALS[code & ANIMAL_MASK]
+
+def color_of(code: int) -> str:
+    '''棋子的颜色名字'''
+    return COLORS[(code & BLUE_BIT) >> 3]
+
+def score_of(code: int) -> float:
+    '''棋子当前的分数'''
+    if code & DEVALUED_BIT:
+        return DEVALUED_SCORE
+    return settings.SCORES[settings.ANIMALS[code & ANIMAL_MASK]]
+
+def index_of(row: int, col: int) -> int:
+    '''行和列转成格子下标'''
+    return row * COLS + col
+
+def row_col_of(index: int) -> Tuple[int, int]:
+    '''格子下标转成行和列'''
+    return divmod(index, COLS)
+
+
+class Position:
+    '''紧凑的局面，不依赖Cell、Piece和pygame，可以很便宜地复制'''
+    __slots__ = ('squares', 'side', 'not_eat', 'key', '_history')
+
+    def __init__(self, squares: Optional[bytearray] = None, side: int = RED, not_eat: int = 0) -> None:
+        # 每个格子的编码
+        self.squares = bytearray(SQUARES) if squares is None else bytearray(squares)
+        # 轮到哪一方走棋
+        self.side = side
+        # 连续没有吃子的步数
+        self.not_eat = not_eat
+        # Zobrist哈希值，走棋的时候增量更新
+        self.key = self.compute_key()
+        # 撤销棋步用的日志
+        self._history: List[tuple] = []
+
+    def compute_key(self) -> int:
+        '''从头计算Zobrist哈希值'''
+        key = SIDE_KEY if self.side else 0
+        key ^= NOT_EAT_KEYS[min(self.not_eat, settings.MAX_NOT_EAT)]
+        for index, code in enumerate(self.squares):
+            key ^= ZOBRIST_KEYS[index][code]
+        return key
+
+    @property
+    def turn(self) -> str:
+        '''和Board.turn一样，返回'red'或者'blue\''''
+        return COLORS[self.side]
+
+    @classmethod
+    def from_board(cls, board) -> 'Position':
+        '''从Board生成紧凑局面'''
+        squares = bytearray(SQUARES)
+        for row in range(ROWS):
+            for col in range(COLS):
+                cell = board.get_cell_by_row_col(row, col)
+                piece = cell.get_piece()
+                if piece:
+                    squares[row * COLS + col] = encode(
+                        piece.name,
+                        piece.color,
+                        hidden=not cell.visible,
+                        devalued=piece.score != settings.SCORES[piece.name])
+        return cls(squares, COLORS.index(board.turn), board.not_eat)
+
+    def to_board(self):
+        '''还原成Board，和from_board互为逆操作'''
+        from board import Board
+        return Board.from_position(self)
+
+    def copy(self) -> 'Position':
+        '''复制局面，只需要复制一个很短的字节数组'''
+        return Position(self.squares, self.side, self.not_eat)
+
+    def pack(self) -> int:
+        '''把整个局面打包成一个整数，可以用作字典的键'''
+        return (int.from_bytes(self.squares, 'little') << 16) | (self.not_eat << 1) | self.side
+
+    @classmethod
+    def unpack(cls, packed: int) -> 'Position':
+        '''把pack的结果还原成局面'''
+        squares = bytearray((packed >> 16).to_bytes(SQUARES, 'little'))
+        return cls(squares, packed & 1, (packed >> 1) & 0x7fff)
+
+    def get(self, row: int, col: int) -> int:
+        '''获取某一行某一列的格子编码'''
+        return self.squares[row * COLS + col]
+
+    def count_pieces(self) -> Tuple[int, int]:
+        '''返回红方和蓝方剩下的棋子数，包括还没翻开的'''
+        counts = [0, 0]
+        for code in self.squares:
+            if code:
+                counts[(code & BLUE_BIT) >> 3] += 1
+        return counts[0], counts[1]
+
+    def hidden_squares(self) -> List[int]:
+        '''所有还没翻开的格子下标'''
+        return [i for i, code in enumerate(self.squares) if code & HIDDEN_BIT]
+
+    def game_over(self) -> bool:
+        '''是否有一方的动物死绝了，和Board.game_over一致'''
+        red_num, blue_num = self.count_pieces()
+        return red_num == 0 or blue_num == 0
+
+    def get_valid_moves(self) -> List[Tuple[int, ...]]:
+        '''获取所有有效的棋步，翻棋是(格子,)，走子是(起点,终点)'''
+        squares = self.squares
+        side = self.side
+        valid_moves = []
+        for start, code in enumerate(squares):
+            if not code:
+                continue
+            if code & HIDDEN_BIT:
+                valid_moves.append((start,))
+            elif (code & BLUE_BIT) >> 3 == side:
+                for end in NEIGHBORS[start]:
+                    end_code = squares[end]
+                    # 终点必须是翻开的空格子或者对方的棋子
+                    if not end_code or (not end_code & HIDDEN_BIT and (end_code & BLUE_BIT) >> 3 != side):
+                        valid_moves.append((start, end))
+        return valid_moves
+
+    def make_move(self, move: Tuple[int, ...]) -> None:
+        '''可撤销地走一步棋，规则和Board.make_move_by_cell一致，走完交出出牌权'''
+        squares = self.squares
+        start = move[0]
+        start_code = squares[start]
+        key = self.key ^ SIDE_KEY
+        if len(move) == 1:
+            self._history.append((start, start_code, start, start_code, self.not_eat, self.key, None))
+            squares[start] = start_code & ~HIDDEN_BIT
+            keys = ZOBRIST_KEYS[start]
+            self.key = key ^ keys[start_code] ^ keys[squares[start]]
+            self.side ^= 1
+            return
+        end = move[1]
+        end_code = squares[end]
+        # 大象同归于尽会让所有老鼠贬值，这时候把整个数组存下来
+        saved = None
+        not_eat = self.not_eat
+        if not end_code:
+            squares[start] = EMPTY
+            squares[end] = start_code
+            self.not_eat += 1
+        else:
+            outcome = OUTCOMES[start_code & ANIMAL_MASK][end_code & ANIMAL_MASK]
+            # 分值一样，同归于尽
+            if outcome & TRADE:
+                # 两个大象同归于尽，两方的老鼠都贬值
+                if outcome & DEVALUE:
+                    saved = bytes(squares)
+                    for i, code in enumerate(squares):
+                        if code and code & ANIMAL_MASK == MOUSE:
+                            squares[i] = code | DEVALUED_BIT
+                squares[start] = EMPTY
+                squares[end] = EMPTY
+            # 往天敌身上走，自杀
+            elif outcome & BOUNCE:
+                # 大象往老鼠身上撞，老鼠贬值
+                if outcome & DEVALUE:
+                    squares[end] = end_code | DEVALUED_BIT
+                squares[start] = EMPTY
+            # 往食物身上走，吃掉对方
+            else:
+                squares[start] = EMPTY
+                # 老鼠吃掉大象，老鼠贬值
+                squares[end] = start_code | DEVALUED_BIT if outcome & DEVALUE else start_code
+            self.not_eat = 0
+        self._history.append((start, start_code, end, end_code, not_eat, self.key, saved))
+        if saved is not None:
+            self.side ^= 1
+            self.key = self.compute_key()
+            return
+        start_keys = ZOBRIST_KEYS[start]
+        end_keys = ZOBRIST_KEYS[end]
+        key ^= start_keys[start_code] ^ start_keys[squares[start]] ^ end_keys[end_code] ^ end_keys[squares[end]]
+        if self.not_eat != not_eat:
+            key ^= NOT_EAT_KEYS[min(not_eat, settings.MAX_NOT_EAT)] ^ NOT_EAT_KEYS[min(self.not_eat, settings.MAX_NOT_EAT)]
+        self.key = key
+        self.side ^= 1
+
+    def unmake_move(self) -> None:
+        '''撤销最近一次用make_move走的棋'''
+        start, start_code, end, end_code, not_eat, key, saved = self._history.pop()
+        squares = self.squares
+        if saved is not None:
+            squares[:] = saved
+        else:
+            squares[end] = end_code
+            squares[start] = start_code
+        self.not_eat = not_eat
+        self.key = key
+        self.side ^= 1
+
+    def swap(self, a: int, b: int) -> None:
+        '''交换两个格子的内容，搜索时用来假设翻开的格子下面是另一颗没翻开的棋子'''
+        squares = self.squares
+        code_a = squares[a]
+        code_b = squares[b]
+        squares[a] = code_b
+        squares[b] = code_a
+        keys_a = ZOBRIST_KEYS[a]
+        keys_b = ZOBRIST_KEYS[b]
+        self.key ^= keys_a[code_a] ^ keys_a[code_b] ^ keys_b[code_b] ^ keys_b[code_a]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Position):
+            return NotImplemented
+        return self.squares == other.squares and self.side == other.side and self.not_eat == other.not_eat
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        rows = []
+        for row in range(ROWS):
+            names = []
+            for col in range(COLS):
+                code = self.squares[row * COLS + col]
+                if not code:
+                    names.append('.')
+                else:
+                    name = f'{color_of(code)[0]}:{name_of(code)}'
+                    if code & HIDDEN_BIT:
+                        name = f'?{name}'
+                    if code & DEVALUED_BIT:
+                        name += '*'
+                    names.append(name)
+            rows.append(' '.join(names))
+        return f'Position(turn={self.turn}, not_eat={self.not_eat})\n' + '\n'.join(rows)
@@ -0,0 +1,326 @@
+'''紧凑的二进制棋谱：记录界面里和后台对战下的每一局棋，用内存映射逐局读取，一遍扫描做统计
+
+文件格式：开头是8字节的文件头（MAGIC和版本号），后面一局接一局地存放棋谱，每局是
+    14字节的对局头：开局布置（8字节，每个格子4位：动物3位加颜色1位）、
+                    标志（第0位是蓝方先走，第1、2位是结果）、红方和蓝方的棋手编号、
+                    结束时双方剩下的棋子数（各4位）、步数（2字节）
+    每步1字节：高4位是起点，低4位是终点，翻棋的起点和终点相同
+一局大约六七十字节，几百万局也只有几百MB，读的时候用mmap，不会把整个文件读进内存。
+
+上面是标准的4x4棋盘、开局摆满棋子时的格式（版本1）。别的棋盘（见settings.ROWS、COLS和PIECES）用版本2：
+文件头后面多2字节记下行数和列数；开局布置每个格子1字节（0是空格子），剩下的棋子数各1字节，
+每步2字节（起点、终点）。只能读写和当前设置一样大的棋盘的棋谱。
+
+用法：python records.py games.bin [more.bin ...]    统计胜率、第一步翻棋的结果和对局长度
+'''
+import argparse
+import mmap
+import os
+import struct
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from position import Position, encode, name_of, side_of, HIDDEN_BIT, ANIMAL_MASK, COLORS
+from tables import ROWS, COLS, SQUARES
+import settings
+
+MAGIC = b'ACGR'
+FILE_HEADER = struct.Struct('<4sI')
+# 标准棋盘用紧凑的版本1，别的棋盘用版本2
+COMPACT = SQUARES == 16 and 2 * len(settings.PIECES) == SQUARES
+if COMPACT:
+    VERSION = 1
+    RECORD_HEADER = struct.Struct('<8sBBBBH')
+    MOVE_BYTES = 1
+else:
+    if SQUARES > 255:
+        raise ValueError('the board has too many squares for the game record format')
+    VERSION = 2
+    # 版本2的文件头后面记下棋盘的行数和列数
+    GEOMETRY = struct.Struct('<BB')
+    RECORD_HEADER = struct.Struct(f'<{SQUARES}sBBBBBH')
+    MOVE_BYTES = 2
+# 文件开头的字节
+_HEADER_BYTES = FILE_HEADER.pack(MAGIC, VERSION) + (b'' if COMPACT else GEOMETRY.pack(ROWS, COLS))
+
+# 棋手编号，只能在末尾添加，不然以前的棋谱会读错
+PLAYERS = ('human', 'random', 'eat', 'best', 'best2', 'search', 'ismcts', 'net')
+
+# 对局结果，存在标志的第1、2位
+UNFINISHED = 0
+RED_WIN = 1
+BLUE_WIN = 2
+DRAW = 3
+RESULT_NAMES = ('unfinished', 'red', 'blue', 'draw')
+
+
+def encode_move(move: Tuple[int, ...]) -> bytes:
+    '''把格子下标表示的棋步编码成MOVE_BYTES个字节'''
+    if COMPACT:
+        return bytes((move[0] << 4 | move[-1],))
+    return bytes((move[0], move[-1]))
+
+def decode_move(data) -> Tuple[int, ...]:
+    '''encode_move的逆操作'''
+    if COMPACT:
+        start, end = data[0] >> 4, data[0] & 15
+    else:
+        start, end = data[0], data[1]
+    return (start,) if start == end else (start, end)
+
+
+class GameRecord:
+    '''一局棋的棋谱'''
+    def __init__(self, layout: bytes, first: int, red: str, blue: str) -> None:
+        # 开局时每个格子上的棋子编码，不带HIDDEN_BIT，空格子是0
+        self.layout = bytes(layout)
+        # 先走的一方，0是红方，1是蓝方
+        self.first = first
+        # 双方棋手的名字，必须在PLAYERS里
+        self.red = red
+        self.blue = blue
+        # 每步棋用encode_move编码
+        self.moves = bytearray()
+        self.result = UNFINISHED
+        # 结束时双方剩下的棋子数
+        self.red_num = 0
+        self.blue_num = 0
+
+    @classmethod
+    def from_board(cls, board, red: str, blue: str) -> 'GameRecord':
+        '''从刚摆好、还没走过棋的棋盘开始记录'''
+        position = board.to_position()
+        layout = bytes(code & ~HIDDEN_BIT for code in position.squares)
+        return cls(layout, position.side, red, blue)
+
+    @property
+    def plies(self) -> int:
+        return len(self.moves) // MOVE_BYTES
+
+    def add_move(self, move: Tuple[int, ...]) -> None:
+        self.moves += encode_move(move)
+
+    def finish(self, red_num: int, blue_num: int, draw: bool = False) -> None:
+        '''记下结果；draw是True表示磨棋磨到了平局，不看剩下的棋子数'''
+        self.red_num = red_num
+        self.blue_num = blue_num
+        if draw or red_num == blue_num:
+            self.result = DRAW
+        else:
+            self.result = RED_WIN if red_num > blue_num else BLUE_WIN
+
+    @property
+    def winner(self) -> Optional[str]:
+        '''赢的一方的颜色，平局或者没下完是None'''
+        if self.result == RED_WIN:
+            return 'red'
+        if self.result == BLUE_WIN:
+            return 'blue'
+        return None
+
+    def iter_moves(self) -> Iterator[Tuple[int, ...]]:
+        moves = self.moves
+        return (decode_move(moves[i:i + MOVE_BYTES]) for i in range(0, len(moves), MOVE_BYTES))
+
+    def initial_position(self) -> Position:
+        '''开局的局面，所有棋子都没翻开'''
+        return Position(bytearray(code | HIDDEN_BIT if code else 0 for code in self.layout), side=self.first)
+
+    def replay(self) -> Iterator[Tuple[object, Tuple[int, ...]]]:
+        '''从开局开始重放，每步之前产生(棋盘, 这一步)，棋盘是同一个对象'''
+        board = self.initial_position().to_board()
+        for move in self.iter_moves():
+            yield board, move
+            board.make_computer_move(tuple(board.get_cell_by_index(index) for index in move))
+
+    def to_bytes(self) -> bytes:
+        flags = self.first | self.result << 1
+        players = (PLAYERS.index(self.red), PLAYERS.index(self.blue))
+        if COMPACT:
+            layout = bytes(self.layout[i] << 4 & 0xf0 | self.layout[i + 1] & 15 for i in range(0, SQUARES, 2))
+            header = RECORD_HEADER.pack(layout, flags, *players, self.red_num << 4 | self.blue_num, self.plies)
+        else:
+            header = RECORD_HEADER.pack(self.layout, flags, *players, self.red_num, self.blue_num, self.plies)
+        return header + self.moves
+
+    @classmethod
+    def from_buffer(cls, buffer, offset: int = 0) -> Tuple['GameRecord', int]:
+        '''从buffer的offset处读出一局，返回棋谱和下一局的位置'''
+        if COMPACT:
+            packed, flags, red, blue, counts, plies = RECORD_HEADER.unpack_from(buffer, offset)
+            layout = b''.join([_UNPACKED_PAIRS[byte] for byte in packed])
+            red_num, blue_num = counts >> 4, counts & 15
+        else:
+            layout, flags, red, blue, red_num, blue_num, plies = RECORD_HEADER.unpack_from(buffer, offset)
+        record = cls(layout, flags & 1, PLAYERS[red], PLAYERS[blue])
+        record.result = flags >> 1 & 3
+        record.red_num = red_num
+        record.blue_num = blue_num
+        start = offset + RECORD_HEADER.size
+        end = start + plies * MOVE_BYTES
+        record.moves = bytearray(buffer[start:end])
+        if len(record.moves) != end - start:
+            raise ValueError('truncated game record')
+        return record, end
+
+    def __repr__(self) -> str:
+        return (f'GameRecord(red={self.red!r}, blue={self.blue!r}, first={COLORS[self.first]}, '
+                f'result={RESULT_NAMES[self.result]}, plies={self.plies})')
+
+def _unpack_code(nibble: int) -> int:
+    '''开局布置里的4位棋子编码还原成Position的编码'''
+    return encode(settings.ANIMALS[nibble & ANIMAL_MASK], COLORS[nibble >> 3])
+
+# 开局布置里的1个字节 -> 两个格子的编码，读几百万局的时候查表快得多
+_UNPACKED_PAIRS = [bytes((_unpack_code(byte >> 4), _unpack_code(byte & 15))) for byte in range(256)]
+
+
+class GameWriter:
+    '''往棋谱文件末尾追加对局，文件不存在就创建'''
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(_HEADER_BYTES)
+        else:
+            # 文件是别的版本或者别的棋盘写的就不能往里追加，先关掉文件再把错误抛出去
+            try:
+                with open(path, 'rb') as f:
+                    _check_file_header(path, f.read(len(_HEADER_BYTES)))
+            except BaseException:
+                self._file.close()
+                raise
+
+    def write(self, record: GameRecord) -> None:
+        self._file.write(record.to_bytes())
+
+    def write_bytes(self, data: bytes) -> None:
+        '''写入GameRecord.to_bytes()的结果，别的进程编码好的棋谱直接写进去'''
+        self._file.write(data)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> 'GameWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def append_record(path: str, record: GameRecord) -> None:
+    '''把一局追加到棋谱文件里'''
+    with GameWriter(path) as writer:
+        writer.write(record)
+
+
+def _check_file_header(path: str, data) -> None:
+    '''文件头和当前的棋盘对不上就抛出ValueError'''
+    if data[:len(_HEADER_BYTES)] != _HEADER_BYTES:
+        raise ValueError(f'{path} is not a version {VERSION} game record file for a {ROWS}x{COLS} board '
+                         f'with {len(settings.PIECES)} pieces a side')
+
+
+def read_records(path: str) -> Iterator[GameRecord]:
+    '''用内存映射逐局读出棋谱文件里的对局，最后一局没写完整就忽略'''
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < len(_HEADER_BYTES):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            _check_file_header(path, buffer)
+            offset = len(_HEADER_BYTES)
+            end = len(buffer) - RECORD_HEADER.size
+            while offset <= end:
+                try:
+                    record, offset = GameRecord.from_buffer(buffer, offset)
+                except ValueError:
+                    break
+                yield record
+
+
+class GameStats:
+    '''一遍扫描累计的统计'''
+    def __init__(self) -> None:
+        self.games = 0
+        # 棋手 -> [胜, 平, 负]，两种颜色合在一起
+        self.players: Dict[str, List[int]] = {}
+        # (第一步翻出来的动物, 是不是先走一方自己的棋子) -> 先走一方的[胜, 平, 负]
+        self.first_flips: Dict[Tuple[str, bool], List[int]] = {}
+        # 步数 -> 局数
+        self.lengths: Counter = Counter()
+        self.unfinished = 0
+
+    def add(self, record: GameRecord) -> None:
+        if record.result == UNFINISHED:
+            self.unfinished += 1
+            return
+        self.games += 1
+        self.lengths[record.plies] += 1
+        for side, player in enumerate((record.red, record.blue)):
+            self.players.setdefault(player, [0, 0, 0])[_outcome(record, side)] += 1
+        if record.moves:
+            square = decode_move(record.moves[:MOVE_BYTES])[0]
+            code = record.layout[square]
+            key = (name_of(code), side_of(code) == record.first)
+            self.first_flips.setdefault(key, [0, 0, 0])[_outcome(record, record.first)] += 1
+
+    def report(self, buckets: int = 10) -> str:
+        lines = [f'{self.games} games' + (f' ({self.unfinished} unfinished skipped)' if self.unfinished else '')]
+        if not self.games:
+            return '\n'.join(lines)
+        lines.append('')
+        lines.append('win rate by player:')
+        for player, (wins, draws, losses) in sorted(self.players.items()):
+            total = wins + draws + losses
+            lines.append(f'  {player:8s} {total:8d} games  +{wins} ={draws} -{losses}  '
+                         f'score {(wins + draws / 2) / total:.3f}')
+        lines.append('')
+        lines.append('first flip (score of the side that flipped):')
+        for (name, own), (wins, draws, losses) in sorted(self.first_flips.items(),
+                                                         key=lambda item: (settings.ANIMALS.index(item[0][0]), not item[0][1])):
+            total = wins + draws + losses
+            lines.append(f'  {name:8s} {"own" if own else "theirs":6s} {total:8d} games  '
+                         f'score {(wins + draws / 2) / total:.3f}')
+        lines.append('')
+        lengths = sorted(self.lengths.elements())
+        lines.append(f'game length: min {lengths[0]}, median {lengths[len(lengths) // 2]}, '
+                     f'mean {sum(lengths) / len(lengths):.1f}, max {lengths[-1]}')
+        width = max(1, -(-(lengths[-1] + 1) // buckets))
+        histogram: Counter = Counter()
+        for plies, count in self.lengths.items():
+            histogram[plies // width] += count
+        peak = max(histogram.values())
+        for bucket in range(lengths[0] // width, lengths[-1] // width + 1):
+            count = histogram[bucket]
+            lines.append(f'  {bucket * width:4d}-{bucket * width + width - 1:<4d} {count:8d} '
+                         + '#' * round(40 * count / peak))
+        return '\n'.join(lines)
+
+def _outcome(record: GameRecord, side: int) -> int:
+    '''side这一方的结果在[胜, 平, 负]里的下标'''
+    if record.result == DRAW:
+        return 1
+    return 0 if record.result - 1 == side else 2
+
+def analyze(paths: Iterable[str]) -> GameStats:
+    stats = GameStats()
+    for path in paths:
+        for record in read_records(path):
+            stats.add(record)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='统计棋谱文件')
+    parser.add_argument('paths', nargs='+', help='棋谱文件')
+    parser.add_argument('--buckets', type=int, default=10, help='对局长度分成几段显示')
+    args = parser.parse_args(argv)
+    print(analyze(args.paths).report(args.buckets))
+
+
+if __name__ == '__main__':
+    main()
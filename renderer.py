@@ -0,0 +1,142 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pygame
+
+import settings
+from board import Board
+from cell import Cell
+
+# 只重画变化了的地方：记住每个格子和提示文字上次画成什么样，
+# 和这一帧要画的不一样才重画，并且只把这些矩形提交给显示器
+
+
+# 渲染过的文字：(字体, 文字, 颜色, 背景色) -> Surface
+_text_cache: Dict[Tuple[int, str, Tuple[int,int,int], Optional[Tuple[int,int,int]]], pygame.Surface] = {}
+
+def render_text(font: pygame.font.Font,
+                text: str,
+                color: Tuple[int,int,int],
+                bg_color = None) -> pygame.Surface:
+    '''渲染文字，同样的文字只渲染一次'''
+    key = (id(font), text, color, bg_color)
+    text_obj = _text_cache.get(key)
+    if text_obj is None:
+        text_obj = font.render(text,True,color,bg_color)
+        _text_cache[key] = text_obj
+    return text_obj
+
+def get_cell_rect(cell: Cell) -> pygame.Rect:
+    '''根据格子的行和列算出它在窗口上的矩形'''
+    return pygame.Rect(settings.LEFT_OF_BOARD + cell.col*settings.CELL_SIZE,
+                       settings.TOP_OF_BOARD + cell.row*settings.CELL_SIZE,
+                       settings.CELL_SIZE,
+                       settings.CELL_SIZE)
+
+def get_cell_image(cell: Cell) -> Optional[str]:
+    '''格子应该画哪张图片：没翻开是back，有棋子是棋子图片的名字，空格子是None'''
+    if not cell.visible:
+        return 'back'
+    piece = cell.get_piece()
+    if piece:
+        return f'{piece.color}_{piece.name}'
+    return None
+
+
+class Renderer:
+    '''负责画对局界面，只重画和上一帧不一样的格子和文字'''
+    def __init__(self, surface: pygame.Surface, images: Dict[str,pygame.Surface], font: pygame.font.Font,
+                 overlay_font: Optional[pygame.font.Font] = None) -> None:
+        self.surface = surface
+        self.images = images
+        self.font = font
+        # 显示统计信息用的小字体，None表示不显示
+        self.overlay_font = overlay_font
+        # 每个格子上次画成的样子：(图片名字, 是否高亮)，None表示还没画过
+        self._cells: List[Optional[Tuple[Optional[str], bool]]] = []
+        # 上次画的提示文字和它占的矩形
+        self._text: Optional[Tuple[str, Tuple[int,int,int]]] = None
+        self._text_rect: Optional[pygame.Rect] = None
+        # 上次画的统计信息和它们占的矩形
+        self._overlay: Tuple[str, ...] = ()
+        self._overlay_rects: List[pygame.Rect] = []
+        # 整个窗口都要重画
+        self._full = True
+
+    def invalidate(self) -> None:
+        '''下一次draw重画整个窗口，换了一局或者窗口被别的画面盖住以后调用'''
+        self._full = True
+
+    def draw(self, board: Board, text: str, color: Tuple[int,int,int],
+             highlights: Iterable[Cell] = (), overlay: Sequence[str] = ()) -> List[pygame.Rect]:
+        '''画棋盘、提示文字和统计信息，返回这次重画了的矩形，没有变化就什么都不做'''
+        highlighted = set(id(cell) for cell in highlights)
+        if board.user_coordinates:
+            highlighted.add(id(board.get_cell_by_coordinates(*board.user_coordinates)))
+        dirty = []
+        if self._full:
+            self.surface.fill(settings.WHITE)
+            self._cells = []
+            self._text = None
+            self._text_rect = None
+            self._overlay = ()
+            self._overlay_rects = []
+            dirty.append(self.surface.get_rect())
+        # 格子
+        for index, cell in enumerate(board.iter_cells()):
+            state = (get_cell_image(cell), id(cell) in highlighted)
+            if index < len(self._cells):
+                if self._cells[index] == state:
+                    continue
+                self._cells[index] = state
+            else:
+                self._cells.append(state)
+            dirty.append(self._draw_cell(cell, *state))
+        # 提示文字
+        if self._text != (text, color):
+            self._text = (text, color)
+            if self._text_rect is not None:
+                self.surface.fill(settings.WHITE, self._text_rect)
+                dirty.append(self._text_rect)
+            text_obj = render_text(self.font, text, color)
+            text_rect = text_obj.get_rect()
+            text_rect.centerx = self.surface.get_rect().centerx
+            text_rect.centery = settings.TOP_OF_BOARD + settings.BOARD_HEIGHT + 60
+            self.surface.blit(text_obj,text_rect)
+            self._text_rect = text_rect
+            dirty.append(text_rect)
+        # 统计信息，画在棋盘上方的空白里
+        overlay = tuple(overlay)
+        if self.overlay_font is not None and overlay != self._overlay:
+            self._overlay = overlay
+            for rect in self._overlay_rects:
+                self.surface.fill(settings.WHITE, rect)
+            dirty.extend(self._overlay_rects)
+            self._overlay_rects = []
+            top = 4
+            for line in overlay:
+                # 数字一直在变，不放进文字缓存
+                text_obj = self.overlay_font.render(line,True,settings.BLACK)
+                rect = self.surface.blit(text_obj,(settings.LEFT_OF_BOARD, top))
+                self._overlay_rects.append(rect)
+                top += rect.height
+            dirty.extend(self._overlay_rects)
+        if self._full:
+            self._full = False
+            pygame.display.update()
+        elif dirty:
+            pygame.display.update(dirty)
+        return dirty
+
+    def _draw_cell(self, cell: Cell, image: Optional[str], highlighted: bool) -> pygame.Rect:
+        '''画一个格子，返回它的矩形'''
+        cell_rect = get_cell_rect(cell)
+        # 不可见就绘制问号图片，有棋子就绘制棋子图片
+        if image is not None:
+            self.surface.blit(self.images[image], cell_rect)
+        # 没有棋子就绘制绿色正方形
+        else:
+            pygame.draw.rect(self.surface,settings.SEA_GREEN,cell_rect)
+            pygame.draw.rect(self.surface,settings.BLACK,cell_rect,1)
+        if highlighted:
+            pygame.draw.rect(self.surface,settings.YELLOW,cell_rect,2)
+        return cell_rect
@@ -0,0 +1,343 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import settings
+from position import Position, HIDDEN_BIT, ANIMAL_MASK, score_of
+from tables import OUTCOMES, TRADE, BOUNCE
+from evaluation import EvaluatedPosition
+from transposition import TranspositionTable, EXACT, LOWER, UPPER, encode_move, decode_move
+from tablebase import Tablebase, get_tablebase
+
+# 胜负的分数，比任何估值都大得多
+WIN_SCORE = 10000
+# 超过这个分数的都是分出胜负的分数，存进置换表的时候要去掉和层数有关的部分
+WIN_THRESHOLD = WIN_SCORE - 1000
+INFINITY = float('inf')
+# 残局库查出来的胜负不知道要走几步，比实际分出胜负的分数小一些
+TABLEBASE_WIN_SCORE = WIN_SCORE - 500
+# 后台搜索的结果至少要搜到这么深才能直接拿来走
+PONDER_MIN_DEPTH = 3
+# 后台搜索最多同时考虑对手的几种走法（翻棋的话是翻出的几种棋子）
+PONDER_CANDIDATES = 16
+
+
+class SearchTimeout(Exception):
+    '''搜索用完了时间或者节点预算'''
+
+
+def get_move_order_score(position: Position, move: Tuple[int, ...]) -> float:
+    '''给棋步排序用的分数，越大越先搜索'''
+    # 翻棋要展开机会节点，代价最大，放在走子后面
+    if len(move) == 1:
+        return 0
+    squares = position.squares
+    start_code = squares[move[0]]
+    end_code = squares[move[1]]
+    if not end_code:
+        return 10
+    outcome = OUTCOMES[start_code & ANIMAL_MASK][end_code & ANIMAL_MASK]
+    # 同归于尽
+    if outcome & TRADE:
+        return 50 + score_of(end_code)
+    # 往天敌身上撞，最后再看
+    if outcome & BOUNCE:
+        return -100
+    # 吃子：对方越值钱越好，自己越不值钱越好
+    return 100 + 10*score_of(end_code) - score_of(start_code)
+
+
+class Searcher:
+    '''期望极小化极大搜索
+
+    走子的一层用alpha-beta剪枝；翻棋是机会节点，按照所有还没翻开的棋子的分布加权平均。
+    用迭代加深在给定的时间或节点预算内搜索，返回最后一次完整搜完的那一层选出的最好棋步。
+    '''
+    def __init__(self,
+                 time_limit: Optional[float] = settings.SEARCH_TIME_LIMIT,
+                 node_limit: Optional[int] = settings.SEARCH_NODE_LIMIT,
+                 max_depth: int = settings.SEARCH_MAX_DEPTH,
+                 table: Optional[TranspositionTable] = None,
+                 tablebase: Optional[Tablebase] = None) -> None:
+        # 时间预算，单位是毫秒，None表示不限制
+        self.time_limit = time_limit
+        # 节点预算，None表示不限制
+        self.node_limit = node_limit
+        # 迭代加深的最大深度
+        self.max_depth = max_depth
+        # 置换表，多次搜索之间共用
+        self.table = TranspositionTable() if table is None else table
+        # 残局库，没有指定就用settings.TABLEBASE_PATH里的，没有生成过就是None
+        self.tablebase = get_tablebase() if tablebase is None else tablebase
+        # 本次搜索访问过的节点数
+        self.nodes = 0
+        # 完整搜完的深度
+        self.depth = 0
+        # 最好棋步的分数
+        self.score = 0.0
+        self._deadline: Optional[float] = None
+        # 被stop()要求停下来
+        self._stopped = False
+        # 上一次正常搜索完整搜完的深度，后台搜索的结果不比它浅才直接拿来走
+        self.last_depth = 0
+        # 后台搜索的结果：局面的哈希值 -> (棋步, 深度, 分数)
+        self._ponder_results: Dict[int, Tuple[Tuple[int, ...], int, float]] = {}
+        # 刚做过后台搜索，接下来的搜索和它算同一代，置换表里的条目不会被优先替换
+        self._pondered = False
+
+    def stop(self) -> None:
+        '''让正在进行的搜索尽快停下来，可以在别的线程里调用；标记一直保留到resume()'''
+        self._stopped = True
+
+    def resume(self) -> None:
+        '''清除stop()的标记，被stop()过的搜索器要先调用这个才能再搜索
+
+        由调用的一方在它自己的锁里清除，这样在搜索开始前到达的stop()不会被搜索自己清掉。
+        '''
+        self._stopped = False
+
+    def search(self, position: Position) -> Optional[Tuple[int, ...]]:
+        '''在预算内搜索，返回最好的棋步，没有棋可走就返回None'''
+        # 搜索过程中增量维护估值，叶子节点的估值不用再扫描整个棋盘
+        position = EvaluatedPosition.from_position(position)
+        moves = position.get_valid_moves()
+        if not moves:
+            return None
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0.0
+        self._deadline = None
+        if not self._pondered:
+            self.table.new_search()
+        self._pondered = False
+        # 残局库里有这个局面就直接按残局库走，不用搜索
+        if self.tablebase is not None:
+            result = self.tablebase.best_move(position)
+            if result is not None:
+                move, value = result
+                self.score = value * TABLEBASE_WIN_SCORE
+                return move
+        # 对手走到了后台搜索过的局面，并且搜得够深，就直接走
+        hit = self._ponder_results.get(position.key)
+        if hit is not None and hit[1] >= max(self.last_depth, PONDER_MIN_DEPTH) and hit[0] in moves:
+            move, self.depth, self.score = hit
+            return move
+        if self.time_limit is not None:
+            self._deadline = time.perf_counter() + self.time_limit / 1000
+        moves = self._order(position, moves)
+        best_move = moves[0]
+        for depth in range(1, self.max_depth + 1):
+            try:
+                score, move = self._search_root(position, moves, depth)
+            except SearchTimeout:
+                break
+            best_move, self.score, self.depth = move, score, depth
+            # 上一层的最好棋步下一层先搜，剪枝效果更好
+            moves.remove(move)
+            moves.insert(0, move)
+            # 已经分出胜负了，不用再往深处搜
+            if abs(score) >= WIN_SCORE - self.max_depth:
+                break
+        self.last_depth = self.depth
+        return best_move
+
+    def ponder(self, position: Position) -> None:
+        '''对手思考的时候在后台调用，一直搜索到被stop()停下来或者搜完最大深度
+
+        先浅搜一遍，按对手每种走法对对手的好坏排出可能性；翻棋再按没翻开的棋子的分布
+        展开成翻出每种棋子的局面。然后一层一层加深，按可能性从大到小搜索这些局面，
+        结果按局面的哈希值保存。对手真的走到了其中一个局面，search()就直接用保存的结果，
+        没有猜中也能用上置换表里的条目。和search()一样，这里不会清除stop()的标记。
+        '''
+        position = EvaluatedPosition.from_position(position)
+        self._ponder_results = {}
+        self._deadline = None
+        self.nodes = 0
+        self.table.new_search()
+        self._pondered = True
+        replies = position.get_valid_moves()
+        try:
+            # 对手的走法越好，越可能被选中
+            scored = []
+            for reply in self._order(position, replies):
+                scored.append((self._move_value(position, reply, 1, -INFINITY, INFINITY, 0), reply))
+            scored.sort(key=lambda item: item[0], reverse=True)
+            candidates = []
+            for rank, (_, reply) in enumerate(scored):
+                for probability, child in self._ponder_children(position, reply):
+                    candidates.append((probability / (rank + 1), child))
+            candidates.sort(key=lambda item: item[0], reverse=True)
+            candidates = [child for _, child in candidates[:PONDER_CANDIDATES]]
+            orders = [self._order(child, child.get_valid_moves()) for child in candidates]
+            for depth in range(1, self.max_depth + 1):
+                for child, moves in zip(candidates, orders):
+                    if not moves:
+                        continue
+                    score, move = self._search_root(child, moves, depth)
+                    self._ponder_results[child.key] = (move, depth, score)
+                    moves.remove(move)
+                    moves.insert(0, move)
+        except SearchTimeout:
+            pass
+
+    def _ponder_children(self, position: EvaluatedPosition,
+                         reply: Tuple[int, ...]) -> List[Tuple[float, EvaluatedPosition]]:
+        '''对手走了reply以后可能的局面和它们的概率，翻棋按没翻开的棋子的分布展开'''
+        if len(reply) == 2:
+            position.make_move(reply)
+            child = position.copy()
+            position.unmake_move()
+            return [(1.0, child)]
+        square = reply[0]
+        groups: Dict[int, List[int]] = {}
+        for index, code in enumerate(position.squares):
+            if code & HIDDEN_BIT:
+                if code in groups:
+                    groups[code][0] += 1
+                else:
+                    groups[code] = [1, index]
+        total = sum(count for count, _ in groups.values())
+        children = []
+        for count, index in groups.values():
+            position.swap(square, index)
+            position.make_move((square,))
+            children.append((count / total, position.copy()))
+            position.unmake_move()
+            position.swap(square, index)
+        return children
+
+    def _check_budget(self) -> None:
+        '''预算用完了或者被要求停下来就抛出SearchTimeout，中断这一层的搜索'''
+        if self._stopped:
+            raise SearchTimeout
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout
+        if self._deadline is not None and self.nodes & 255 == 0 and time.perf_counter() >= self._deadline:
+            raise SearchTimeout
+
+    def _order(self, position: Position, moves: List[Tuple[int, ...]],
+               hash_move: Optional[Tuple[int, ...]] = None) -> List[Tuple[int, ...]]:
+        '''把棋步按照可能的好坏排序，置换表里记下的最好棋步排在最前面'''
+        moves = sorted(moves, key=lambda move: get_move_order_score(position, move), reverse=True)
+        if hash_move is not None and hash_move in moves:
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+        return moves
+
+    def _search_root(self, position: Position, moves: List[Tuple[int, ...]], depth: int) -> Tuple[float, Tuple[int, ...]]:
+        '''搜索根节点，返回最好的分数和棋步'''
+        alpha = -INFINITY
+        best_move = moves[0]
+        for move in moves:
+            value = self._move_value(position, move, depth, alpha, INFINITY, 0)
+            if value > alpha:
+                alpha = value
+                best_move = move
+        return alpha, best_move
+
+    def _move_value(self, position: Position, move: Tuple[int, ...], depth: int, alpha: float, beta: float, ply: int) -> float:
+        '''走这一步之后的局面对走棋一方的价值'''
+        if len(move) == 1:
+            return self._chance(position, move[0], depth, ply)
+        position.make_move(move)
+        value = -self._negamax(position, depth - 1, -beta, -alpha, ply + 1)
+        position.unmake_move()
+        return value
+
+    def _chance(self, position: Position, square: int, depth: int, ply: int) -> float:
+        '''机会节点：翻开square，按照没翻开的棋子的分布求期望'''
+        # 相同的棋子只需要算一次，按数量加权
+        groups: Dict[int, List[int]] = {}
+        for index, code in enumerate(position.squares):
+            if code & HIDDEN_BIT:
+                if code in groups:
+                    groups[code][0] += 1
+                else:
+                    groups[code] = [1, index]
+        total = 0
+        value = 0.0
+        for count, index in groups.values():
+            # 假设翻开的格子下面就是这颗棋子
+            position.swap(square, index)
+            position.make_move((square,))
+            value += count * -self._negamax(position, depth - 1, -INFINITY, INFINITY, ply + 1)
+            position.unmake_move()
+            position.swap(square, index)
+            total += count
+        return value / total
+
+    def _negamax(self, position: Position, depth: int, alpha: float, beta: float, ply: int) -> float:
+        '''站在轮到走棋的一方的角度返回局面的价值'''
+        self.nodes += 1
+        self._check_budget()
+        # 磨棋磨到极限，平局
+        if position.not_eat >= settings.MAX_NOT_EAT:
+            return 0
+        counts = position.count_pieces()
+        mine = counts[position.side]
+        theirs = counts[position.side ^ 1]
+        if mine == 0 or theirs == 0:
+            if mine == theirs:
+                return 0
+            # 越早赢越好，越晚输越好
+            return WIN_SCORE - ply if mine else ply - WIN_SCORE
+        # 棋子全部翻开并且剩下的不多，残局库里能直接查到结果
+        if self.tablebase is not None and mine + theirs <= self.tablebase.max_pieces:
+            value = self.tablebase.probe(position)
+            if value is not None:
+                return value * (TABLEBASE_WIN_SCORE - ply)
+        if depth <= 0:
+            return position.evaluate(position.side)
+        # 查置换表
+        hash_move = None
+        entry = self.table.probe(position.key)
+        if entry is not None:
+            entry_depth, flag, value, move_code = entry
+            hash_move = decode_move(move_code)
+            if entry_depth >= depth:
+                value = _from_table(value, ply)
+                if flag == EXACT:
+                    return value
+                if flag == LOWER and value >= beta:
+                    return value
+                if flag == UPPER and value <= alpha:
+                    return value
+        moves = position.get_valid_moves()
+        if not moves:
+            return position.evaluate(position.side)
+        original_alpha = alpha
+        best = -INFINITY
+        best_move = moves[0]
+        for move in self._order(position, moves, hash_move):
+            value = self._move_value(position, move, depth, alpha, beta, ply)
+            if value > best:
+                best = value
+                best_move = move
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+        if best <= original_alpha:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.store(position.key, depth, flag, _to_table(best, ply), encode_move(best_move))
+        return best
+
+
+def _to_table(value: float, ply: int) -> float:
+    '''分出胜负的分数和层数有关，存进置换表之前换算成相对于当前局面的分数'''
+    if value >= WIN_THRESHOLD:
+        return value + ply
+    if value <= -WIN_THRESHOLD:
+        return value - ply
+    return value
+
+def _from_table(value: float, ply: int) -> float:
+    '''_to_table的逆操作'''
+    if value >= WIN_THRESHOLD:
+        return value - ply
+    if value <= -WIN_THRESHOLD:
+        return value + ply
+    return value
@@ -0,0 +1,378 @@
+'''同时托管很多局人机对战的服务器：asyncio处理连接，电脑的思考交给有上限的进程池
+
+用法：python server.py --port 8765 -j 4          监听本机TCP端口
+      python server.py --unix /tmp/animal.sock    监听Unix套接字
+
+协议是一行一条命令，参数用空格隔开，每条命令回复一行：
+    NEW [strategy] [time_limit]    开一局，玩家执红，电脑用strategy（默认search），每步思考time_limit毫秒；
+                                   只有search和ismcts会用到思考时间，其余的策略不用想
+    MOVE <id> <square> [<square>]  玩家走一步：一个格子是翻棋，两个格子是走子，格子下标是行*列数+列
+    STATE <id>                     查询局面
+    CLOSE <id>                     结束这一局
+    STATS                          延迟直方图等统计，回复一行JSON
+    QUIT                           断开连接
+成功回复OK加上若干key=value，失败回复ERR加上原因。进程池满了、排队的请求太多的时候回复ERR busy，
+客户端应该稍后重试；电脑思考出错的时候回复ERR engine failed，这一局没法继续，只能CLOSE。局面的回复形如：
+    OK id=1 ai=5,3-7 turn=red not_eat=0 result=- board=??E.?... moves=0,1,4-5
+board按格子顺序每格一个字符：?没翻开，.空格，红方大写、蓝方小写（E象 L狮 T虎 P豹 W狼 D狗 C猫 M鼠）；
+ai是电脑刚走的棋步；moves是玩家现在可以走的棋步；result是-（没下完）、red、blue或者draw。
+'''
+import argparse
+import asyncio
+import json
+import multiprocessing
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from arena import STRATEGIES
+from board import Board
+from position import Position
+from search import Searcher
+from ismcts import ISMCTS
+from records import GameRecord, GameWriter
+from tables import COLS
+import settings
+
+# 棋子的字母，和settings.ANIMALS的顺序一致
+LETTERS = 'ELTPWDCM'
+# 玩家执红，电脑执蓝
+HUMAN = 'red'
+# 每步思考时间的上限，单位是毫秒，客户端要求得再多也不超过这个
+MAX_TIME_LIMIT = 5000
+
+
+class LatencyHistogram:
+    '''按2的幂分桶的延迟直方图，单位是毫秒，第i个桶是(2^(i-1), 2^i]，第0个桶是1毫秒以内'''
+    BUCKETS = 16
+
+    def __init__(self) -> None:
+        self.counts = [0] * self.BUCKETS
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        milliseconds = seconds * 1000
+        bucket = min(max(0, int(milliseconds - 1e-9)).bit_length(), self.BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.total += milliseconds
+        if milliseconds > self.max:
+            self.max = milliseconds
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def percentile(self, fraction: float) -> float:
+        '''fraction分位数所在桶的上界，单位是毫秒'''
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(float(1 << bucket), self.max)
+        return 0.0
+
+    def as_dict(self) -> Dict[str, object]:
+        count = self.count
+        return {'count': count, 'mean': self.total / count if count else 0.0, 'max': self.max,
+                'p50': self.percentile(0.5), 'p90': self.percentile(0.9), 'p99': self.percentile(0.99),
+                'buckets': {f'<={1 << bucket}ms': n for bucket, n in enumerate(self.counts) if n}}
+
+
+# 进程池里每个进程自己的搜索器，置换表留给这个进程后面的请求用
+_searcher: Optional[Searcher] = None
+_ismcts: Optional[ISMCTS] = None
+
+def _init_worker(max_depth: int) -> None:
+    global _searcher, _ismcts
+    _searcher = Searcher(time_limit=None, node_limit=None, max_depth=max_depth)
+    # 服务器本身已经是多进程了，蒙特卡洛树搜索只用当前进程，每步的时间由请求决定
+    _ismcts = ISMCTS(simulations=None, time_limit=None, workers=1)
+
+def _think(packed: int, strategy: str, time_limit: float) -> Tuple[Tuple[int, ...], float]:
+    '''在进程池里给打包的局面选一步棋，返回(棋步, 思考用的秒数)'''
+    start = time.perf_counter()
+    position = Position.unpack(packed)
+    move = None
+    if strategy == 'search':
+        _searcher.time_limit = time_limit
+        move = _searcher.search(position)
+    elif strategy == 'ismcts':
+        _ismcts.time_limit = time_limit
+        move = _ismcts.search(position)
+    if move is None:
+        board = position.to_board()
+        cells = STRATEGIES[strategy](board.get_valid_moves(), board)
+        move = tuple(cell.row*COLS + cell.col for cell in cells)
+    return move, time.perf_counter() - start
+
+
+def format_board(board: Board) -> str:
+    chars = []
+    for cell in board.iter_cells():
+        piece = cell.get_piece()
+        if not cell.visible:
+            chars.append('?')
+        elif not piece:
+            chars.append('.')
+        else:
+            letter = LETTERS[piece.index]
+            chars.append(letter if piece.color == 'red' else letter.lower())
+    return ''.join(chars)
+
+def format_move(move: Tuple[int, ...]) -> str:
+    return '-'.join(str(index) for index in move)
+
+def get_result(board: Board) -> Optional[str]:
+    '''下完了就返回red、blue或者draw，规则和arena.play_headless_game一样'''
+    if board.not_eat >= settings.MAX_NOT_EAT:
+        return 'draw'
+    if board.game_over():
+        red_num, blue_num = board.get_result()
+        if red_num == blue_num:
+            return 'draw'
+        return 'red' if red_num > blue_num else 'blue'
+    if not board.get_valid_moves():
+        return 'draw'
+    return None
+
+
+class ServerError(Exception):
+    '''回复给客户端的错误'''
+
+
+def parse_time_limit(word: str) -> float:
+    '''客户端给的思考时间，必须是正的有限数，超过MAX_TIME_LIMIT的按MAX_TIME_LIMIT算'''
+    try:
+        time_limit = float(word)
+    except ValueError:
+        raise ServerError('bad time limit') from None
+    # nan和inf会让搜索的截止时间永远到不了
+    if not math.isfinite(time_limit) or time_limit <= 0:
+        raise ServerError('bad time limit')
+    return min(time_limit, MAX_TIME_LIMIT)
+
+
+class Session:
+    '''一局人机对战'''
+    def __init__(self, session_id: int, strategy: str, time_limit: float) -> None:
+        self.id = session_id
+        self.strategy = strategy
+        # 电脑每步的思考时间，单位是毫秒
+        self.time_limit = time_limit
+        self.board = Board()
+        self.board.record = GameRecord.from_board(self.board, 'human', strategy)
+        self.result: Optional[str] = None
+
+    def get_moves(self) -> List[Tuple[int, ...]]:
+        '''玩家现在可以走的棋步'''
+        if self.result is not None or self.board.turn != HUMAN:
+            return []
+        return [tuple(cell.row*COLS + cell.col for cell in move) for move in self.board.get_valid_moves()]
+
+    def format_state(self) -> str:
+        return (f'turn={self.board.turn} not_eat={self.board.not_eat} result={self.result or "-"} '
+                f'board={format_board(self.board)} moves={",".join(map(format_move, self.get_moves()))}')
+
+
+class GameServer:
+    '''管理所有连接和对局，把电脑的思考交给进程池'''
+    def __init__(self, jobs: int, max_queue: int, max_depth: int = settings.SEARCH_MAX_DEPTH,
+                 record_path: Optional[str] = None) -> None:
+        self.jobs = jobs
+        self.max_depth = max_depth
+        self.pool = self.create_pool()
+        # 同时交给进程池的请求不超过进程数，多出来的在这里排队
+        self.slots = asyncio.Semaphore(jobs)
+        # 排队的请求超过这个数就直接回复busy
+        self.max_queue = max_queue
+        self.queued = 0
+        self.writer = GameWriter(record_path) if record_path else None
+        self.next_id = 1
+        self.sessions = 0
+        self.connections = 0
+        self.games = 0
+        self.rejected = 0
+        self.histograms = {name: LatencyHistogram() for name in ('request', 'queue', 'think', 'ai_move')}
+
+    def create_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.jobs, initializer=_init_worker, initargs=(self.max_depth,))
+
+    def check_capacity(self) -> None:
+        '''排队的请求太多就抛出ServerError，要在改动局面之前检查，被拒绝的命令可以原样重试'''
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise ServerError('busy')
+
+    async def think(self, session: Session) -> Tuple[int, ...]:
+        '''在进程池里为这一局的电脑选一步棋，进程都在忙就排队'''
+        start = time.perf_counter()
+        self.queued += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.queued -= 1
+        try:
+            started = time.perf_counter()
+            self.histograms['queue'].add(started - start)
+            loop = asyncio.get_running_loop()
+            move, elapsed = await loop.run_in_executor(
+                self.pool, _think, session.board.to_position().pack(), session.strategy, session.time_limit)
+        except BrokenProcessPool:
+            # 有进程异常退出，整个进程池都不能用了，换一个新的
+            print(f'worker process died in session {session.id}, restarting the pool', flush=True)
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = self.create_pool()
+            raise ServerError('engine failed') from None
+        except Exception as error:
+            print(f'engine error in session {session.id}: {error!r}', flush=True)
+            raise ServerError('engine failed') from None
+        finally:
+            self.slots.release()
+        self.histograms['think'].add(elapsed)
+        self.histograms['ai_move'].add(time.perf_counter() - start)
+        return move
+
+    async def play_ai(self, session: Session) -> List[Tuple[int, ...]]:
+        '''轮到电脑就一直让电脑走，直到轮到玩家或者下完，返回电脑走的棋步'''
+        moves = []
+        while session.result is None and session.board.turn != HUMAN:
+            move = await self.think(session)
+            self.apply(session, move)
+            moves.append(move)
+        return moves
+
+    def apply(self, session: Session, move: Tuple[int, ...]) -> None:
+        board = session.board
+        board.make_computer_move(tuple(board.get_cell_by_index(index) for index in move))
+        session.result = get_result(board)
+        if session.result is not None:
+            self.games += 1
+            board.record.finish(*board.get_result(), draw=session.result == 'draw')
+            if self.writer is not None:
+                self.writer.write(board.record)
+                self.writer.flush()
+
+    async def handle_command(self, words: List[str], sessions: Dict[int, Session]) -> str:
+        command = words[0].upper()
+        if command == 'NEW':
+            strategy = words[1] if len(words) > 1 else 'search'
+            if strategy not in STRATEGIES:
+                raise ServerError(f'unknown strategy {strategy}')
+            time_limit = parse_time_limit(words[2]) if len(words) > 2 else settings.SEARCH_TIME_LIMIT
+            self.check_capacity()
+            session = Session(self.next_id, strategy, time_limit)
+            self.next_id += 1
+            sessions[session.id] = session
+            self.sessions += 1
+            session.result = get_result(session.board)
+            ai_moves = await self.play_ai(session)
+            return f'OK id={session.id} ai={",".join(map(format_move, ai_moves))} {session.format_state()}'
+        if command == 'STATS':
+            return 'OK ' + json.dumps(self.stats(), separators=(',', ':'))
+        if command not in ('STATE', 'CLOSE', 'MOVE'):
+            raise ServerError(f'unknown command {command}')
+        session = sessions.get(int(words[1])) if len(words) > 1 and words[1].isdigit() else None
+        if session is None:
+            raise ServerError('no such session')
+        if command == 'STATE':
+            return f'OK id={session.id} {session.format_state()}'
+        if command == 'CLOSE':
+            del sessions[session.id]
+            self.sessions -= 1
+            return f'OK id={session.id}'
+        # MOVE
+        try:
+            move = tuple(int(word) for word in words[2:])
+        except ValueError:
+            raise ServerError('bad move') from None
+        if move not in session.get_moves():
+            raise ServerError('illegal move')
+        self.check_capacity()
+        self.apply(session, move)
+        ai_moves = await self.play_ai(session)
+        return f'OK id={session.id} ai={",".join(map(format_move, ai_moves))} {session.format_state()}'
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        '''一个连接上的命令按顺序处理，上一条回复完才读下一条，客户端发得太快自然会被TCP挡住'''
+        sessions: Dict[int, Session] = {}
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode('ascii', 'replace').split()
+                if not words:
+                    continue
+                if words[0].upper() == 'QUIT':
+                    break
+                start = time.perf_counter()
+                try:
+                    reply = await self.handle_command(words, sessions)
+                except ServerError as error:
+                    reply = f'ERR {error}'
+                except (ValueError, IndexError):
+                    reply = 'ERR bad command'
+                self.histograms['request'].add(time.perf_counter() - start)
+                writer.write(reply.encode('ascii') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            self.sessions -= len(sessions)
+            writer.close()
+
+    def stats(self) -> Dict[str, object]:
+        return {'connections': self.connections, 'sessions': self.sessions, 'games': self.games,
+                'queued': self.queued, 'rejected': self.rejected,
+                'latency': {name: histogram.as_dict() for name, histogram in self.histograms.items()}}
+
+    def close(self) -> None:
+        self.pool.shutdown(cancel_futures=True)
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def serve(host: str, port: int, unix: Optional[str], jobs: int, max_queue: int,
+                max_depth: int, record_path: Optional[str]) -> None:
+    game_server = GameServer(jobs, max_queue, max_depth, record_path)
+    if unix:
+        server = await asyncio.start_unix_server(game_server.handle_connection, unix)
+    else:
+        server = await asyncio.start_server(game_server.handle_connection, host, port)
+    addresses = ', '.join(str(sock.getsockname()) for sock in server.sockets)
+    print(f'serving on {addresses} with {jobs} worker processes', flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        game_server.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='人机对战服务器')
+    parser.add_argument('--host', default='127.0.0.1', help='监听的地址')
+    parser.add_argument('--port', type=int, default=8765, help='监听的端口')
+    parser.add_argument('--unix', default=None, help='改为监听这个Unix套接字')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='电脑思考用的进程数')
+    parser.add_argument('--max-queue', type=int, default=64, help='最多有多少个请求排队等进程，再多就回复busy')
+    parser.add_argument('--max-depth', type=int, default=settings.SEARCH_MAX_DEPTH, help='search策略的最大搜索深度')
+    parser.add_argument('--record', default=None, help='把下完的对局追加到这个棋谱文件里')
+    args = parser.parse_args(argv)
+    if args.unix and os.path.exists(args.unix):
+        os.remove(args.unix)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.jobs, args.max_queue,
+                          args.max_depth, args.record))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
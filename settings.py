@@ -5,20 +5,50 @@ ANIMALS = ['elephant','lion','tiger','leopard','wolf','dog','cat','mouse']
 # 不同动物的基础权重
 SCORES = {'elephant':8,'lion':7,'tiger':5,'leopard':4,'wolf':3,'dog':2,'cat':1,'mouse':6}
 
+# 棋盘的行数和列数，比如4行8列，或者7行9列
+ROWS = 4
+COLS = 4
+# 每一方的棋子，动物可以重复，比如ANIMALS*2就是每种动物两颗
+# 双方的棋子加起来不能超过格子数，多出来的格子开局就是空的
+PIECES = ANIMALS
+
+# 估值用的系数，可以用python tune.py通过自我对弈自动调整
+# 吃掉对方，得到对方价值的几倍
+EAT_WEIGHT = 2
+# 撞在天敌身上，失去自身价值的几倍
+BOUNCE_WEIGHT = 2
+# 和对方同归于尽，得到自身价值的几倍
+TRADE_WEIGHT = 0.25
+# 和天敌相邻，减去自身价值的几倍
+ENEMY_ADJACENT_WEIGHT = 1.5
+# 和食物相邻，加上食物价值的几倍
+FOOD_ADJACENT_WEIGHT = 0.5
+# 和一样的动物相邻，减去自身价值的几倍
+SAME_ADJACENT_WEIGHT = 0.5
+# 和能过来的天敌在对角线上，减去自身价值的几倍
+ENEMY_DIAGONAL_WEIGHT = 0.5
+# 和能过去的食物在对角线上，加上食物价值的几倍
+FOOD_DIAGONAL_WEIGHT = 1
+# 和能过去的一样的动物在对角线上，加上自身价值的几倍
+SAME_DIAGONAL_WEIGHT = 0.25
+# 走子的最好分数低于这个数就改为翻棋
+FLIP_THRESHOLD = 10
 
-# 窗口大小
-WINDOW_WIDTH = 580
-WINDOW_HEIGHT = 680
 
 # 棋盘左上角坐标
 LEFT_OF_BOARD = 50
 TOP_OF_BOARD = 50
 
+# 格子大小，格子多了就缩小一点，窗口不会太大
+CELL_SIZE = min(120, 960 // COLS, 640 // ROWS)
+
 # 棋盘大小
-BOARD_SIZE = 480
+BOARD_WIDTH = COLS * CELL_SIZE
+BOARD_HEIGHT = ROWS * CELL_SIZE
 
-# 格子大小
-CELL_SIZE = 120
+# 窗口大小，棋盘下面留出显示提示文字的地方
+WINDOW_WIDTH = BOARD_WIDTH + 2 * LEFT_OF_BOARD
+WINDOW_HEIGHT = TOP_OF_BOARD + BOARD_HEIGHT + 150
 
 
 # 颜色
@@ -33,6 +63,90 @@ YELLOW = (255, 255, 0)
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 IMAGE_DIR = os.path.join(BASE_DIR,'images')
 FONT_DIR = os.path.join(BASE_DIR,'font')
+# 缩放好的图集之类的缓存文件
+CACHE_DIR = os.path.join(BASE_DIR,'cache')
+# 棋谱文件
+RECORD_DIR = os.path.join(BASE_DIR,'games')
 
 # 帧速率
-FPS = 40
\ No newline at end of file
+FPS = 40
+
+# 启动的时候输出从开始运行到画出第一帧用了多长时间
+REPORT_STARTUP_TIME = False
+
+# 统计电脑思考的用时和缓存命中率，显示在窗口上方，退出的时候输出完整的报告，见instrumentation.py
+SHOW_STATS = False
+# 统计的时候是否同时用tracemalloc统计内存分配，会让程序明显变慢
+STATS_ALLOCATIONS = False
+
+# 把界面里下的每一局棋记到这个棋谱文件里，None表示不记录，用python records.py统计
+RECORD_PATH = os.path.join(RECORD_DIR,'games.bin')
+
+# 调好的SCORES和估值系数，用python tune.py生成，有这个文件就在启动的时候覆盖上面的默认值
+WEIGHTS_PATH = os.path.join(BASE_DIR,'weights.json')
+
+# 连续这么多步没有吃子就算平局
+MAX_NOT_EAT = 20
+
+# 电脑搜索的预算
+# 每步思考的时间，单位是毫秒，None表示不限制
+SEARCH_TIME_LIMIT = 800
+# 每步最多搜索的节点数，None表示不限制
+SEARCH_NODE_LIMIT = None
+# 迭代加深的最大深度
+SEARCH_MAX_DEPTH = 8
+# 置换表最多占用的内存，单位是字节
+TRANSPOSITION_TABLE_BYTES = 16 * 1024 * 1024
+# 轮到玩家的时候电脑也在后台搜索玩家可能的走法，猜中了就几乎不用再想
+PONDER = True
+
+# 信息集蒙特卡洛树搜索的预算
+# 每个进程每步的模拟次数，None表示不限制
+ISMCTS_SIMULATIONS = None
+# 每步的思考时间，单位是毫秒，None表示不限制
+ISMCTS_TIME_LIMIT = 800
+# 同时搜索的进程数，1表示只在当前进程里搜索
+ISMCTS_WORKERS = 1
+# UCB公式里的探索系数
+ISMCTS_EXPLORATION = 0.7
+# 每次模拟最多走多少步
+ISMCTS_ROLLOUT_LIMIT = 200
+
+# 翻棋期望得分的缓存最多保存多少条
+FLIP_CACHE_SIZE = 65536
+
+# 残局库：棋子全部翻开以后，最多几颗棋子的局面可以直接查出结果
+TABLEBASE_PIECES = 3
+# 残局库文件，用python tablebase.py生成，没有这个文件就不用残局库
+TABLEBASE_PATH = os.path.join(CACHE_DIR,'tablebase.bin')
+
+# best策略给走完之后的局面打分用哪种估值：'handwritten'是手写的get_board_score，'network'是训练好的估值网络
+EVALUATOR = 'handwritten'
+# 估值网络文件，用python value_network.py train生成，没有这个文件就还是用手写的估值
+VALUE_NETWORK_PATH = os.path.join(CACHE_DIR,'value_network.npz')
+# 网络输出的是-1到1之间的期望结果，乘上这个数以后和手写估值的分数大致相当
+VALUE_NETWORK_SCALE = 30
+
+
+# tune.py调整、可以从WEIGHTS_PATH读取的系数，除了这些和SCORES以外的设置都不能被参数文件改掉
+TUNABLE_WEIGHTS = ['EAT_WEIGHT', 'BOUNCE_WEIGHT', 'TRADE_WEIGHT',
+                   'ENEMY_ADJACENT_WEIGHT', 'FOOD_ADJACENT_WEIGHT', 'SAME_ADJACENT_WEIGHT',
+                   'ENEMY_DIAGONAL_WEIGHT', 'FOOD_DIAGONAL_WEIGHT', 'SAME_DIAGONAL_WEIGHT',
+                   'FLIP_THRESHOLD']
+
+# 读取调好的系数，只在启动的时候读一次，下棋的时候没有额外的开销
+if os.path.exists(WEIGHTS_PATH):
+    import json
+    import warnings
+    with open(WEIGHTS_PATH) as _weights_file:
+        for _name, _value in json.load(_weights_file).items():
+            if _name == 'SCORES':
+                for _animal, _score in _value.items():
+                    if _animal in SCORES:
+                        SCORES[_animal] = _score
+                    else:
+                        warnings.warn(f'{WEIGHTS_PATH}: ignoring score of unknown animal {_animal!r}')
+            elif _name in TUNABLE_WEIGHTS:
+                globals()[_name] = _value
+            else:
+                warnings.warn(f'{WEIGHTS_PATH}: ignoring {_name!r}, which is not a tunable weight')
@@ -1,8 +1,16 @@
+import atexit
 from typing import Tuple
 import random
-from copy import deepcopy
 from cell import Cell
+from search import Searcher
+from ismcts import ISMCTS
+from belief import get_best_flip
+from position import COLORS
+from tables import COLS, ORTHOGONALS, DIAGONALS, IS_ENEMY, IS_FOOD, OUTCOMES, EAT, BOUNCE, TRADE
 import settings
+from settings import (EAT_WEIGHT, BOUNCE_WEIGHT, TRADE_WEIGHT, ENEMY_ADJACENT_WEIGHT, FOOD_ADJACENT_WEIGHT,
+                      SAME_ADJACENT_WEIGHT, ENEMY_DIAGONAL_WEIGHT, FOOD_DIAGONAL_WEIGHT, SAME_DIAGONAL_WEIGHT,
+                      FLIP_THRESHOLD)
 
 
 def get_random_move(valid_moves) -> Tuple[Cell,...]:
@@ -24,37 +32,27 @@ def get_eat_move(valid_moves) -> Tuple[Cell,...]:
 def get_best_move(valid_moves,board):
     '''返回分数最高的棋步'''
     random.shuffle(valid_moves)
-    reverse_moves = []
+    computer_color = board.turn
+    reverse_moves = [move for move in valid_moves if len(move) == 1]
+    walk_moves = [move for move in valid_moves if len(move) == 2]
     best_move = None
     best_score = -100
-    for move in valid_moves:
-        
-        if len(move) == 1:
-            reverse_moves.append(move)
-        else:
-            board_copy = deepcopy(board)
-            score = 0
-            start_cell, end_cell = move
-            
-            # 先计算走这一步本身能得到多少分
-            score += get_move_score(start_cell, end_cell)
-            start_row = (start_cell.get_rect().top-settings.TOP_OF_BOARD)//settings.CELL_SIZE
-            start_col = (start_cell.get_rect().left-settings.LEFT_OF_BOARD)//settings.CELL_SIZE
-            end_row = (end_cell.get_rect().top-settings.TOP_OF_BOARD)//settings.CELL_SIZE
-            end_col = (end_cell.get_rect().left-settings.LEFT_OF_BOARD)//settings.CELL_SIZE
-            # 在棋盘副本上模拟出这步棋
-            board_copy.make_move_by_cell(
-                board_copy.get_cell_by_row_col(start_row,start_col),
-                board_copy.get_cell_by_row_col(end_row,end_col))
-            # 再计算走完了之后的整盘棋对自己来说的价值是多少
-            score += get_board_score(board_copy, board.turn) 
-            if score > best_score:
-                best_score = score
-                best_move = move
+    # 走完了之后的整盘棋对自己来说的价值是多少
+    board_scores = get_children_scores(board, walk_moves, computer_color)
+    for move, board_score in zip(walk_moves, board_scores):
+        start_cell, end_cell = move
+        # 再加上走这一步本身能得到多少分
+        score = get_move_score(start_cell, end_cell) + board_score
+        if score > best_score:
+            best_score = score
+            best_move = move
     # 返回最好的棋步
-    if best_score >= 10 or not reverse_moves:
+    if best_score >= FLIP_THRESHOLD or not reverse_moves:
         return best_move
-    return random.choice(reverse_moves)
+    # 没有好的走法就翻棋，按没翻开的棋子算出每个格子翻开的期望得分，翻最有利的那个
+    index = get_best_flip(board.to_position(), board.hidden, COLORS.index(computer_color),
+                          [cell.row*COLS + cell.col for cell, in reverse_moves])
+    return (board.get_cell_by_index(index),)
     
 def get_best_move2(valid_moves, board):
     '''根据差值的变化选出最好的棋步'''
@@ -68,30 +66,19 @@ def get_best_move2(valid_moves, board):
     best_diff = pre_computer_score - pre_player_score
     best_move = None
     for move in valid_moves:
-        board_copy = deepcopy(board)
         move_score = 0
-        if len(move) == 1:
-            cell_rect = move[0].get_rect()
-            row = (cell_rect.top - settings.TOP_OF_BOARD)//settings.CELL_SIZE
-            col = (cell_rect.left - settings.LEFT_OF_BOARD)//settings.CELL_SIZE
-            cell = board_copy.get_cell_by_row_col(row,col)
-            cell.reverse_piece()
-        else:
+        if len(move) == 2:
             start_cell, end_cell = move
             move_score = get_move_score(start_cell,end_cell)
-            start_row = (start_cell.get_rect().top-settings.TOP_OF_BOARD)//settings.CELL_SIZE
-            start_col = (start_cell.get_rect().left-settings.LEFT_OF_BOARD)//settings.CELL_SIZE
-            end_row = (end_cell.get_rect().top-settings.TOP_OF_BOARD)//settings.CELL_SIZE
-            end_col = (end_cell.get_rect().left-settings.LEFT_OF_BOARD)//settings.CELL_SIZE
-            board_copy.make_move_by_cell(
-                board_copy.get_cell_by_row_col(start_row,start_col),
-                board_copy.get_cell_by_row_col(end_row,end_col)
-            )
-        player_score, computer_score = board_copy.get_result()
+        # 在棋盘上模拟出这步棋（翻棋或者走子）
+        board.make_move(move)
+        player_score, computer_score = board.get_result()
+        after_player_score = get_board_score(board,player_color)
+        after_computer_score = get_board_score(board,computer_color)
+        # 算完了再撤销这步棋
+        board.unmake_move()
         if player_score == 0 and computer_score>0:
             return move
-        after_player_score = get_board_score(board_copy,player_color)
-        after_computer_score = get_board_score(board_copy,computer_color)
         diff = after_computer_score - after_player_score + move_score
         if diff > best_diff:
             best_diff = diff
@@ -100,86 +87,133 @@ def get_best_move2(valid_moves, board):
         return best_move
     return random.choice(valid_moves)
 
+# 搜索器在多次走棋之间共用，这样置换表里的结果可以留到下一步
+_searcher = None
+
+def get_searcher() -> Searcher:
+    '''返回共用的搜索器，第一次用的时候才创建'''
+    global _searcher
+    if _searcher is None:
+        _searcher = Searcher()
+    return _searcher
+
+def get_search_move(valid_moves, board) -> Tuple[Cell,...]:
+    '''用期望极小化极大搜索在预算内选出最好的棋步'''
+    move = get_searcher().search(board.to_position())
+    if move is None:
+        return random.choice(valid_moves)
+    return tuple(board.get_cell_by_index(index) for index in move)
+
+# 信息集蒙特卡洛树搜索的引擎，同样在多次走棋之间共用
+_ismcts = None
+
+def get_ismcts_move(valid_moves, board) -> Tuple[Cell,...]:
+    '''用信息集蒙特卡洛树搜索在预算内选出最好的棋步'''
+    global _ismcts
+    if _ismcts is None:
+        _ismcts = ISMCTS()
+        # 共用的引擎可能开了进程池，退出的时候关掉，不留下子进程
+        atexit.register(_ismcts.close)
+    move = _ismcts.search(board.to_position())
+    if move is None:
+        return random.choice(valid_moves)
+    return tuple(board.get_cell_by_index(index) for index in move)
+
 def get_move_score(start_cell, end_cell) -> int:
     '''计算这一步本身会带来多少得分'''
     start_piece = start_cell.get_piece()
     end_piece = end_cell.get_piece()
     if end_piece:
+        outcome = OUTCOMES[start_piece.index][end_piece.index]
         # 如果撞在天敌身上了，得到负分，绝对值是自身的价值
-        if end_piece.name in start_piece.enemy:
-            return - 2*start_piece.score
+        if outcome & BOUNCE:
+            return - BOUNCE_WEIGHT*start_piece.score
         # 如果吃掉了对方，得到正分，绝对值是对方的价值
-        elif end_piece.name in start_piece.food:
-            return 2*end_piece.score
-        # 如果和对方同归于尽了，得到正分，绝对值是自身价值的四分之一
-        elif end_piece.name == start_piece.name:
-            return 0.25*start_piece.score
+        elif outcome & EAT:
+            return EAT_WEIGHT*end_piece.score
+        # 如果和对方同归于尽了，得到正分，绝对值是自身价值的TRADE_WEIGHT倍（默认四分之一）
+        elif outcome & TRADE:
+            return TRADE_WEIGHT*start_piece.score
     # 其他情况都得0分
     return 0
 
 def get_environment_score(board,end_row,end_col):
     '''计算这个格子周围的八个格子能给它多少分'''
     score = 0
-    cell = board.get_cell_by_row_col(end_row,end_col)
-    piece = board.get_cell_by_row_col(end_row,end_col).get_piece()
+    index = end_row*COLS + end_col
+    cell = board.get_cell_by_index(index)
+    piece = cell.get_piece()
     if piece:
-        # 先看相邻的
-        for r, c in [(0,1),(1,0),(-1,0),(0,-1)]:
-            row = end_row + r
-            col = end_col + c
-            if row>=0 and row<=3 and col>=0 and col<=3:
-                neighbor_cell = board.get_cell_by_row_col(row,col)
-                if neighbor_cell.visible:
-                    neighbor_piece = board.get_cell_by_row_col(row,col).get_piece()
-                    if neighbor_piece and neighbor_piece.color != piece.color:
-                        # 和天敌相邻，减去自身价值的1.5倍
-                        if neighbor_piece.name in piece.enemy:
-                            #score -= 2*piece.score
-                            score -= 1.5*piece.score
-                        # 和食物相邻，加上食物价值的一半
-                        elif neighbor_piece.name in piece.food:
-                            score += neighbor_piece.score / 2
-                        # 和一样的动物相邻，减去自身价值的一半
-                        elif neighbor_piece.name == piece.name:
-                            score -= 0.5*piece.score
-        # 再看对角线
-        for r, c in [(1,1),(1,-1),(-1,1),(-1,-1)]:
-            row = end_row + r
-            col = end_col + c
-            if row>=0 and row<=3 and col>=0 and col<=3:
-                neighbor_cell = board.get_cell_by_row_col(row,col)
-                if neighbor_cell.visible:
-                    neighbor_piece = board.get_cell_by_row_col(row,col).get_piece()
-                    if neighbor_piece and neighbor_piece.color != piece.color:
-                        block1 = board.get_cell_by_row_col(end_row+r,end_col)
-                        block2 = board.get_cell_by_row_col(end_row,end_col+c)
-
-                        # 和天敌对角线，减去自身价值的一半
-                        if neighbor_piece.name in piece.enemy:
-                            # 天敌能吃到自己
-                            if block1.is_empty() or block2.is_empty() or neighbor_cell.meet_food(block1) or neighbor_cell.meet_food(block2):
-                                score -= piece.score/2
-                        # 和食物对角线，加上食物的价值
-                        elif neighbor_piece.name in piece.food:
-                            # 可以到达食物
-                            if cell.meet_food(block1) or cell.meet_food(block2) or block1.is_empty() or block2.is_empty():
-                                score += neighbor_piece.score
-                        elif neighbor_piece.name == piece.name:
-                            if cell.meet_food(block1) or cell.meet_food(block2) or block1.is_empty() or block2.is_empty():
-                                score += 0.25*piece.score
+        is_enemy = IS_ENEMY[piece.index]
+        is_food = IS_FOOD[piece.index]
+        # 先看相邻的，相邻的格子提前算好了，不用再判断边界
+        for neighbor in ORTHOGONALS[index]:
+            neighbor_cell = board.get_cell_by_index(neighbor)
+            if neighbor_cell.visible:
+                neighbor_piece = neighbor_cell.get_piece()
+                if neighbor_piece and neighbor_piece.color != piece.color:
+                    # 和天敌相邻，减去自身价值的ENEMY_ADJACENT_WEIGHT倍（默认1.5倍）
+                    if is_enemy[neighbor_piece.index]:
+                        #score -= 2*piece.score
+                        score -= ENEMY_ADJACENT_WEIGHT*piece.score
+                    # 和食物相邻，加上食物价值的FOOD_ADJACENT_WEIGHT倍（默认一半）
+                    elif is_food[neighbor_piece.index]:
+                        score += FOOD_ADJACENT_WEIGHT*neighbor_piece.score
+                    # 和一样的动物相邻，减去自身价值的SAME_ADJACENT_WEIGHT倍（默认一半）
+                    elif neighbor_piece.index == piece.index:
+                        score -= SAME_ADJACENT_WEIGHT*piece.score
+        # 再看对角线，每条对角线要经过的两个格子也提前算好了
+        for neighbor, block1_index, block2_index in DIAGONALS[index]:
+            neighbor_cell = board.get_cell_by_index(neighbor)
+            if neighbor_cell.visible:
+                neighbor_piece = neighbor_cell.get_piece()
+                if neighbor_piece and neighbor_piece.color != piece.color:
+                    block1 = board.get_cell_by_index(block1_index)
+                    block2 = board.get_cell_by_index(block2_index)
+
+                    # 和天敌对角线，减去自身价值的ENEMY_DIAGONAL_WEIGHT倍（默认一半）
+                    if is_enemy[neighbor_piece.index]:
+                        # 天敌能吃到自己
+                        if block1.is_empty() or block2.is_empty() or neighbor_cell.meet_food(block1) or neighbor_cell.meet_food(block2):
+                            score -= ENEMY_DIAGONAL_WEIGHT*piece.score
+                    # 和食物对角线，加上食物价值的FOOD_DIAGONAL_WEIGHT倍（默认1倍）
+                    elif is_food[neighbor_piece.index]:
+                        # 可以到达食物
+                        if cell.meet_food(block1) or cell.meet_food(block2) or block1.is_empty() or block2.is_empty():
+                            score += FOOD_DIAGONAL_WEIGHT*neighbor_piece.score
+                    elif neighbor_piece.index == piece.index:
+                        if cell.meet_food(block1) or cell.meet_food(block2) or block1.is_empty() or block2.is_empty():
+                            score += SAME_DIAGONAL_WEIGHT*piece.score
     return score
 
+def get_children_scores(board, moves, computer_color):
+    '''走完每一步棋之后的整盘棋对电脑方的分数
+
+    settings.EVALUATOR是'network'并且训练过估值网络的时候，所有子局面拼在一起交给网络一次算完；
+    否则在棋盘上逐个模拟，用get_board_score打分。
+    '''
+    if settings.EVALUATOR == 'network' and moves:
+        from value_network import get_value_network
+        network = get_value_network()
+        if network is not None:
+            return network.score_children(board, moves, computer_color)
+    scores = []
+    for move in moves:
+        # 在棋盘上模拟出这步棋，算完了再撤销
+        board.make_move(move)
+        scores.append(get_board_score(board, computer_color))
+        board.unmake_move()
+    return scores
+
 def get_board_score(board,computer_color):
     '''计算并返回电脑方在整个棋盘的分数'''
     score = 0
-    for row in range(4):
-        for col in range(4):
-            cell = board.get_cell_by_row_col(row,col)
-            if cell.visible:
-                piece = cell.get_piece()
-                if piece and piece.color == computer_color:
-                    score += get_environment_score(board,row,col)
-                    score += piece.score
+    for cell in board.iter_cells():
+        if cell.visible:
+            piece = cell.get_piece()
+            if piece and piece.color == computer_color:
+                score += get_environment_score(board,cell.row,cell.col)
+                score += piece.score
     return score
 
     
@@ -189,10 +223,8 @@ def get_board_score(board,computer_color):
 if __name__ == '__main__':
     from board import Board
     board = Board()
-    for row in range(4):
-        for col in range(4):
-            cell = board.get_cell_by_row_col(row,col)
-            cell.reverse_piece()
-            if cell.get_piece().color == 'red':
-                cell.set_piece()
+    for cell in board.iter_cells():
+        cell.reverse_piece()
+        if cell.get_piece() and cell.get_piece().color == 'red':
+            cell.set_piece()
     print(get_board_score(board,'red'))
\ No newline at end of file
@@ -0,0 +1,134 @@
+'''棋盘的对称：正方形的棋盘有4种旋转和4种翻转，一共8种；长方形的棋盘只有不变、左右翻转、上下翻转和旋转180度4种
+
+走法规则和估值对这些对称都不变，所以对称的局面可以共用缓存和数据：
+先用canonicalize把局面变成唯一的代表（8种变换里公开的格子编码字典序最小的那个），
+查表或者存储的时候用代表，得到的棋步再用from_canonical_move变回原来的局面。
+比较的时候没翻开的格子只看作“有棋子、没翻开”，所以信息相同的局面总是选同一种变换，
+canonical_key和Position.key一样不受没翻开的棋子怎么分布影响。
+'''
+from typing import List, Optional, Sequence, Tuple
+
+from position import Position, HIDDEN_BIT, OCCUPIED_BIT
+from tables import ROWS, COLS, SQUARES, AROUND
+
+
+def _build_symmetries() -> List[Tuple[int, ...]]:
+    '''SYMMETRIES[s][index]是index这个格子经过第s种变换以后的位置，第0种是不变'''
+    last_row = ROWS - 1
+    last_col = COLS - 1
+    transforms = [
+        lambda r, c: (r, c),
+        lambda r, c: (r, last_col - c),             # 左右翻转
+        lambda r, c: (last_row - r, c),             # 上下翻转
+        lambda r, c: (last_row - r, last_col - c),  # 旋转180度
+    ]
+    # 正方形的棋盘还可以转90度和沿对角线翻转
+    if ROWS == COLS:
+        transforms += [
+            lambda r, c: (c, r),                        # 沿主对角线翻转
+            lambda r, c: (c, last_row - r),             # 顺时针旋转90度
+            lambda r, c: (last_col - c, r),             # 逆时针旋转90度
+            lambda r, c: (last_col - c, last_row - r),  # 沿副对角线翻转
+        ]
+    symmetries = []
+    for transform in transforms:
+        squares = [transform(*divmod(index, COLS)) for index in range(SQUARES)]
+        symmetries.append(tuple(row*COLS + col for row, col in squares))
+    return symmetries
+
+SYMMETRIES: List[Tuple[int, ...]] = _build_symmetries()
+IDENTITY = 0
+# INVERSES[s]是把第s种变换变回去的那种变换
+INVERSES: List[int] = [SYMMETRIES.index(tuple(symmetry.index(index) for index in range(SQUARES)))
+                       for symmetry in SYMMETRIES]
+
+
+# PUBLIC_TABLE[编码]是这个格子公开的编码：没翻开的格子只剩HIDDEN_BIT | OCCUPIED_BIT，
+# 用bytes.translate一次换掉整个棋盘，value_network的向量化版本也用这张表
+PUBLIC_TABLE = bytes(HIDDEN_BIT | OCCUPIED_BIT if code & HIDDEN_BIT else code for code in range(256))
+
+def public_squares(squares: Sequence[int]) -> bytes:
+    '''整个棋盘公开的编码，看不到没翻开的是什么棋子'''
+    return bytes(squares).translate(PUBLIC_TABLE)
+
+def transform_squares(squares: Sequence[int], symmetry: int) -> bytearray:
+    '''把整个棋盘的格子编码做一次变换'''
+    mapping = SYMMETRIES[symmetry]
+    transformed = bytearray(SQUARES)
+    for index, code in enumerate(squares):
+        transformed[mapping[index]] = code
+    return transformed
+
+def transform_move(move: Tuple[int, ...], symmetry: int) -> Tuple[int, ...]:
+    mapping = SYMMETRIES[symmetry]
+    return tuple(mapping[index] for index in move)
+
+def canonical_symmetry(squares: Sequence[int]) -> int:
+    '''变换以后公开的格子编码字典序最小的那种变换，一样小的取编号小的'''
+    best = IDENTITY
+    best_squares = public_squares(squares)
+    public = best_squares
+    for symmetry in range(1, len(SYMMETRIES)):
+        transformed = bytes(transform_squares(public, symmetry))
+        if transformed < best_squares:
+            best = symmetry
+            best_squares = transformed
+    return best
+
+def canonicalize(position: Position) -> Tuple[Position, int]:
+    '''返回(代表局面, 变换)，代表局面就是原来的局面经过这种变换，轮到谁走和磨棋计数不变'''
+    symmetry = canonical_symmetry(position.squares)
+    if symmetry == IDENTITY:
+        return position.copy(), symmetry
+    return Position(transform_squares(position.squares, symmetry), position.side, position.not_eat), symmetry
+
+def canonical_key(position: Position) -> int:
+    '''对称的局面都相同的Zobrist键，可以用作缓存和数据集的键'''
+    return canonicalize(position)[0].key
+
+def to_canonical_move(move: Tuple[int, ...], symmetry: int) -> Tuple[int, ...]:
+    '''原来局面里的棋步变成代表局面里的棋步'''
+    return transform_move(move, symmetry)
+
+def from_canonical_move(move: Tuple[int, ...], symmetry: int) -> Tuple[int, ...]:
+    '''代表局面里的棋步变回原来局面里的棋步'''
+    return transform_move(move, INVERSES[symmetry])
+
+
+# 翻棋的期望得分只和翻的格子、它周围一圈的编码有关，对称的格子可以共用一条缓存
+
+def _ring(index: int) -> Tuple[int, ...]:
+    return tuple(square for square in AROUND[index] if square != index)
+
+def _build_flip_symmetries() -> List[Tuple[int, Tuple[Tuple[int, ...], ...]]]:
+    '''FLIP_SYMMETRIES[index]是(代表格子, 每种把index变到代表格子的变换下周围一圈编码的重排)
+
+    代表格子是index在所有变换下编号最小的位置，重排perm满足：
+    变换以后代表格子周围第i个格子的编码是原来周围第perm[i]个格子的编码。
+    '''
+    result = []
+    for index in range(SQUARES):
+        representative = min(symmetry[index] for symmetry in SYMMETRIES)
+        ring = _ring(index)
+        permutations = []
+        for symmetry, mapping in enumerate(SYMMETRIES):
+            if mapping[index] != representative:
+                continue
+            inverse = SYMMETRIES[INVERSES[symmetry]]
+            permutation = tuple(ring.index(inverse[square]) for square in _ring(representative))
+            if permutation not in permutations:
+                permutations.append(permutation)
+        result.append((representative, tuple(permutations)))
+    return result
+
+FLIP_SYMMETRIES = _build_flip_symmetries()
+
+def canonical_flip(index: int, neighborhood: Tuple[int, ...]) -> Tuple[int, Tuple[int, ...]]:
+    '''把(翻的格子, 周围一圈的编码)变成对称意义下的代表，用作belief.get_flip_value的缓存键'''
+    representative, permutations = FLIP_SYMMETRIES[index]
+    best: Optional[Tuple[int, ...]] = None
+    for permutation in permutations:
+        candidate = tuple([neighborhood[i] for i in permutation])
+        if best is None or candidate < best:
+            best = candidate
+    return representative, best
@@ -0,0 +1,372 @@
+'''残局库：棋子全部翻开、剩下的棋子不多的时候，直接查出双方都走最好的结果
+
+棋子全部翻开以后就没有运气成分了，剩下几颗棋子的局面可以全部解出来。
+磨棋计数只会在走子的时候加一、吃子的时候清零，所以同样的棋子配置下，
+局面按磨棋计数从大到小一层一层倒推就能算完，不会有循环；
+吃子以后棋子变少，结果从棋子更少的残局库里查。
+老鼠贬值只影响估值，不影响胜负，所以残局库里不区分老鼠是否贬值。
+
+生成：python tablebase.py -k 3 -j 4
+'''
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+import settings
+from position import Position, HIDDEN_BIT, BLUE_BIT, ANIMAL_MASK
+from tables import ROWS, COLS, SQUARES, OUTCOMES, TRADE, BOUNCE
+
+# 文件格式：文件头，65536个8字节的偏移量，然后是每种棋子配置的结果
+# 棋子配置的键是“走棋一方有哪些动物”和“对方有哪些动物”两个8位掩码拼起来，偏移量是0表示没有这种配置
+# 文件头里记下棋盘的行数和列数，只能用在一样大的棋盘上
+MAGIC = b'ACTB'
+VERSION = 2
+HEADER = struct.Struct('<4sIIIHH')
+OFFSETS_START = HEADER.size
+MATERIALS = 1 << 16
+DATA_START = OFFSETS_START + 8 * MATERIALS
+
+# 每个局面的结果占一个字节：第5-6位是胜负，第0-4位是磨棋计数的上限，
+# 磨棋计数不超过上限的时候是这个胜负，超过了就来不及了，是平局
+DRAW = 0
+WIN = 1
+LOSS = 2
+THRESHOLD_MASK = 0b11111
+KIND_SHIFT = 5
+
+# 走子的四个方向，顺序和tables.NEIGHBORS一致
+DIRECTIONS = [(0,1),(0,-1),(1,0),(-1,0)]
+
+# 局面下标里每颗棋子的格子占几位，4x4的棋盘是4位
+SQUARE_BITS = max((SQUARES - 1).bit_length(), 1)
+SQUARE_MASK = (1 << SQUARE_BITS) - 1
+
+
+def get_material_key(ours: Tuple[int, ...], theirs: Tuple[int, ...]) -> int:
+    '''走棋一方和对方各有哪些动物，拼成棋子配置的键；同一方不能有重复的动物'''
+    key = 0
+    for animal in ours:
+        key |= 1 << animal
+    for animal in theirs:
+        key |= 1 << (animal + 8)
+    return key
+
+def get_placement_index(squares: List[int]) -> int:
+    '''棋子按走棋一方、对方，各自按动物下标排好以后，它们所在的格子拼成局面的下标'''
+    index = 0
+    for i, square in enumerate(squares):
+        index |= square << (SQUARE_BITS * i)
+    return index
+
+
+class Tablebase:
+    '''用mmap打开的残局库，查一次是O(1)的'''
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, max_pieces, max_not_eat, rows, cols = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} tablebase file')
+        if max_not_eat != settings.MAX_NOT_EAT:
+            raise ValueError(f'{path} was generated with MAX_NOT_EAT={max_not_eat}')
+        if (rows, cols) != (ROWS, COLS):
+            raise ValueError(f'{path} was generated for a {rows}x{cols} board')
+        # 最多有几颗棋子的局面
+        self.max_pieces = max_pieces
+        # 查询的次数和查到的次数
+        self.probes = 0
+        self.hits = 0
+
+    def close(self) -> None:
+        self._map.close()
+
+    def lookup(self, key: int, index: int) -> Optional[int]:
+        '''直接按棋子配置和局面下标取出结果字节，没有这种配置返回None'''
+        offset, = struct.unpack_from('<Q', self._map, OFFSETS_START + 8 * key)
+        if not offset:
+            return None
+        return self._map[offset + index]
+
+    def probe(self, position: Position) -> Optional[int]:
+        '''走棋一方赢了返回1，平局返回0，输了返回-1；有没翻开的棋子、棋子太多或者已经结束了返回None'''
+        self.probes += 1
+        ours = []
+        theirs = []
+        side = position.side
+        for square, code in enumerate(position.squares):
+            if code:
+                if code & HIDDEN_BIT:
+                    return None
+                if (code & BLUE_BIT) >> 3 == side:
+                    ours.append((code & ANIMAL_MASK, square))
+                else:
+                    theirs.append((code & ANIMAL_MASK, square))
+        if not ours or not theirs or len(ours) + len(theirs) > self.max_pieces:
+            return None
+        ours.sort()
+        theirs.sort()
+        my_animals = [animal for animal, _ in ours]
+        their_animals = [animal for animal, _ in theirs]
+        # 一方有两颗一样的动物（见settings.PIECES），残局库里没有这种配置
+        if len(set(my_animals)) < len(my_animals) or len(set(their_animals)) < len(their_animals):
+            return None
+        entry = self.lookup(get_material_key(my_animals, their_animals),
+                            get_placement_index([square for _, square in ours + theirs]))
+        if entry is None:
+            return None
+        self.hits += 1
+        kind = entry >> KIND_SHIFT
+        if kind == DRAW or position.not_eat > entry & THRESHOLD_MASK:
+            return 0
+        return 1 if kind == WIN else -1
+
+    def best_move(self, position: Position) -> Optional[Tuple[Tuple[int, ...], int]]:
+        '''按残局库选出最好的棋步，返回(棋步, 走棋一方的结果)；局面不在残局库里返回None'''
+        if self.probe(position) is None:
+            return None
+        best = None
+        for move in position.get_valid_moves():
+            position.make_move(move)
+            value = _get_child_value(self, position)
+            position.unmake_move()
+            # 结果一样的时候优先吃子，早点把局面简化
+            capture = position.squares[move[1]] != 0
+            if best is None or (value, capture) > best[1:]:
+                best = (move, value, capture)
+        if best is None:
+            return None
+        return best[0], best[1]
+
+
+def _get_child_value(tablebase: Tablebase, position: Position) -> int:
+    '''走完一步之后的局面对刚才走棋的一方的结果'''
+    if position.not_eat >= settings.MAX_NOT_EAT:
+        return 0
+    counts = position.count_pieces()
+    mine = counts[position.side ^ 1]
+    theirs = counts[position.side]
+    if not mine or not theirs:
+        return (mine > theirs) - (mine < theirs)
+    return -tablebase.probe(position)
+
+
+_tablebase = None
+_tablebase_loaded = False
+
+def get_tablebase() -> Optional[Tablebase]:
+    '''打开settings.TABLEBASE_PATH里的残局库，没有生成过或者打不开就返回None，只打开一次'''
+    global _tablebase, _tablebase_loaded
+    if not _tablebase_loaded:
+        _tablebase_loaded = True
+        if settings.TABLEBASE_PATH and os.path.exists(settings.TABLEBASE_PATH):
+            try:
+                _tablebase = Tablebase(settings.TABLEBASE_PATH)
+            except (OSError, ValueError):
+                _tablebase = None
+    return _tablebase
+
+
+# 下面是生成残局库用的代码，需要NumPy
+
+def iter_materials(pieces: int):
+    '''正好有pieces颗棋子、双方都有棋子的所有棋子配置'''
+    animals = range(len(settings.ANIMALS))
+    for count in range(1, pieces):
+        for ours in combinations(animals, count):
+            for theirs in combinations(animals, pieces - count):
+                yield ours, theirs
+
+# 生成的时候每个进程用到的、棋子更少的残局库
+_lower: Optional[Tablebase] = None
+
+def _init_worker(path: str) -> None:
+    global _lower
+    _lower = Tablebase(path) if path else None
+
+def _load_kinds(np, ours: Tuple[int, ...], theirs: Tuple[int, ...]):
+    '''从棋子更少的残局库里取出磨棋计数是0的时候的结果：1赢，0平，-1输'''
+    if not ours or not theirs:
+        return None
+    offset, = struct.unpack_from('<Q', _lower._map, OFFSETS_START + 8 * get_material_key(ours, theirs))
+    entries = np.frombuffer(_lower._map, dtype=np.uint8, count=1 << (SQUARE_BITS * (len(ours) + len(theirs))),
+                            offset=offset)
+    return np.array([0, 1, -1, 0], dtype=np.int8)[entries >> KIND_SHIFT]
+
+def _solve(material: Tuple[Tuple[int, ...], Tuple[int, ...]]) -> Dict[int, bytes]:
+    '''解出一种棋子配置和双方交换以后的配置，返回键 -> 结果字节'''
+    import numpy as np
+
+    ours, theirs = material
+    # 走子以后轮到对方走，配置变成双方交换；两种配置的结果要一起按磨棋计数倒推
+    sides = [(ours, theirs)] if ours == theirs else [(ours, theirs), (theirs, ours)]
+    pieces = len(ours) + len(theirs)
+    size = 1 << (SQUARE_BITS * pieces)
+    indexes = np.arange(size)
+    squares = [(indexes >> (SQUARE_BITS * i)) & SQUARE_MASK for i in range(pieces)]
+    # 所有棋子都在棋盘上、在不同格子上的才是合法的局面
+    valid = np.ones(size, dtype=bool)
+    for column in squares:
+        valid &= column < SQUARES
+    for a, b in combinations(range(pieces), 2):
+        valid &= squares[a] != squares[b]
+    # 每个格子往四个方向走到哪里，出界是-1；格子数不是2的幂的时候，多出来的下标也是-1
+    targets = np.array([[(row+r)*COLS + col+c if 0 <= row+r < ROWS and 0 <= col+c < COLS else -1
+                         for r, c in DIRECTIONS]
+                        for row in range(ROWS) for col in range(COLS)]
+                       + [[-1] * len(DIRECTIONS)] * ((1 << SQUARE_BITS) - SQUARES))
+
+    def pack(columns) -> 'np.ndarray':
+        index = np.zeros(size, dtype=np.int64)
+        for i, column in enumerate(columns):
+            index |= column << (SQUARE_BITS * i)
+        return index
+
+    quiet: Dict[int, List[np.ndarray]] = {}
+    captures: Dict[int, np.ndarray] = {}
+    for side, (my_animals, their_animals) in enumerate(sides):
+        mine = squares[:len(my_animals)]
+        others = squares[len(my_animals):]
+        # 走子的局面下标，没有这一步的地方指向最后一个哨兵位置
+        successors = []
+        best_capture = np.full(size, -2, dtype=np.int8)
+        for i in range(len(my_animals)):
+            for direction in range(len(DIRECTIONS)):
+                target = targets[mine[i], direction]
+                movable = valid & (target >= 0)
+                for j in range(len(my_animals)):
+                    if j != i:
+                        movable &= mine[j] != target
+                # 走不了的地方随便给一个格子，保证算出来的下标不越界，结果不会被用到
+                target = np.where(movable, target, 0)
+                empty = movable.copy()
+                for j in range(len(their_animals)):
+                    empty &= others[j] != target
+                # 走到空格子：下一层是双方交换的配置，自己的这颗棋子换了位置
+                moved = [target if m == i else mine[m] for m in range(len(my_animals))]
+                child = pack(others + moved)
+                successors.append(np.where(empty, child, size))
+                # 走到对方的棋子上
+                for j in range(len(their_animals)):
+                    hit = movable & (others[j] == target)
+                    if not hit.any():
+                        continue
+                    outcome = OUTCOMES[my_animals[i]][their_animals[j]]
+                    if outcome & TRADE:
+                        child_mine = [mine[m] for m in range(len(my_animals)) if m != i]
+                        child_others = [others[m] for m in range(len(their_animals)) if m != j]
+                        child_my_animals = my_animals[:i] + my_animals[i+1:]
+                        child_their_animals = their_animals[:j] + their_animals[j+1:]
+                    elif outcome & BOUNCE:
+                        child_mine = [mine[m] for m in range(len(my_animals)) if m != i]
+                        child_others = others
+                        child_my_animals = my_animals[:i] + my_animals[i+1:]
+                        child_their_animals = their_animals
+                    else:
+                        child_mine = moved
+                        child_others = [others[m] for m in range(len(their_animals)) if m != j]
+                        child_my_animals = my_animals
+                        child_their_animals = their_animals[:j] + their_animals[j+1:]
+                    # 吃子以后轮到对方走，磨棋计数清零
+                    kinds = _load_kinds(np, child_their_animals, child_my_animals)
+                    if kinds is None:
+                        # 有一方没有棋子了，比剩下的棋子数
+                        mine_left = len(child_my_animals)
+                        theirs_left = len(child_their_animals)
+                        value = np.int8((mine_left > theirs_left) - (mine_left < theirs_left))
+                        values = np.full(size, value, dtype=np.int8)
+                    else:
+                        values = -kinds[pack(child_others + child_mine)]
+                    best_capture = np.where(hit, np.maximum(best_capture, values), best_capture)
+        quiet[side] = successors
+        captures[side] = best_capture
+
+    # 按磨棋计数从大到小倒推，磨棋计数到了上限就是平局
+    other = {0: len(sides) - 1, 1: 0}
+    layers = {side: np.zeros(size + 1, dtype=np.int8) for side in range(len(sides))}
+    thresholds = {side: np.full(size, -1, dtype=np.int8) for side in range(len(sides))}
+    kinds = {side: np.zeros(size, dtype=np.int8) for side in range(len(sides))}
+    for not_eat in range(settings.MAX_NOT_EAT - 1, -1, -1):
+        new_layers = {}
+        for side in range(len(sides)):
+            # 哨兵位置是2，取负以后比任何结果都小
+            child_layer = layers[other[side]].copy()
+            child_layer[size] = 2
+            best = captures[side].copy()
+            for successors in quiet[side]:
+                best = np.maximum(best, -child_layer[successors])
+            # 一步都走不了按平局算
+            best[best == -2] = 0
+            best[~valid] = 0
+            # 磨棋计数越小，时间越充裕，赢的局面还是赢，输的局面还是输
+            previous = kinds[side]
+            if ((previous == 1) & (best != 1)).any() or ((previous == -1) & (best != -1)).any():
+                raise RuntimeError(f'tablebase result not monotonic in not_eat for {sides[side]}')
+            thresholds[side][(best != 0) & (previous == 0)] = not_eat
+            kinds[side] = best
+            new_layers[side] = np.append(best, np.int8(0))
+        layers = new_layers
+
+    results = {}
+    for side, (my_animals, their_animals) in enumerate(sides):
+        kind = np.where(kinds[side] == 1, WIN, np.where(kinds[side] == -1, LOSS, DRAW)).astype(np.uint8)
+        threshold = np.where(kind != DRAW, thresholds[side], 0).astype(np.uint8)
+        results[get_material_key(my_animals, their_animals)] = ((kind << KIND_SHIFT) | threshold).tobytes()
+    return results
+
+
+def generate(path: str, max_pieces: int, jobs: int, verbose: bool = True) -> None:
+    '''生成最多max_pieces颗棋子的残局库，同样棋子数的配置在jobs个进程里并行计算'''
+    if settings.MAX_NOT_EAT > THRESHOLD_MASK + 1:
+        raise ValueError('MAX_NOT_EAT is too large for the tablebase format')
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    offsets = [0] * MATERIALS
+    with open(temp_path, 'w+b') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, max_pieces, settings.MAX_NOT_EAT, ROWS, COLS))
+        f.write(bytes(8 * MATERIALS))
+        end = DATA_START
+        for pieces in range(2, max_pieces + 1):
+            start_time = time.perf_counter()
+            # 双方交换的两种配置放在一起算
+            materials = [(ours, theirs) for ours, theirs in iter_materials(pieces) if (ours, theirs) <= (theirs, ours)]
+            # 棋子更少的结果已经写进文件了，让子进程能读到
+            f.seek(OFFSETS_START)
+            f.write(struct.pack(f'<{MATERIALS}Q', *offsets))
+            f.flush()
+            with multiprocessing.Pool(jobs, initializer=_init_worker,
+                                      initargs=(temp_path if pieces > 2 else '',)) as pool:
+                # 按顺序取回结果，同样的参数生成的文件完全一样
+                for results in pool.imap(_solve, materials):
+                    for key, data in results.items():
+                        f.seek(end)
+                        f.write(data)
+                        offsets[key] = end
+                        end += len(data)
+            if verbose:
+                print(f'{pieces} pieces: {len(materials)} material pairs '
+                      f'in {time.perf_counter() - start_time:.1f} s', flush=True)
+        f.seek(OFFSETS_START)
+        f.write(struct.pack(f'<{MATERIALS}Q', *offsets))
+    os.replace(temp_path, path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='生成棋子全部翻开以后的残局库')
+    parser.add_argument('-k', '--pieces', type=int, default=settings.TABLEBASE_PIECES, help='最多几颗棋子')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='进程数')
+    parser.add_argument('-o', '--output', default=settings.TABLEBASE_PATH, help='输出文件')
+    args = parser.parse_args()
+    start_time = time.perf_counter()
+    generate(args.output, args.pieces, args.jobs)
+    print(f'wrote {args.output} ({os.path.getsize(args.output)} bytes) '
+          f'in {time.perf_counter() - start_time:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+from typing import List, Tuple
+
+from piece import Piece
+import settings
+
+# 导入的时候一次性算好的查找表，走棋、生成棋步和估值的时候直接查表，
+# 不用每次都判断边界、用字符串在集合里查找
+
+ROWS = settings.ROWS
+COLS = settings.COLS
+SQUARES = ROWS * COLS
+if 2 * len(settings.PIECES) > SQUARES:
+    raise ValueError(f'{2 * len(settings.PIECES)} pieces do not fit on a {ROWS}x{COLS} board')
+
+
+def _offsets(index: int, offsets) -> Tuple[int, ...]:
+    '''按照给定的方向顺序，返回在棋盘内的邻居格子'''
+    row, col = divmod(index, COLS)
+    return tuple((row+r)*COLS + col+c for r, c in offsets
+                 if 0 <= row+r < ROWS and 0 <= col+c < COLS)
+
+# 上下左右的邻居，顺序和Board.get_valid_moves一致
+NEIGHBORS: List[Tuple[int, ...]] = [_offsets(i, [(0,1),(0,-1),(1,0),(-1,0)]) for i in range(SQUARES)]
+# 上下左右的邻居，顺序和strategies.get_environment_score一致
+ORTHOGONALS: List[Tuple[int, ...]] = [_offsets(i, [(0,1),(1,0),(-1,0),(0,-1)]) for i in range(SQUARES)]
+# ADJACENT[a][b]表示a和b上下左右相邻
+ADJACENT: List[List[bool]] = [[b in NEIGHBORS[a] for b in range(SQUARES)] for a in range(SQUARES)]
+# 对角线邻居，以及走到对角线要经过的两个格子：(对角线格子, 同一列的格子, 同一行的格子)
+DIAGONALS: List[Tuple[Tuple[int, int, int], ...]] = []
+for _index in range(SQUARES):
+    _row, _col = divmod(_index, COLS)
+    DIAGONALS.append(tuple(
+        ((_row+r)*COLS + _col+c, (_row+r)*COLS + _col, _row*COLS + _col+c)
+        for r, c in [(1,1),(1,-1),(-1,1),(-1,-1)]
+        if 0 <= _row+r < ROWS and 0 <= _col+c < COLS))
+# 周围一圈的格子（包括自己），一个格子的环境分只和这些格子有关
+AROUND: List[Tuple[int, ...]] = [_offsets(i, [(r, c) for r in (-1, 0, 1) for c in (-1, 0, 1)])
+                                 for i in range(SQUARES)]
+
+# 动物的下标
+ANIMAL_INDEX = {name: index for index, name in enumerate(settings.ANIMALS)}
+ELEPHANT = ANIMAL_INDEX['elephant']
+MOUSE = ANIMAL_INDEX['mouse']
+
+# 动物之间的关系，规则和Piece.enemy、Piece.food一致
+# IS_ENEMY[a][b]表示b是a的天敌，IS_FOOD[a][b]表示b是a的食物
+IS_ENEMY: List[List[bool]] = [[other in Piece(name, 'red').enemy for other in settings.ANIMALS]
+                              for name in settings.ANIMALS]
+IS_FOOD: List[List[bool]] = [[other in Piece(name, 'red').food for other in settings.ANIMALS]
+                             for name in settings.ANIMALS]
+
+# 进攻方走到防守方身上的结果，可以组合
+EAT = 1        # 吃掉对方
+BOUNCE = 2     # 撞在天敌身上，自己死掉
+TRADE = 4      # 同归于尽
+DEVALUE = 8    # 有老鼠贬值：吃掉大象的老鼠、被大象撞的老鼠、大象同归于尽时所有的老鼠
+# OUTCOMES[进攻方][防守方]
+OUTCOMES: List[List[int]] = []
+for _attacker in range(len(settings.ANIMALS)):
+    _row_of_outcomes = []
+    for _defender in range(len(settings.ANIMALS)):
+        if _attacker == _defender:
+            _outcome = TRADE | (DEVALUE if _attacker == ELEPHANT else 0)
+        elif IS_FOOD[_defender][_attacker]:
+            _outcome = BOUNCE | (DEVALUE if _defender == MOUSE else 0)
+        else:
+            _outcome = EAT | (DEVALUE if _attacker == MOUSE else 0)
+        _row_of_outcomes.append(_outcome)
+    OUTCOMES.append(_row_of_outcomes)
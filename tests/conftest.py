@@ -0,0 +1,42 @@
+'''测试共用的局面生成函数，测试直接从仓库根目录导入各个模块'''
+import os
+import random
+import sys
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings
+from position import Position, encode
+
+
+def initial_position(rng: random.Random) -> Position:
+    '''洗好牌、全部没翻开的开局，谁先走也是随机的'''
+    squares = [encode(name, color, hidden=True) for color in ('red', 'blue') for name in settings.PIECES]
+    squares += [0] * (len(Position().squares) - len(squares))
+    rng.shuffle(squares)
+    return Position(bytearray(squares), rng.randrange(2))
+
+def random_positions(count: int, seed: int = 0) -> List[Position]:
+    '''从开局随便走若干步得到的局面'''
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        position = initial_position(rng)
+        for _ in range(rng.randrange(4, 30)):
+            moves = position.get_valid_moves()
+            if not moves or position.game_over():
+                break
+            position.make_move(rng.choice(moves))
+        positions.append(Position(position.squares, position.side, position.not_eat))
+    return positions
+
+def shuffle_hidden(position: Position, rng: random.Random) -> Position:
+    '''没翻开的棋子互相换位置，信息集不变'''
+    hidden = position.hidden_squares()
+    codes = [position.squares[index] for index in hidden]
+    rng.shuffle(codes)
+    squares = bytearray(position.squares)
+    for index, code in zip(hidden, codes):
+        squares[index] = code
+    return Position(squares, position.side, position.not_eat)
@@ -0,0 +1,77 @@
+'''后台思考：取消不会丢失，引擎出错不会让界面崩溃'''
+import random
+import threading
+import time
+
+from ai_worker import AIWorker
+from board import Board
+from search import Searcher
+
+
+def _wait(worker: AIWorker, board: Board, timeout: float = 10.0):
+    deadline = time.perf_counter() + timeout
+    while worker.busy and time.perf_counter() < deadline:
+        move = worker.poll(board)
+        if move is not None:
+            return move
+        time.sleep(0.001)
+    return None
+
+class _BrokenEngine:
+    def search(self, position):
+        raise ValueError('ISMCTS needs a simulation count or a time limit')
+
+def test_engine_failure_falls_back_to_a_legal_move(capsys):
+    random.seed(0)
+    board = Board()
+    worker = AIWorker(_BrokenEngine)
+    try:
+        worker.request_move(board)
+        move = _wait(worker, board)
+        assert move in board.get_valid_moves()
+        assert 'ISMCTS needs' in capsys.readouterr().err
+    finally:
+        worker.shutdown()
+
+def test_cancel_before_the_search_starts_is_not_lost():
+    started = threading.Event()
+
+    def create_engine():
+        # 引擎还没建好的时候就取消，这时候还没有stop()可以调用
+        started.set()
+        time.sleep(0.1)
+        return Searcher(time_limit=5000, node_limit=None)
+
+    random.seed(1)
+    board = Board()
+    worker = AIWorker(create_engine)
+    try:
+        cancelled = worker.request_move(board)
+        started.wait()
+        worker.cancel()
+        start = time.perf_counter()
+        assert cancelled.result() is None
+        assert time.perf_counter() - start < 1.0
+        # 之后的请求照常思考
+        worker.engine.time_limit = 50
+        worker.request_move(board)
+        assert _wait(worker, board) in board.get_valid_moves()
+    finally:
+        worker.shutdown()
+
+def test_cancel_a_running_search():
+    random.seed(2)
+    board = Board()
+    worker = AIWorker(lambda: Searcher(time_limit=5000, node_limit=None))
+    try:
+        for _ in range(5):
+            future = worker.request_move(board)
+            while not future.running() and not future.done():
+                time.sleep(0)
+            start = time.perf_counter()
+            worker.cancel()
+            if not future.cancelled():
+                future.result()
+            assert time.perf_counter() - start < 1.0
+    finally:
+        worker.shutdown()
@@ -0,0 +1,18 @@
+'''arena的命令行参数'''
+import io
+
+import pytest
+
+from arena import main, run_arena
+
+
+def test_simulations_zero_needs_time_limit(capsys):
+    with pytest.raises(SystemExit):
+        main(['ismcts', 'random', '--simulations', '0'])
+    assert '--time-limit' in capsys.readouterr().err
+
+def test_time_limit_replaces_simulations():
+    out = io.StringIO()
+    wins, draws, losses = run_arena('ismcts', 'random', 2, 1, 0, 5, None, 4, None, 0, False, out=out)
+    assert wins + draws + losses == 2
+    assert 'ismcts vs random: 2 games' in out.getvalue()
@@ -0,0 +1,36 @@
+'''批量估值和逐个局面的估值一致'''
+import numpy as np
+import pytest
+
+from batch_evaluation import (batch_evaluate, batch_side_score, batch_square_scores, encode_positions,
+                              expand_children)
+from conftest import random_positions
+from evaluation import EvaluatedPosition, evaluate, get_side_score
+
+
+def test_batch_scores_match_position_scores():
+    positions = random_positions(500)
+    codes = encode_positions(positions)
+    sides = np.array([position.side for position in positions])
+    for side in (0, 1):
+        assert batch_side_score(codes, side) == pytest.approx([get_side_score(p, side) for p in positions])
+        assert batch_evaluate(codes, side) == pytest.approx([evaluate(p, side) for p in positions])
+    # 每个局面各用自己的side
+    assert batch_evaluate(codes, sides) == pytest.approx([evaluate(p, p.side) for p in positions])
+
+def test_square_scores_match_incremental_contributions():
+    positions = random_positions(200, seed=1)
+    squares = batch_square_scores(encode_positions(positions))
+    for position, row in zip(positions, squares):
+        assert row == pytest.approx(EvaluatedPosition.from_position(position).contributions)
+
+def test_expand_children():
+    for position in random_positions(100, seed=2):
+        moves, children = expand_children(position)
+        assert moves == position.get_valid_moves()
+        for move, child in zip(moves, children):
+            expected = position.copy()
+            expected.make_move(move)
+            assert child.tobytes() == bytes(expected.squares)
+        assert batch_evaluate(children, position.side) == pytest.approx(
+            [evaluate(type(position)(child.tobytes(), position.side ^ 1), position.side) for child in children])
@@ -0,0 +1,73 @@
+'''向量化的模拟器和Position一步一步对得上，结束的判断和arena一样'''
+import numpy as np
+import pytest
+
+import settings
+from batch_games import BatchGames, POLICIES, TARGETS, ACTIONS, FLIP, play
+from position import ANIMAL_MASK, DEVALUED_BIT
+from records import UNFINISHED, RED_WIN, BLUE_WIN, DRAW
+from tables import IS_FOOD
+
+
+def _move(action: int):
+    square, kind = divmod(int(action), ACTIONS)
+    return (square,) if kind == FLIP else (square, int(TARGETS[square, kind]))
+
+def _expected_result(position) -> int:
+    '''arena.play_recorded_game的结束顺序'''
+    if position.not_eat >= settings.MAX_NOT_EAT:
+        return DRAW
+    red_num, blue_num = position.count_pieces()
+    if position.game_over():
+        return DRAW if red_num == blue_num else (RED_WIN if red_num > blue_num else BLUE_WIN)
+    if not position.get_valid_moves():
+        return DRAW
+    return UNFINISHED
+
+@pytest.mark.parametrize('policy', sorted(POLICIES))
+def test_matches_position_move_for_move(policy):
+    games = BatchGames(200, seed=1)
+    positions = [games.position(game) for game in range(games.n_games)]
+    devalued = False
+    while not games.done.all():
+        mask = games.legal_mask()
+        for game, position in enumerate(positions):
+            legal = {_move(action) for action in np.flatnonzero(mask[game])}
+            assert legal == (set() if games.done[game] else set(position.get_valid_moves()))
+        playing = np.flatnonzero(~games.done)
+        actions = np.full(games.n_games, -1)
+        actions[playing] = POLICIES[policy](games.rng, games.codes[playing], mask[playing])
+        games.step(actions)
+        for game in playing:
+            position = positions[game]
+            position.make_move(_move(actions[game]))
+            assert games.codes[game].tobytes() == bytes(position.squares)
+            assert (games.side[game], games.not_eat[game]) == (position.side, position.not_eat)
+            assert tuple(games.counts[game]) == position.count_pieces()
+            assert games.result[game] == _expected_result(position)
+        devalued = devalued or bool((games.codes & DEVALUED_BIT).any())
+    # 对局够多，大象和老鼠的特殊规则都走到了
+    assert devalued
+
+def test_eat_policy_prefers_captures():
+    games = BatchGames(500, seed=2)
+    while not games.done.all():
+        mask = games.legal_mask()
+        playing = np.flatnonzero(~games.done)
+        actions = np.full(games.n_games, -1)
+        actions[playing] = POLICIES['eat'](games.rng, games.codes[playing], mask[playing])
+        for game in playing:
+            position = games.position(game)
+            captures = [move for move in position.get_valid_moves()
+                        if len(move) == 2 and position.squares[move[1]]
+                        and IS_FOOD[position.squares[move[0]] & ANIMAL_MASK][position.squares[move[1]] & ANIMAL_MASK]]
+            if captures:
+                assert _move(actions[game]) in captures
+        games.step(actions)
+
+def test_play_collects_every_position():
+    games = BatchGames(100, seed=3)
+    history = play(games, 'eat', 'random', collect=True)
+    active = np.stack([step[3] for step in history], axis=1)
+    assert (active.sum(axis=1) == games.plies).all()
+    assert games.done.all()
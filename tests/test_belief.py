@@ -0,0 +1,43 @@
+'''翻棋的期望得分和逐个翻开、从头估值的结果一样；Board增量维护的没翻开的棋子和局面一致'''
+import random
+
+import pytest
+
+from belief import HiddenTracker, get_flip_values
+from board import Board
+from conftest import random_positions
+from evaluation import evaluate
+
+
+def _brute_force_flip_value(position, hidden: HiddenTracker, index: int, side: int) -> float:
+    before = evaluate(position, side)
+    total = len(hidden)
+    expected = 0.0
+    for code, count in hidden.counts.items():
+        child = position.copy()
+        child.squares[index] = code
+        expected += count / total * (evaluate(child, side) - before)
+    return expected
+
+def test_flip_values_match_brute_force():
+    for position in random_positions(150):
+        hidden = HiddenTracker.from_position(position)
+        for side in (0, 1):
+            values = get_flip_values(position, hidden, side)
+            assert sorted(values) == position.hidden_squares()
+            for index, value in values.items():
+                assert value == pytest.approx(_brute_force_flip_value(position, hidden, index, side))
+
+def test_board_keeps_hidden_pieces_up_to_date():
+    rng = random.Random(1)
+    for position in random_positions(50, seed=2):
+        board = Board.from_position(position)
+        for _ in range(40):
+            moves = board.get_valid_moves()
+            if not moves or board.game_over():
+                break
+            board.make_move(rng.choice(moves))
+            assert board.hidden.key() == HiddenTracker.from_position(board.to_position()).key()
+        while board._history:
+            board.unmake_move()
+            assert board.hidden.key() == HiddenTracker.from_position(board.to_position()).key()
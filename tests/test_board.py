@@ -0,0 +1,48 @@
+'''Board.make_move和unmake_move：撤销以后棋盘和走之前完全一样，走的效果和make_computer_move一样'''
+import random
+
+from board import Board
+from conftest import random_positions
+from position import Position
+from tables import COLS
+
+
+def _snapshot(board: Board):
+    return (Position.from_board(board), board.turn, board.not_eat, board.get_result(), board.hidden.key(),
+            [cell.get_piece() for cell in board.iter_cells()],
+            [cell.get_piece().score if cell.get_piece() else None for cell in board.iter_cells()])
+
+def test_unmake_restores_every_move():
+    for position in random_positions(150):
+        board = Board.from_position(position)
+        before = _snapshot(board)
+        for move in board.get_valid_moves():
+            board.make_move(move)
+            board.unmake_move()
+            assert _snapshot(board) == before
+
+def test_make_move_matches_make_computer_move():
+    for position in random_positions(150, seed=1):
+        board = Board.from_position(position)
+        for move in board.get_valid_moves():
+            board.make_move(move)
+            after = (Position.from_board(board), board.get_result(), board.hidden.key())
+            board.unmake_move()
+            other = Board.from_position(position)
+            other.make_computer_move(tuple(other.get_cell_by_index(cell.row * COLS + cell.col) for cell in move))
+            assert (Position.from_board(other), other.get_result(), other.hidden.key()) == after
+
+def test_unmake_a_whole_game():
+    rng = random.Random(2)
+    for position in random_positions(30, seed=3):
+        board = Board.from_position(position)
+        snapshots = []
+        for _ in range(40):
+            moves = board.get_valid_moves()
+            if not moves or board.game_over():
+                break
+            snapshots.append(_snapshot(board))
+            board.make_move(rng.choice(moves))
+        while snapshots:
+            board.unmake_move()
+            assert _snapshot(board) == snapshots.pop()
@@ -0,0 +1,48 @@
+'''Position上的估值和strategies.get_board_score一致，EvaluatedPosition增量维护的估值和从头算的一致'''
+import random
+
+import pytest
+
+from board import Board
+from conftest import random_positions
+from evaluation import EvaluatedPosition, evaluate, get_side_score
+from position import COLORS
+from strategies import get_board_score
+
+
+def test_side_score_matches_board_score():
+    for position in random_positions(200):
+        board = Board.from_position(position)
+        for side, color in enumerate(COLORS):
+            assert get_side_score(position, side) == pytest.approx(get_board_score(board, color))
+
+def _check(position: EvaluatedPosition) -> None:
+    for side in (0, 1):
+        assert position.evaluate(side) == pytest.approx(evaluate(position, side))
+    assert position.count_pieces() == super(EvaluatedPosition, position).count_pieces()
+
+def test_incremental_evaluation_matches_full_evaluation():
+    rng = random.Random(1)
+    for start in random_positions(100, seed=2):
+        position = EvaluatedPosition.from_position(start)
+        _check(position)
+        for _ in range(30):
+            moves = position.get_valid_moves()
+            if not moves or position.game_over():
+                break
+            # 每个子局面都走一遍再撤销，然后随便走一步
+            for move in moves:
+                position.make_move(move)
+                _check(position)
+                position.unmake_move()
+            hidden = position.hidden_squares()
+            if len(hidden) > 1:
+                position.swap(*rng.sample(hidden, 2))
+                _check(position)
+            position.make_move(rng.choice(moves))
+            _check(position)
+        while position._history:
+            position.unmake_move()
+            _check(position)
+        # swap不进撤销日志，没翻开的棋子可能换了位置，但是哈希值和估值都不变
+        assert position.key == start.key
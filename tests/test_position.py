@@ -0,0 +1,97 @@
+'''Position和Board互相转换不丢信息'''
+import random
+
+import settings
+from board import Board
+from conftest import random_positions
+from tables import COLS
+from position import (Position, encode, name_of, color_of, is_hidden, is_devalued, is_occupied,
+                      score_of, DEVALUED_SCORE)
+
+
+def test_encode_round_trip():
+    for name in settings.ANIMALS:
+        for color in ('red', 'blue'):
+            for hidden in (False, True):
+                for devalued in (False, True):
+                    code = encode(name, color, hidden, devalued)
+                    assert is_occupied(code)
+                    assert (name_of(code), color_of(code), is_hidden(code), is_devalued(code)) == \
+                           (name, color, hidden, devalued)
+                    assert score_of(code) == (DEVALUED_SCORE if devalued else settings.SCORES[name])
+
+def test_board_round_trip():
+    for position in random_positions(200):
+        board = Board.from_position(position)
+        assert Position.from_board(board) == position
+        assert board.to_position().key == position.key
+        assert board.turn == position.turn
+        assert board.get_result() == position.count_pieces()
+
+def test_new_board_round_trip():
+    random.seed(0)
+    for _ in range(20):
+        board = Board()
+        position = board.to_position()
+        assert Position.from_board(position.to_board()) == position
+        assert len(position.hidden_squares()) == 2 * len(settings.PIECES)
+
+def test_pack_round_trip():
+    for position in random_positions(200, seed=1):
+        assert Position.unpack(position.pack()) == position
+
+def test_rules_match_board():
+    '''Position的棋步生成、走棋和结束判断和Board一致'''
+    for position in random_positions(150, seed=2):
+        board = Board.from_position(position)
+        board_moves = [tuple(cell.row * COLS + cell.col for cell in move) for move in board.get_valid_moves()]
+        assert position.get_valid_moves() == board_moves
+        assert position.game_over() == board.game_over()
+        for move in position.get_valid_moves():
+            board = Board.from_position(position)
+            board.make_computer_move(tuple(board.get_cell_by_index(index) for index in move))
+            child = position.copy()
+            child.make_move(move)
+            assert child == Position.from_board(board)
+            assert child.count_pieces() == board.get_result()
+
+def test_unmake_restores_position():
+    rng = random.Random(4)
+    for position in random_positions(100, seed=5):
+        before = position.copy()
+        moves = []
+        for _ in range(30):
+            valid_moves = position.get_valid_moves()
+            if not valid_moves or position.game_over():
+                break
+            moves.append(rng.choice(valid_moves))
+            position.make_move(moves[-1])
+        for _ in moves:
+            position.unmake_move()
+        assert position == before
+        assert position.key == before.key
+
+def test_incremental_key_matches_compute_key():
+    rng = random.Random(6)
+    for position in random_positions(100, seed=7):
+        for _ in range(30):
+            moves = position.get_valid_moves()
+            if not moves or position.game_over():
+                break
+            position.make_move(rng.choice(moves))
+            assert position.key == position.compute_key()
+        hidden = position.hidden_squares()
+        if len(hidden) > 1:
+            # 搜索的机会节点交换两个没翻开的格子，哈希值不变
+            key = position.key
+            position.swap(*rng.sample(hidden, 2))
+            assert position.key == key == position.compute_key()
+        while position._history:
+            position.unmake_move()
+            assert position.key == position.compute_key()
+
+def test_key_distinguishes_side_and_not_eat():
+    for position in random_positions(50, seed=8):
+        assert Position(position.squares, position.side ^ 1, position.not_eat).key != position.key
+        if position.not_eat < settings.MAX_NOT_EAT:
+            assert Position(position.squares, position.side, position.not_eat + 1).key != position.key
@@ -0,0 +1,55 @@
+'''棋谱写进文件再读出来不变，重放能得到同样的结果'''
+import os
+
+import pytest
+
+from arena import play_recorded_game
+from records import GameWriter, GameRecord, read_records, encode_move, decode_move, DRAW
+from tables import SQUARES, NEIGHBORS
+
+
+def test_move_round_trip():
+    for index in range(SQUARES):
+        assert decode_move(encode_move((index,))) == (index,)
+        for neighbor in NEIGHBORS[index]:
+            assert decode_move(encode_move((index, neighbor))) == (index, neighbor)
+
+def test_file_round_trip_and_replay(tmp_path):
+    path = os.path.join(tmp_path, 'games.bin')
+    records = [play_recorded_game(red, blue, seed)
+               for seed, (red, blue) in enumerate([('eat', 'random'), ('random', 'eat'), ('random', 'random')] * 5)]
+    with GameWriter(path) as writer:
+        for record in records[:10]:
+            writer.write(record)
+    # 追加到已有的文件里
+    with GameWriter(path) as writer:
+        for record in records[10:]:
+            writer.write(record)
+    loaded = list(read_records(path))
+    assert [record.to_bytes() for record in loaded] == [record.to_bytes() for record in records]
+    for record in loaded:
+        # 生成器结束的时候最后一步也已经走完了
+        board = None
+        for board, _ in record.replay():
+            pass
+        if record.result != DRAW:
+            assert board.get_result() == (record.red_num, record.blue_num)
+
+def test_truncated_last_record_is_ignored(tmp_path):
+    path = os.path.join(tmp_path, 'games.bin')
+    records = [play_recorded_game('eat', 'random', seed) for seed in range(3)]
+    with GameWriter(path) as writer:
+        for record in records:
+            writer.write(record)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 1)
+    assert [record.to_bytes() for record in read_records(path)] == [record.to_bytes() for record in records[:2]]
+
+def test_foreign_file_is_rejected(tmp_path):
+    path = os.path.join(tmp_path, 'games.bin')
+    with open(path, 'wb') as f:
+        f.write(b'not a game record file')
+    with pytest.raises(ValueError):
+        GameWriter(path)
+    with pytest.raises(ValueError):
+        list(read_records(path))
@@ -0,0 +1,27 @@
+'''服务器的参数检查和延迟直方图'''
+import pytest
+
+from server import LatencyHistogram, ServerError, parse_time_limit, MAX_TIME_LIMIT
+
+
+@pytest.mark.parametrize('word', ['abc', 'nan', 'inf', '-inf', '0', '-5'])
+def test_bad_time_limit_is_rejected(word):
+    with pytest.raises(ServerError):
+        parse_time_limit(word)
+
+def test_time_limit_is_capped():
+    assert parse_time_limit('250') == 250.0
+    assert parse_time_limit(str(MAX_TIME_LIMIT * 10)) == MAX_TIME_LIMIT
+
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.as_dict()['count'] == 0
+    for milliseconds in [0.5] * 50 + [3] * 40 + [100] * 10:
+        histogram.add(milliseconds / 1000)
+    stats = histogram.as_dict()
+    assert stats['count'] == 100
+    assert stats['p50'] == 1.0
+    assert stats['p90'] == 4.0
+    assert stats['p99'] == 100.0
+    assert stats['max'] == pytest.approx(100.0)
+    assert stats['buckets'] == {'<=1ms': 50, '<=4ms': 40, '<=128ms': 10}
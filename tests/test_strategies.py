@@ -0,0 +1,27 @@
+'''共用的引擎在退出的时候释放进程池'''
+import multiprocessing
+import random
+
+import strategies
+from board import Board
+from ismcts import ISMCTS
+
+
+def test_ismcts_close_stops_the_pool():
+    engine = ISMCTS(simulations=20, time_limit=None, workers=2, seed=0)
+    random.seed(0)
+    assert engine.search(Board().to_position()) is not None
+    assert len(multiprocessing.active_children()) >= 2
+    engine.close()
+    assert engine._pool is None
+    assert not multiprocessing.active_children()
+
+def test_shared_ismcts_is_closed_at_exit(monkeypatch):
+    registered = []
+    monkeypatch.setattr(strategies.atexit, 'register', registered.append)
+    monkeypatch.setattr(strategies, '_ismcts', None)
+    monkeypatch.setattr(strategies, 'ISMCTS', lambda: ISMCTS(simulations=20, time_limit=None, workers=1, seed=0))
+    random.seed(1)
+    board = Board()
+    assert strategies.get_ismcts_move(board.get_valid_moves(), board) in board.get_valid_moves()
+    assert registered == [strategies._ismcts.close]
@@ -0,0 +1,43 @@
+'''对称变换：信息相同的局面有同一个代表，批量的和逐个的选法一致'''
+import random
+
+import numpy as np
+
+from conftest import random_positions, shuffle_hidden
+from symmetry import (SYMMETRIES, canonical_key, canonical_symmetry, canonicalize, from_canonical_move,
+                      public_squares, to_canonical_move, transform_squares)
+from value_network import canonical_codes
+
+
+def test_same_information_set_has_same_canonical_key():
+    rng = random.Random(1)
+    positions = random_positions(300)
+    for position in positions:
+        expected = canonical_key(position)
+        for _ in range(5):
+            shuffled = shuffle_hidden(position, rng)
+            assert shuffled.key == position.key
+            assert canonical_key(shuffled) == expected
+
+def test_canonical_key_is_the_same_for_every_symmetry():
+    for position in random_positions(100, seed=2):
+        expected = canonical_key(position)
+        for symmetry in range(len(SYMMETRIES)):
+            transformed = transform_squares(position.squares, symmetry)
+            assert canonical_key(type(position)(transformed, position.side, position.not_eat)) == expected
+
+def test_canonical_moves_round_trip():
+    for position in random_positions(100, seed=3):
+        canonical, symmetry = canonicalize(position)
+        moves = position.get_valid_moves()
+        assert sorted(to_canonical_move(move, symmetry) for move in moves) == sorted(canonical.get_valid_moves())
+        for move in moves:
+            assert from_canonical_move(to_canonical_move(move, symmetry), symmetry) == move
+
+def test_value_network_uses_the_same_ordering():
+    positions = random_positions(200, seed=4)
+    codes = np.array([list(position.squares) for position in positions], dtype=np.uint8)
+    batched = canonical_codes(codes)
+    for position, row in zip(positions, batched):
+        expected = public_squares(transform_squares(position.squares, canonical_symmetry(position.squares)))
+        assert row.tobytes() == expected
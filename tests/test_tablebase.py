@@ -0,0 +1,72 @@
+'''残局库查出来的结果和直接暴力搜索的一样'''
+import os
+import random
+from functools import lru_cache
+
+import pytest
+
+import settings
+from position import Position, encode
+from tables import SQUARES
+from tablebase import Tablebase, generate
+
+MAX_PIECES = 3
+
+
+@pytest.fixture(scope='module')
+def tablebase(tmp_path_factory):
+    path = os.path.join(tmp_path_factory.mktemp('tablebase'), 'tablebase.bin')
+    generate(path, MAX_PIECES, jobs=1, verbose=False)
+    tablebase = Tablebase(path)
+    yield tablebase
+    tablebase.close()
+
+@lru_cache(maxsize=None)
+def _solve(packed: int) -> int:
+    '''走棋一方双方都走最好的结果：赢1，平0，输-1，规则和arena一样'''
+    position = Position.unpack(packed)
+    if position.not_eat >= settings.MAX_NOT_EAT:
+        return 0
+    mine, theirs = position.count_pieces()[position.side], position.count_pieces()[position.side ^ 1]
+    if not mine or not theirs:
+        return (mine > theirs) - (mine < theirs)
+    moves = position.get_valid_moves()
+    if not moves:
+        return 0
+    best = -1
+    for move in moves:
+        position.make_move(move)
+        best = max(best, -_solve(position.pack()))
+        position.unmake_move()
+        if best == 1:
+            break
+    return best
+
+def _random_endgame(rng: random.Random) -> Position:
+    pieces = rng.randint(2, MAX_PIECES)
+    ours = rng.randint(1, pieces - 1)
+    animals = range(len(settings.ANIMALS))
+    codes = [encode(settings.ANIMALS[animal], 'red') for animal in rng.sample(animals, ours)]
+    codes += [encode(settings.ANIMALS[animal], 'blue') for animal in rng.sample(animals, pieces - ours)]
+    squares = bytearray(SQUARES)
+    for square, code in zip(rng.sample(range(SQUARES), pieces), codes):
+        squares[square] = code
+    return Position(squares, rng.randrange(2), rng.randrange(settings.MAX_NOT_EAT))
+
+def test_probe_matches_brute_force(tablebase):
+    rng = random.Random(0)
+    for _ in range(200):
+        position = _random_endgame(rng)
+        assert tablebase.probe(position) == _solve(position.pack()), position
+
+def test_best_move_keeps_the_result(tablebase):
+    rng = random.Random(1)
+    for _ in range(100):
+        position = _random_endgame(rng)
+        result = tablebase.best_move(position)
+        if result is None:
+            continue
+        move, value = result
+        assert value == _solve(position.pack())
+        position.make_move(move)
+        assert -_solve(position.pack()) == value
@@ -0,0 +1,102 @@
+'''查找表和原来逐个判断的写法结果一样'''
+import settings
+from board import Board
+from conftest import random_positions
+from piece import Piece
+from strategies import get_environment_score
+from tables import (ROWS, COLS, SQUARES, NEIGHBORS, ORTHOGONALS, ADJACENT, DIAGONALS, AROUND,
+                    IS_ENEMY, IS_FOOD, OUTCOMES, EAT, BOUNCE, TRADE, DEVALUE)
+
+
+def _outcome(attacker: str, defender: str) -> int:
+    '''原来Board.make_move_by_cell里按名字判断的分支'''
+    if attacker == defender:
+        return TRADE | (DEVALUE if attacker == 'elephant' else 0)
+    if attacker in Piece(defender, 'blue').food:
+        return BOUNCE | (DEVALUE if defender == 'mouse' else 0)
+    if attacker in Piece(defender, 'blue').enemy:
+        return EAT | (DEVALUE if attacker == 'mouse' else 0)
+    raise AssertionError(f'{attacker} meets {defender}')
+
+def test_outcomes_match_piece_rules():
+    for a, attacker in enumerate(settings.ANIMALS):
+        piece = Piece(attacker, 'red')
+        for d, defender in enumerate(settings.ANIMALS):
+            assert OUTCOMES[a][d] == _outcome(attacker, defender)
+            assert IS_ENEMY[a][d] == (defender in piece.enemy)
+            assert IS_FOOD[a][d] == (defender in piece.food)
+
+def _inside(row: int, col: int) -> bool:
+    return 0 <= row < ROWS and 0 <= col < COLS
+
+def test_neighbor_tables():
+    for index in range(SQUARES):
+        row, col = divmod(index, COLS)
+        # Board.get_valid_moves的方向顺序是右、左、下、上，get_environment_score是右、下、上、左
+        assert NEIGHBORS[index] == tuple(r*COLS + c for r, c in [(row, col+1), (row, col-1), (row+1, col), (row-1, col)]
+                                         if _inside(r, c))
+        assert ORTHOGONALS[index] == tuple(r*COLS + c for r, c in [(row, col+1), (row+1, col), (row-1, col), (row, col-1)]
+                                           if _inside(r, c))
+        for other in range(SQUARES):
+            other_row, other_col = divmod(other, COLS)
+            assert ADJACENT[index][other] == (abs(row - other_row) + abs(col - other_col) == 1)
+        assert sorted(AROUND[index]) == [r*COLS + c for r in range(row-1, row+2) for c in range(col-1, col+2)
+                                         if _inside(r, c)]
+        for diagonal, same_col, same_row in DIAGONALS[index]:
+            diagonal_row, diagonal_col = divmod(diagonal, COLS)
+            assert abs(diagonal_row - row) == abs(diagonal_col - col) == 1
+            assert same_col == diagonal_row * COLS + col
+            assert same_row == row * COLS + diagonal_col
+        assert len(DIAGONALS[index]) == sum(_inside(row + r, col + c) for r in (-1, 1) for c in (-1, 1))
+
+
+def _reference_environment_score(board, end_row: int, end_col: int) -> float:
+    '''原来按名字和边界判断的get_environment_score，系数换成了settings里的'''
+    def cell_at(row, col):
+        return board.get_cell_by_row_col(row, col)
+
+    def meets_food(cell, other):
+        return other.visible and other.get_piece() and other.get_piece().name in cell.get_piece().food
+
+    score = 0
+    cell = cell_at(end_row, end_col)
+    piece = cell.get_piece()
+    if not piece:
+        return score
+    for r, c in [(0,1),(1,0),(-1,0),(0,-1)]:
+        row, col = end_row + r, end_col + c
+        if _inside(row, col) and cell_at(row, col).visible:
+            other = cell_at(row, col).get_piece()
+            if other and other.color != piece.color:
+                if other.name in piece.enemy:
+                    score -= settings.ENEMY_ADJACENT_WEIGHT * piece.score
+                elif other.name in piece.food:
+                    score += settings.FOOD_ADJACENT_WEIGHT * other.score
+                elif other.name == piece.name:
+                    score -= settings.SAME_ADJACENT_WEIGHT * piece.score
+    for r, c in [(1,1),(1,-1),(-1,1),(-1,-1)]:
+        row, col = end_row + r, end_col + c
+        if _inside(row, col) and cell_at(row, col).visible:
+            neighbor = cell_at(row, col)
+            other = neighbor.get_piece()
+            if other and other.color != piece.color:
+                block1 = cell_at(end_row + r, end_col)
+                block2 = cell_at(end_row, end_col + c)
+                open_path = block1.is_empty() or block2.is_empty()
+                if other.name in piece.enemy:
+                    if open_path or meets_food(neighbor, block1) or meets_food(neighbor, block2):
+                        score -= settings.ENEMY_DIAGONAL_WEIGHT * piece.score
+                elif other.name in piece.food:
+                    if open_path or meets_food(cell, block1) or meets_food(cell, block2):
+                        score += settings.FOOD_DIAGONAL_WEIGHT * other.score
+                elif other.name == piece.name:
+                    if open_path or meets_food(cell, block1) or meets_food(cell, block2):
+                        score += settings.SAME_DIAGONAL_WEIGHT * piece.score
+    return score
+
+def test_environment_score_matches_reference():
+    for position in random_positions(300):
+        board = Board.from_position(position)
+        for cell in board.iter_cells():
+            assert get_environment_score(board, cell.row, cell.col) == \
+                   _reference_environment_score(board, cell.row, cell.col)
@@ -0,0 +1,36 @@
+'''置换表：棋步编码可逆，存进去的能查出来，大小不超过上限'''
+import random
+
+from tables import SQUARES, NEIGHBORS
+from transposition import TranspositionTable, encode_move, decode_move, EXACT, LOWER, NO_MOVE, BUCKET_BYTES
+
+
+def test_move_round_trip():
+    for index in range(SQUARES):
+        assert decode_move(encode_move((index,))) == (index,)
+        for neighbor in NEIGHBORS[index]:
+            assert decode_move(encode_move((index, neighbor))) == (index, neighbor)
+    assert decode_move(NO_MOVE) is None
+
+def test_store_and_probe():
+    table = TranspositionTable(64 * BUCKET_BYTES)
+    assert table.nbytes <= 64 * BUCKET_BYTES
+    table.store(12345, 3, EXACT, 1.5, encode_move((0, 1)))
+    assert table.probe(12345) == (3, EXACT, 1.5, encode_move((0, 1)))
+    assert table.probe(54321) is None
+    # 同一个局面没有新棋步的时候保留原来的棋步
+    table.store(12345, 4, LOWER, 2.0)
+    assert table.probe(12345) == (4, LOWER, 2.0, encode_move((0, 1)))
+    table.clear()
+    assert table.probe(12345) is None
+
+def test_deep_entries_survive_collisions():
+    table = TranspositionTable(16 * BUCKET_BYTES)
+    rng = random.Random(0)
+    buckets = table.capacity // 2
+    deep = rng.getrandbits(64)
+    table.store(deep, 10, EXACT, 1.0)
+    # 同一个桶里塞很多浅的结果，深的那个一直留在第一个条目里
+    for _ in range(50):
+        table.store((rng.getrandbits(60) * buckets) | (deep % buckets), 1, EXACT, 0.0)
+    assert table.probe(deep) == (10, EXACT, 1.0, NO_MOVE)
@@ -0,0 +1,40 @@
+'''估值网络的输入只能用看得见的信息'''
+import os
+import random
+
+import numpy as np
+import pytest
+
+from conftest import random_positions, shuffle_hidden
+from arena import play_recorded_game
+from records import GameWriter
+from value_network import encode_batch, encode_positions, main
+
+
+def test_same_information_set_encodes_identically():
+    rng = random.Random(1)
+    positions = random_positions(300)
+    assert any(len(position.hidden_squares()) > 1 for position in positions)
+    for position in positions:
+        expected = encode_positions([position])
+        for _ in range(5):
+            assert np.array_equal(encode_positions([shuffle_hidden(position, rng)]), expected)
+
+def test_encode_batch_matches_encode_positions():
+    positions = random_positions(50, seed=2)
+    codes = np.array([list(position.squares) for position in positions], dtype=np.uint8)
+    inputs = encode_batch(codes, [position.side for position in positions],
+                          [position.not_eat for position in positions])
+    assert np.array_equal(inputs, encode_positions(positions))
+
+
+def test_train_rejects_a_single_game(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        main(['train', '-n', '1', '--strategy', 'random'])
+    assert 'at least 2 games' in capsys.readouterr().err
+    path = os.path.join(tmp_path, 'games.bin')
+    with GameWriter(path) as writer:
+        writer.write(play_recorded_game('random', 'random', 0))
+    with pytest.raises(SystemExit):
+        main(['train', '--records', path, '-o', os.path.join(tmp_path, 'network.npz')])
+    assert 'at least 2 games' in capsys.readouterr().err
@@ -0,0 +1,137 @@
+from array import array
+from typing import Dict, Optional, Tuple
+
+import settings
+from tables import SQUARES
+
+# 置换表里分数的类型
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# 没有记录棋步
+NO_MOVE = -1
+# 棋步里每个格子占的位数，翻棋的终点记成SQUARES，所以要能放下SQUARES本身
+SQUARE_BITS = SQUARES.bit_length()
+SQUARE_MASK = (1 << SQUARE_BITS) - 1
+if 2 * SQUARE_BITS > 15:
+    raise ValueError('the board has too many squares for the transposition table move format')
+
+# 每个条目占用的字节数：哈希值8、分数8、深度1、类型1、棋步2、代数1
+ENTRY_BYTES = 8 + 8 + 1 + 1 + 2 + 1
+# 每个桶有两个条目：一个优先保留深度大的，一个总是覆盖
+BUCKET_BYTES = 2 * ENTRY_BYTES
+
+
+def encode_move(move: Tuple[int, ...]) -> int:
+    '''把棋步编码成一个整数，翻棋的终点记成SQUARES'''
+    return move[0] | ((move[1] if len(move) == 2 else SQUARES) << SQUARE_BITS)
+
+def decode_move(code: int) -> Optional[Tuple[int, ...]]:
+    '''encode_move的逆操作'''
+    if code == NO_MOVE:
+        return None
+    start = code & SQUARE_MASK
+    end = code >> SQUARE_BITS
+    return (start,) if end == SQUARES else (start, end)
+
+
+class TranspositionTable:
+    '''固定大小的置换表
+
+    所有数据都存在预先分配好的array里，占用的内存不会超过给定的上限。
+    每个桶两个条目：第一个条目只有在新结果搜得更深或者旧结果是之前的搜索留下的时候才替换，
+    第二个条目总是被覆盖。
+    '''
+    def __init__(self, max_bytes: int = settings.TRANSPOSITION_TABLE_BYTES) -> None:
+        # 桶的数量取不超过上限的2的幂，这样可以用位运算求下标
+        buckets = 1
+        while buckets * 2 * BUCKET_BYTES <= max_bytes:
+            buckets *= 2
+        self._mask = buckets - 1
+        size = buckets * 2
+        self._keys = array('Q', bytes(8 * size))
+        self._values = array('d', bytes(8 * size))
+        self._depths = array('b', bytes(size))
+        self._flags = array('b', bytes(size))
+        self._moves = array('h', [NO_MOVE]) * size
+        self._generations = array('B', bytes(size))
+        # 当前是第几次搜索，用来判断条目是不是过期了
+        self._generation = 1
+        # 统计数据
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def capacity(self) -> int:
+        '''最多能存多少个条目'''
+        return len(self._keys)
+
+    @property
+    def nbytes(self) -> int:
+        '''实际占用的字节数'''
+        return self.capacity * ENTRY_BYTES
+
+    def new_search(self) -> None:
+        '''开始新的一次搜索，之前的条目都变成过期的，可以优先被替换'''
+        self._generation = self._generation % 255 + 1
+
+    def clear(self) -> None:
+        '''清空整个表和统计数据'''
+        size = self.capacity
+        self._keys = array('Q', bytes(8 * size))
+        self._generations = array('B', bytes(size))
+        self._moves = array('h', [NO_MOVE]) * size
+        self.hits = self.misses = self.stores = self.evictions = 0
+
+    def probe(self, key: int) -> Optional[Tuple[int, int, float, int]]:
+        '''查找局面，找到就返回(深度, 类型, 分数, 棋步编码)，否则返回None'''
+        index = (key & self._mask) << 1
+        keys = self._keys
+        if keys[index] != key or not self._generations[index]:
+            index += 1
+            if keys[index] != key or not self._generations[index]:
+                self.misses += 1
+                return None
+        self.hits += 1
+        return self._depths[index], self._flags[index], self._values[index], self._moves[index]
+
+    def store(self, key: int, depth: int, flag: int, value: float, move: int = NO_MOVE) -> None:
+        '''保存一个局面的搜索结果'''
+        index = (key & self._mask) << 1
+        keys = self._keys
+        generations = self._generations
+        # 同一个局面已经在第二个条目里了，就直接更新它
+        if keys[index] != key and keys[index + 1] == key and generations[index + 1]:
+            index += 1
+        # 第一个条目保留深度大的结果
+        elif generations[index] and keys[index] != key \
+                and generations[index] == self._generation and self._depths[index] > depth:
+            index += 1
+        if generations[index] and keys[index] != key:
+            self.evictions += 1
+        # 同一个局面没有新棋步的时候保留原来的棋步
+        if move == NO_MOVE and keys[index] == key and generations[index]:
+            move = self._moves[index]
+        keys[index] = key
+        self._depths[index] = depth
+        self._flags[index] = flag
+        self._values[index] = value
+        self._moves[index] = move
+        generations[index] = self._generation
+        self.stores += 1
+
+    def stats(self) -> Dict[str, float]:
+        '''返回命中、未命中、写入和覆盖的次数以及命中率'''
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'capacity': self.capacity,
+            'bytes': self.nbytes,
+        }
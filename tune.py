@@ -0,0 +1,171 @@
+'''用自我对弈自动调整估值的系数（SPSA），结果写进settings.WEIGHTS_PATH，启动的时候自动读取
+
+每一轮把所有系数同时朝随机的正负方向扰动一点，得到θ+和θ-两组系数，让它们用best策略互相下几对棋
+（每对用同一个开局、交换颜色），按θ+的得分率估计梯度，再把系数往更好的方向挪一点。
+对局分给多个进程同时下。最后让调好的系数和原来的系数对战，看看有没有变强。
+
+用法：python tune.py -n 200 --pairs 8 -j 8
+      python tune.py --reset      删除调好的系数，恢复默认值
+'''
+import argparse
+import importlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import settings
+
+# 要调整的参数：SCORES里每种动物的分数，加上settings里的各个系数
+WEIGHT_NAMES = settings.TUNABLE_WEIGHTS
+PARAMETERS = [f'SCORES.{name}' for name in settings.ANIMALS] + WEIGHT_NAMES
+# 动物的分数不能低于贬值的老鼠，否则分不清谁贬值了
+MIN_SCORE = 1.0
+
+
+def get_weights() -> Dict[str, float]:
+    '''当前的参数'''
+    weights = {f'SCORES.{name}': float(score) for name, score in settings.SCORES.items()}
+    weights.update((name, float(getattr(settings, name))) for name in WEIGHT_NAMES)
+    return weights
+
+def apply_weights(weights: Dict[str, float]) -> None:
+    '''在当前进程里换一组参数
+
+    strategies和evaluation在导入的时候就把系数绑定成了自己的全局变量，这里要一起改掉；
+    翻棋期望得分的缓存和批量估值的表是按旧的系数算的，也要重新算。只在调参的时候使用。
+    '''
+    for name, value in weights.items():
+        if name.startswith('SCORES.'):
+            settings.SCORES[name[len('SCORES.'):]] = max(value, MIN_SCORE)
+        else:
+            setattr(settings, name, max(value, 0.0))
+    for module_name in ('strategies', 'evaluation'):
+        module = sys.modules.get(module_name)
+        if module is not None:
+            for name in WEIGHT_NAMES:
+                if hasattr(module, name):
+                    setattr(module, name, getattr(settings, name))
+    belief = sys.modules.get('belief')
+    if belief is not None:
+        belief.get_flip_value.cache_clear()
+    if 'batch_evaluation' in sys.modules:
+        importlib.reload(sys.modules['batch_evaluation'])
+
+def to_file_format(weights: Dict[str, float]) -> Dict[str, object]:
+    '''转成settings读取的格式：{'SCORES': {...}, 'EAT_WEIGHT': ...}'''
+    data: Dict[str, object] = {'SCORES': {name: round(weights[f'SCORES.{name}'], 3) for name in settings.ANIMALS}}
+    data.update((name, round(weights[name], 3)) for name in WEIGHT_NAMES)
+    return data
+
+def save_weights(weights: Dict[str, float], path: str = settings.WEIGHTS_PATH) -> None:
+    with open(path, 'w') as f:
+        json.dump(to_file_format(weights), f, indent=2)
+        f.write('\n')
+
+
+def _use_weights(weights: Dict[str, float], board) -> None:
+    '''轮到一方走棋之前换成它的参数，棋盘上棋子的分数也按新的SCORES改过来，贬值的老鼠除外'''
+    from position import DEVALUED_SCORE
+    apply_weights(weights)
+    for cell in board.iter_cells():
+        piece = cell.get_piece()
+        if piece and not (piece.name == 'mouse' and piece.score == DEVALUED_SCORE):
+            piece.score = settings.SCORES[piece.name]
+
+def play_game(red: Dict[str, float], blue: Dict[str, float], seed: int) -> float:
+    '''两组参数都用best策略下一局，返回红方的得分：赢1，平0.5，输0，平局规则和arena一样'''
+    from board import Board
+    from strategies import get_best_move
+    random.seed(seed)
+    board = Board()
+    weights = {'red': red, 'blue': blue}
+    while board.not_eat < settings.MAX_NOT_EAT and not board.game_over():
+        valid_moves = board.get_valid_moves()
+        if not valid_moves:
+            break
+        _use_weights(weights[board.turn], board)
+        board.make_computer_move(get_best_move(valid_moves, board))
+    red_num, blue_num = board.get_result()
+    if board.not_eat >= settings.MAX_NOT_EAT or red_num == blue_num or not board.game_over():
+        return 0.5
+    return 1.0 if red_num > blue_num else 0.0
+
+def _play_pair(task: Tuple[Dict[str, float], Dict[str, float], int]) -> float:
+    '''同一个开局交换颜色下两局，返回第一组参数的总得分'''
+    first, second, seed = task
+    return play_game(first, second, seed) + 1 - play_game(second, first, seed)
+
+
+def match(pool, first: Dict[str, float], second: Dict[str, float], pairs: int, seed: int) -> float:
+    '''两组参数下pairs对棋，返回第一组的得分率'''
+    tasks = [(first, second, seed + index) for index in range(pairs)]
+    return sum(pool.imap_unordered(_play_pair, tasks)) / (2 * pairs)
+
+def tune(iterations: int, pairs: int, jobs: int, seed: int, a: float, c: float,
+         verify_pairs: int, out=sys.stdout) -> Dict[str, float]:
+    '''SPSA调参，返回调好的参数
+
+    参数按默认值归一化以后再扰动，所以大小差得很远的参数（比如SCORES和TRADE_WEIGHT）步长是相称的。
+    '''
+    initial = get_weights()
+    names = PARAMETERS
+    scale = [abs(initial[name]) or 1.0 for name in names]
+    lower = [MIN_SCORE / s if name.startswith('SCORES.') else 0.0 for name, s in zip(names, scale)]
+    x = [1.0] * len(names)
+    rng = random.Random(seed)
+    # SPSA的标准衰减：步长a_k = a/(k+1+A)^0.602，扰动c_k = c/(k+1)^0.101
+    stability = iterations / 10
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(jobs) as pool:
+        for k in range(iterations):
+            a_k = a / (k + 1 + stability) ** 0.602
+            c_k = c / (k + 1) ** 0.101
+            delta = [rng.choice((-1, 1)) for _ in names]
+            plus = {name: (value + c_k * d) * s for name, value, d, s in zip(names, x, delta, scale)}
+            minus = {name: (value - c_k * d) * s for name, value, d, s in zip(names, x, delta, scale)}
+            score = match(pool, plus, minus, pairs, seed + k * pairs)
+            # θ+的得分率减去θ-的得分率是2*score-1
+            gradient = (2 * score - 1) / (2 * c_k)
+            x = [max(value + a_k * gradient / d, low) for value, d, low in zip(x, delta, lower)]
+            if (k + 1) % 10 == 0 or k + 1 == iterations:
+                elapsed = time.perf_counter() - start_time
+                print(f'[{k + 1}/{iterations}] last score {score:.3f}, {(k + 1) * pairs * 2 / elapsed:.1f} games/s',
+                      file=out, flush=True)
+        tuned = {name: value * s for name, value, s in zip(names, x, scale)}
+        if verify_pairs:
+            score = match(pool, tuned, initial, verify_pairs, seed + iterations * pairs)
+            games = 2 * verify_pairs
+            margin = 1.96 * math.sqrt(max(score * (1 - score), 0.05) / games)
+            print(f'tuned vs initial: score {score:.3f} (about ±{margin:.3f}) over {games} games', file=out)
+    return tuned
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='用自我对弈自动调整估值系数')
+    parser.add_argument('-n', '--iterations', type=int, default=200, help='SPSA的轮数')
+    parser.add_argument('--pairs', type=int, default=8, help='每轮下几对棋')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='进程数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('-a', type=float, default=0.1, help='SPSA的步长')
+    parser.add_argument('-c', type=float, default=0.1, help='SPSA的扰动大小，相对于参数的默认值')
+    parser.add_argument('--verify', type=int, default=100, help='调完以后和原来的参数对战几对棋，0表示不对战')
+    parser.add_argument('-o', '--output', default=settings.WEIGHTS_PATH, help='输出的参数文件')
+    parser.add_argument('--reset', action='store_true', help='删除参数文件，恢复默认值')
+    args = parser.parse_args(argv)
+    if args.reset:
+        if os.path.exists(args.output):
+            os.remove(args.output)
+        return
+    tuned = tune(args.iterations, args.pairs, args.jobs, args.seed, args.a, args.c, args.verify)
+    save_weights(tuned, args.output)
+    print(json.dumps(to_file_format(tuned)))
+    print(f'saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
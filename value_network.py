@@ -0,0 +1,385 @@
+'''用NumPy实现的小型多层感知机估值：输入局面，输出红方的期望结果，只用CPU
+
+输入是每个格子的动物（8位独热码）、颜色和是否没翻开，再加上轮到哪一方走和磨棋计数，4x4的棋盘一共162个数。
+没翻开的格子只有“没翻开”这一位是1，不会泄露下面是什么棋子。
+局面先换成symmetry里对称意义下的代表再输入，对称的局面得分一样，训练数据也相当于多了8倍。
+网络是输入 -> 64 -> 32 -> 1，隐藏层用ReLU，输出用tanh，1表示红方赢，-1表示蓝方赢。
+
+训练：python value_network.py train -n 2000 -j 4           自我对弈2000局，训练以后保存到settings.VALUE_NETWORK_PATH
+      python value_network.py train --records games.bin    用已经记录下来的棋谱训练
+      python value_network.py train -n 100000 --strategy eat   random和eat策略用batch_games向量化地自我对弈
+测速：python value_network.py bench                        和手写的估值比较每秒能给多少个局面打分
+把settings.EVALUATOR设成'network'，strategies.get_best_move就改用这个网络给走完之后的局面打分。
+'''
+import argparse
+import multiprocessing
+import os
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import settings
+from position import Position, HIDDEN_BIT, BLUE_BIT, ANIMAL_MASK
+from tables import SQUARES, COLS
+from symmetry import SYMMETRIES, INVERSES, PUBLIC_TABLE
+
+CODES = 128
+# 每个格子的特征：8种动物的独热码，蓝方，没翻开
+SQUARE_FEATURES = 10
+INPUTS = SQUARES * SQUARE_FEATURES + 2
+HIDDEN = (64, 32)
+
+
+def _build_features() -> np.ndarray:
+    '''FEATURES[编码]是这个格子的10个特征'''
+    features = np.zeros((CODES, SQUARE_FEATURES), dtype=np.float32)
+    for code in range(CODES):
+        if not code:
+            continue
+        if code & HIDDEN_BIT:
+            features[code, 9] = 1
+        else:
+            features[code, code & ANIMAL_MASK] = 1
+            features[code, 8] = 1 if code & BLUE_BIT else 0
+    return features
+
+FEATURES = _build_features()
+# codes[:, GATHER[s]]是所有局面经过第s种变换以后的格子编码
+GATHER = np.array([SYMMETRIES[inverse] for inverse in INVERSES], dtype=np.intp)
+# 没翻开的格子不分颜色，其余的格子交换颜色就是翻转BLUE_BIT
+SWAP_COLOR = np.array([code ^ BLUE_BIT if code and not code & HIDDEN_BIT else code for code in range(CODES)],
+                      dtype=np.uint8)
+# 没翻开的格子只保留“有棋子、没翻开”，选哪种变换不能取决于没翻开的棋子，否则输入就泄露了看不见的信息
+PUBLIC_CODE = np.frombuffer(PUBLIC_TABLE, dtype=np.uint8)
+
+
+def canonical_codes(codes: np.ndarray) -> np.ndarray:
+    '''每个局面换成symmetry.canonical_symmetry选出的那种变换，这里是一次处理整批局面的写法
+
+    选变换只比较公开的编码，和symmetry用同一张PUBLIC_TABLE；网络的输入里没翻开的格子也只有“没翻开”一位，
+    所以直接用公开的编码作为结果，信息相同的局面得到同一个代表。
+    '''
+    transformed = PUBLIC_CODE[codes.astype(np.uint8)][:, GATHER]
+    # 格子按大端序每8个拼成一个64位整数（不够的补0），从前往后比较整数就是比较字典序
+    padded = np.zeros(transformed.shape[:2] + (-(-SQUARES // 8) * 8,), dtype=np.uint8)
+    padded[:, :, :SQUARES] = transformed
+    words = padded.view('>u8').astype(np.uint64)
+    smallest = np.ones(transformed.shape[:2], dtype=bool)
+    for word in range(words.shape[2]):
+        values = np.where(smallest, words[:, :, word], np.iinfo(np.uint64).max)
+        smallest &= values == values.min(axis=1, keepdims=True)
+    return transformed[np.arange(len(codes)), smallest.argmax(axis=1)]
+
+
+def encode_batch(codes: np.ndarray, sides: np.ndarray, not_eats: np.ndarray) -> np.ndarray:
+    '''把(N, SQUARES)的格子编码、轮到哪一方和磨棋计数转成(N, INPUTS)的输入'''
+    codes = canonical_codes(np.asarray(codes, dtype=np.uint8).reshape(-1, SQUARES))
+    inputs = np.empty((len(codes), INPUTS), dtype=np.float32)
+    inputs[:, :-2] = FEATURES[codes].reshape(len(codes), -1)
+    inputs[:, -2] = sides
+    inputs[:, -1] = np.asarray(not_eats, dtype=np.float32) / settings.MAX_NOT_EAT
+    return inputs
+
+def encode_positions(positions: Iterable[Position]) -> np.ndarray:
+    positions = list(positions)
+    codes = np.frombuffer(b''.join(bytes(position.squares) for position in positions),
+                          dtype=np.uint8).reshape(-1, SQUARES)
+    return encode_batch(codes, [position.side for position in positions],
+                        [position.not_eat for position in positions])
+
+class ValueNetwork:
+    '''前向计算和训练都用NumPy矩阵乘法，一批局面一次算完'''
+    def __init__(self, weights: Optional[List[np.ndarray]] = None, seed: int = 0) -> None:
+        if weights is None:
+            rng = np.random.default_rng(seed)
+            sizes = (INPUTS,) + HIDDEN + (1,)
+            weights = []
+            for fan_in, fan_out in zip(sizes, sizes[1:]):
+                weights.append((rng.standard_normal((fan_in, fan_out)) * np.sqrt(2 / fan_in)).astype(np.float32))
+                weights.append(np.zeros(fan_out, dtype=np.float32))
+        # [W1, b1, W2, b2, W3, b3]
+        self.weights = weights
+
+    @classmethod
+    def load(cls, path: str) -> 'ValueNetwork':
+        with np.load(path) as data:
+            return cls([data[f'arr_{i}'] for i in range(len(data.files))])
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez(path, *self.weights)
+
+    def forward(self, inputs: np.ndarray) -> np.ndarray:
+        '''返回(N,)的红方期望结果'''
+        x = inputs
+        layers = len(self.weights) // 2
+        for layer in range(layers):
+            x = x @ self.weights[2 * layer] + self.weights[2 * layer + 1]
+            if layer < layers - 1:
+                np.maximum(x, 0, out=x)
+        return np.tanh(x[:, 0])
+
+    def score_positions(self, positions: Iterable[Position], side: int) -> np.ndarray:
+        '''站在side这一方的角度给一批局面打分，乘上settings.VALUE_NETWORK_SCALE和手写的估值大致可比'''
+        values = self.forward(encode_positions(positions)) * settings.VALUE_NETWORK_SCALE
+        return values if side == 0 else -values
+
+    def score_children(self, board, moves, color: str) -> List[float]:
+        '''走完每一步之后的局面对color这一方的分数，所有子局面拼成一个矩阵一次算完'''
+        position = board.to_position()
+        squares = []
+        sides = []
+        not_eats = []
+        for move in moves:
+            position.make_move(tuple(cell.row*COLS + cell.col for cell in move))
+            squares.append(bytes(position.squares))
+            sides.append(position.side)
+            not_eats.append(position.not_eat)
+            position.unmake_move()
+        codes = np.frombuffer(b''.join(squares), dtype=np.uint8).reshape(-1, SQUARES)
+        values = self.forward(encode_batch(codes, sides, not_eats)) * settings.VALUE_NETWORK_SCALE
+        return (values if color == 'red' else -values).tolist()
+
+    def score_board(self, board, color: str) -> float:
+        return float(self.score_positions([board.to_position()], 0 if color == 'red' else 1)[0])
+
+    def train(self, train_inputs: np.ndarray, train_targets: np.ndarray, epochs: int,
+              valid_inputs: np.ndarray, valid_targets: np.ndarray, batch_size: int = 256,
+              learning_rate: float = 1e-3, seed: int = 0, out=None) -> None:
+        '''用Adam最小化均方误差，每轮结束在留出的局面上检验'''
+        rng = np.random.default_rng(seed)
+        moments = [np.zeros_like(w) for w in self.weights]
+        velocities = [np.zeros_like(w) for w in self.weights]
+        beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+        step = 0
+        for epoch in range(epochs):
+            permutation = rng.permutation(len(train_inputs))
+            for start in range(0, len(permutation), batch_size):
+                batch = permutation[start:start + batch_size]
+                gradients = self._gradients(train_inputs[batch], train_targets[batch])
+                step += 1
+                for i, gradient in enumerate(gradients):
+                    moments[i] = beta1 * moments[i] + (1 - beta1) * gradient
+                    velocities[i] = beta2 * velocities[i] + (1 - beta2) * gradient * gradient
+                    corrected = moments[i] / (1 - beta1 ** step)
+                    self.weights[i] -= learning_rate * corrected / (np.sqrt(velocities[i] / (1 - beta2 ** step)) + epsilon)
+            if out is not None:
+                print(f'epoch {epoch + 1}: train mse {self.loss(train_inputs, train_targets):.4f}, '
+                      f'validation mse {self.loss(valid_inputs, valid_targets):.4f}, '
+                      f'validation sign accuracy {self.accuracy(valid_inputs, valid_targets):.3f}', file=out, flush=True)
+
+    def _gradients(self, inputs: np.ndarray, targets: np.ndarray) -> List[np.ndarray]:
+        '''均方误差对所有参数的梯度'''
+        activations = [inputs]
+        x = inputs
+        layers = len(self.weights) // 2
+        for layer in range(layers):
+            x = x @ self.weights[2 * layer] + self.weights[2 * layer + 1]
+            if layer < layers - 1:
+                x = np.maximum(x, 0)
+            activations.append(x)
+        output = np.tanh(x[:, 0])
+        delta = (2 * (output - targets) * (1 - output * output) / len(inputs))[:, None].astype(np.float32)
+        gradients: List[np.ndarray] = [None] * len(self.weights)
+        for layer in reversed(range(layers)):
+            gradients[2 * layer] = activations[layer].T @ delta
+            gradients[2 * layer + 1] = delta.sum(axis=0)
+            if layer:
+                delta = (delta @ self.weights[2 * layer].T) * (activations[layer] > 0)
+        return gradients
+
+    def loss(self, inputs: np.ndarray, targets: np.ndarray) -> float:
+        return float(np.mean((self.forward(inputs) - targets) ** 2)) if len(inputs) else 0.0
+
+    def accuracy(self, inputs: np.ndarray, targets: np.ndarray) -> float:
+        '''分出胜负的局面里猜对赢家的比例'''
+        decided = targets != 0
+        if not decided.any():
+            return 0.0
+        return float(np.mean(np.sign(self.forward(inputs[decided])) == targets[decided]))
+
+
+_network: Optional[ValueNetwork] = None
+_network_loaded = False
+
+def get_value_network() -> Optional[ValueNetwork]:
+    '''读取settings.VALUE_NETWORK_PATH里训练好的网络，没有训练过就返回None，只读一次'''
+    global _network, _network_loaded
+    if not _network_loaded:
+        _network_loaded = True
+        if settings.VALUE_NETWORK_PATH and os.path.exists(settings.VALUE_NETWORK_PATH):
+            try:
+                _network = ValueNetwork.load(settings.VALUE_NETWORK_PATH)
+            except (OSError, ValueError, KeyError):
+                _network = None
+            # 换了棋盘大小以后，以前训练的网络输入对不上，不能用
+            if _network is not None and _network.weights[0].shape[0] != INPUTS:
+                _network = None
+    return _network
+
+
+# 训练数据
+
+def record_samples(record) -> Tuple[List[Position], float]:
+    '''一局棋里的所有局面和红方的结果（赢1，平0，输-1）'''
+    from records import RED_WIN, BLUE_WIN
+    target = {RED_WIN: 1.0, BLUE_WIN: -1.0}.get(record.result, 0.0)
+    positions = [board.to_position() for board, _ in record.replay()]
+    return positions, target
+
+def _play_samples(task: Tuple[str, str, int]) -> Tuple[bytes, List[int], List[int], float]:
+    '''进程池里下一局自我对弈，返回编码好的局面'''
+    from arena import play_recorded_game
+    red, blue, seed = task
+    positions, target = record_samples(play_recorded_game(red, blue, seed))
+    return (b''.join(bytes(position.squares) for position in positions),
+            [position.side for position in positions], [position.not_eat for position in positions], target)
+
+def build_dataset(samples, swap: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    '''把(格子编码, 轮到谁, 磨棋计数, 结果)合成训练数据
+
+    swap为True的时候再加上交换双方颜色的局面，结果正好取反，数据加倍。
+    '''
+    inputs = []
+    targets = []
+    for squares, sides, not_eats, target in samples:
+        codes = np.frombuffer(squares, dtype=np.uint8).reshape(-1, SQUARES)
+        sides = np.asarray(sides, dtype=np.float32)
+        inputs.append(encode_batch(codes, sides, not_eats))
+        targets.append(np.full(len(codes), target, dtype=np.float32))
+        if swap:
+            inputs.append(encode_batch(SWAP_COLOR[codes], 1 - sides, not_eats))
+            targets.append(np.full(len(codes), -target, dtype=np.float32))
+    return np.concatenate(inputs), np.concatenate(targets)
+
+def batch_self_play_samples(games: int, strategy: str, seed: int):
+    '''random和eat策略用batch_games同时下所有对局，比一局一局下快十几倍'''
+    from batch_games import BatchGames, play
+    from records import RED_WIN, BLUE_WIN
+    batch = BatchGames(games, seed)
+    history = play(batch, strategy, strategy, collect=True)
+    codes = np.stack([step[0] for step in history], axis=1)
+    sides = np.stack([step[1] for step in history], axis=1)
+    not_eats = np.stack([step[2] for step in history], axis=1)
+    active = np.stack([step[3] for step in history], axis=1)
+    targets = np.where(batch.result == RED_WIN, 1.0, np.where(batch.result == BLUE_WIN, -1.0, 0.0))
+    samples = []
+    for game in range(games):
+        # 一局棋结束以后就不再有局面，前plies步就是这局的所有局面
+        plies = int(active[game].sum())
+        samples.append((codes[game, :plies].tobytes(), sides[game, :plies].tolist(),
+                        not_eats[game, :plies].tolist(), float(targets[game])))
+    return samples
+
+def self_play_samples(games: int, strategy: str, jobs: int, seed: int):
+    from batch_games import POLICIES
+    if strategy in POLICIES:
+        return batch_self_play_samples(games, strategy, seed)
+    tasks = [(strategy, strategy, seed + index) for index in range(games)]
+    with multiprocessing.Pool(jobs) as pool:
+        return pool.map(_play_samples, tasks, chunksize=8)
+
+def record_file_samples(paths: List[str]):
+    from records import read_records
+    for path in paths:
+        for record in read_records(path):
+            if record.result:
+                positions, target = record_samples(record)
+                yield (b''.join(bytes(position.squares) for position in positions),
+                       [position.side for position in positions], [position.not_eat for position in positions],
+                       target)
+
+
+def benchmark(repeat: int = 3, out=None) -> None:
+    '''比较网络和手写估值每秒能打分的局面数'''
+    from benchmark import build_corpus, load_boards
+    import strategies
+    import batch_evaluation
+    network = get_value_network() or ValueNetwork()
+    boards = load_boards(build_corpus())
+    positions = [board.to_position() for board in boards]
+    rows = []
+
+    def get_handwritten_scores(board, moves, color):
+        evaluator = settings.EVALUATOR
+        settings.EVALUATOR = 'handwritten'
+        try:
+            return strategies.get_children_scores(board, moves, color)
+        finally:
+            settings.EVALUATOR = evaluator
+
+    def measure(name: str, function, count: int) -> None:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        rows.append((name, count / best))
+
+    measure('handwritten get_board_score', lambda: [strategies.get_board_score(board, 'red') for board in boards * 20],
+            len(boards) * 20)
+    big = positions * 200
+    big_codes = batch_evaluation.encode_positions(big)
+    measure(f'handwritten batch_evaluate ({len(big)})', lambda: batch_evaluation.batch_evaluate(big_codes, 0), len(big))
+    measure('network, one position per call', lambda: [network.score_positions([position], 0) for position in positions * 20],
+            len(positions) * 20)
+    children = [(board, [move for move in board.get_valid_moves() if len(move) == 2]) for board in boards]
+    children = [(board, moves) for board, moves in children if moves]
+    count = sum(len(moves) for _, moves in children) * 20
+    measure('handwritten, children of a node per call', lambda: [get_handwritten_scores(board, moves, 'red')
+                                                                for board, moves in children * 20], count)
+    measure('network, children of a node per call', lambda: [network.score_children(board, moves, 'red')
+                                                             for board, moves in children * 20], count)
+    big_inputs = encode_positions(big)
+    measure(f'network forward only ({len(big)})', lambda: network.forward(big_inputs), len(big))
+    for name, rate in rows:
+        print(f'{name:44s} {rate:12,.0f} positions/s', file=out)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import sys
+    parser = argparse.ArgumentParser(description='训练或者测试估值网络')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help='用自我对弈或者棋谱训练')
+    train_parser.add_argument('-n', '--games', type=int, default=2000, help='自我对弈的局数')
+    train_parser.add_argument('--strategy', default='best', help='自我对弈用的策略')
+    train_parser.add_argument('--records', nargs='*', default=None, help='改用这些棋谱文件训练')
+    train_parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='自我对弈的进程数')
+    train_parser.add_argument('--epochs', type=int, default=10, help='训练几轮')
+    train_parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    train_parser.add_argument('-o', '--output', default=settings.VALUE_NETWORK_PATH, help='保存网络的文件')
+    bench_parser = subparsers.add_parser('bench', help='比较网络和手写估值的速度')
+    bench_parser.add_argument('-r', '--repeat', type=int, default=3, help='每项重复几次取最快的一次')
+    args = parser.parse_args(argv)
+    if args.command == 'bench':
+        benchmark(args.repeat, sys.stdout)
+        return
+    if not args.records and args.games < 2:
+        train_parser.error('need at least 2 games to hold out a validation game')
+    start = time.perf_counter()
+    if args.records:
+        samples = list(record_file_samples(args.records))
+        if len(samples) < 2:
+            train_parser.error(f'need at least 2 games to hold out a validation game, the records have {len(samples)}')
+    else:
+        samples = self_play_samples(args.games, args.strategy, args.jobs, args.seed)
+    # 按对局留出一部分检验，同一局的局面很相似，不能一部分训练一部分检验
+    np.random.default_rng(args.seed).shuffle(samples)
+    split = len(samples) - max(len(samples) // 10, 1)
+    train_inputs, train_targets = build_dataset(samples[:split], swap=True)
+    valid_inputs, valid_targets = build_dataset(samples[split:])
+    print(f'{len(samples)} games, {len(train_inputs)} training and {len(valid_inputs)} validation positions '
+          f'in {time.perf_counter() - start:.1f} s', flush=True)
+    network = ValueNetwork(seed=args.seed)
+    network.train(train_inputs, train_targets, args.epochs, valid_inputs, valid_targets, seed=args.seed,
+                  out=sys.stdout)
+    network.save(args.output)
+    print(f'saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()